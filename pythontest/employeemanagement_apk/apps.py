@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class EmployeemanagementApkConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'employeemanagement_apk'
+
+    def ready(self):
+        # Connect the signal receivers
+        from employeemanagement_apk import signals  # noqa: F401
@@ -0,0 +1,203 @@
+from asgiref.sync import sync_to_async
+from django.contrib import messages
+from django.http import JsonResponse
+from django.shortcuts import render
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from django.views.decorators.http import require_safe
+from rest_framework.settings import api_settings
+from rest_framework.utils.encoders import JSONEncoder
+
+from employeemanagement_apk import lookups
+from employeemanagement_apk.caching import model_label
+from employeemanagement_apk.conditional import aget_revisions, make_etag, revision_key, timestamp
+from employeemanagement_apk.expansion import expand_queryset, expanded_models
+from employeemanagement_apk.forms import EmployeeFilterForm
+from employeemanagement_apk.listing import KeysetPage, akeyset_page, apaginate_listing
+from employeemanagement_apk.models import Employee, Status, Department, Position
+from employeemanagement_apk.pagination import KeysetCursorPagination
+from employeemanagement_apk.replicas import replica_reads
+from employeemanagement_apk.search import search_employees
+from employeemanagement_apk.serializers import EmployeeSerializer, StatusSerializer, PositionSerializer, DepartmentSerializer
+from employeemanagement_apk.views import LISTING_MODELS, filter_employees
+
+'''
+
+Async views of the read-heavy pages and endpoints, for ASGI servers
+(pythontest/asgi.py). Under ASGI a sync view holds a thread of the server's
+pool for the whole request; these run on the event loop and only hand the
+queries to the ORM's database thread (aget, aiterator):
+
+    /async/employee_query           same page as /employee_query
+    /api/async/employees/           employees, keyset paginated (?after=, ?before=,
+                                    ?page_size=), ?fields= / ?expand= like the API
+    /api/async/employees/<pk>/      one employee
+    /api/async/lookups/             same response as /api/lookups/
+
+They return the same data, ETags and 304s as their sync counterparts. Name
+searches run the search index query (raw SQL) in the database thread. The
+benchmark_asgi command compares their throughput with the sync views.
+
+
+'''
+
+
+def json_response(data, status=200):
+    return JsonResponse(data, status=status, encoder=JSONEncoder)
+
+
+def not_found():
+    return json_response({'detail': 'No Employee matches the given query.'}, status=404)
+
+
+def not_modified(request, etag, last_modified=None):
+    # The 304 response when the client's copy is current, else None
+    return get_conditional_response(request, etag=etag, last_modified=timestamp(last_modified))
+
+
+def add_validators(response, etag, last_modified=None):
+    if etag is not None:
+        response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(timestamp(last_modified))
+    return response
+
+
+def _cursor(value):
+    try:
+        cursor = int(value)
+    except (TypeError, ValueError):
+        return None
+    return cursor if cursor >= 0 else None
+
+
+def _page_size(request):
+    # ?page_size= like KeysetCursorPagination, capped at its max_page_size
+    try:
+        page_size = int(request.GET['page_size'])
+    except (KeyError, ValueError):
+        return api_settings.PAGE_SIZE
+    return min(page_size, KeysetCursorPagination.max_page_size) if page_size > 0 else api_settings.PAGE_SIZE
+
+
+def _page_url(request, direction, cursor):
+    if cursor is None:
+        return None
+    params = request.GET.copy()
+    params.pop('after', None)
+    params.pop('before', None)
+    params[direction] = cursor
+    return request.build_absolute_uri(f'{request.path}?{params.urlencode()}')
+
+
+'''
+
+API Functions
+
+'''
+
+@require_safe
+@replica_reads
+async def employee_list(request):
+    related = expanded_models(EmployeeSerializer, Employee, request)
+    revisions = await aget_revisions([Employee, *related])
+    keys = [revision_key(*revision) for revision in revisions.values()]
+    updated_at = max((updated_at for _, updated_at in revisions.values() if updated_at), default=None)
+    etag = make_etag('async-list', model_label(Employee), *keys, request.get_full_path())
+    unchanged = not_modified(request, etag, updated_at)
+    if unchanged is not None:
+        return unchanged
+
+    queryset = expand_queryset(Employee.objects.all(), EmployeeSerializer, request)
+    page = await akeyset_page(
+        queryset, after=_cursor(request.GET.get('after')), before=_cursor(request.GET.get('before')), page_size=_page_size(request),
+    )
+    return add_validators(json_response({
+        'next': _page_url(request, 'after', page.next_cursor),
+        'previous': _page_url(request, 'before', page.previous_cursor),
+        'results': EmployeeSerializer(page.object_list, many=True, context={'request': request}).data,
+    }), etag, updated_at)
+
+
+@require_safe
+async def employee_detail(request, pk):
+    queryset = expand_queryset(Employee.objects.all(), EmployeeSerializer, request)
+    try:
+        employee = await queryset.aget(pk=pk)
+    except Employee.DoesNotExist:
+        return not_found()
+
+    related = expanded_models(EmployeeSerializer, Employee, request)
+    revisions = (await aget_revisions(related)).values() if related else []
+    updated_at = max([employee.updated_at, *(updated_at for _, updated_at in revisions if updated_at)])
+    etag = make_etag(
+        'async-detail', model_label(Employee), pk, updated_at.isoformat(), *(revision_key(*revision) for revision in revisions), request.get_full_path(),
+    )
+    unchanged = not_modified(request, etag, updated_at)
+    if unchanged is not None:
+        return unchanged
+    return add_validators(json_response(EmployeeSerializer(employee, context={'request': request}).data), etag, updated_at)
+
+
+@require_safe
+async def lookup_tables(request):
+    tables = await lookups.aget_tables([Status, Position, Department])
+    # Same ETag as the JSON response of /api/lookups/
+    etag = make_etag('lookups', *(version for version, _, _ in tables.values()), 'json')
+    unchanged = not_modified(request, etag)
+    if unchanged is not None:
+        return unchanged
+    return add_validators(json_response({
+        'statuses': StatusSerializer(tables[Status][1], many=True).data,
+        'positions': PositionSerializer(tables[Position][1], many=True).data,
+        'departments': DepartmentSerializer(tables[Department][1], many=True).data,
+    }), etag)
+
+
+'''
+
+Employee Query Functions
+
+'''
+
+async def page_validators(request, models):
+    # (etag, last_modified) like conditional.listing_condition, (None, None) while messages are pending
+    if len(messages.get_messages(request)):
+        return None, None
+    revisions = await aget_revisions(models)
+    parts = [revision_key(*revision) for revision in revisions.values()]
+    last_modified = max((updated_at for _, updated_at in revisions.values() if updated_at), default=None)
+    return make_etag('page', request.user.pk, request.get_full_path(), *parts), last_modified
+
+
+@sync_to_async
+def search(employees, term):
+    return KeysetPage(list(search_employees(employees, term)))
+
+
+@require_safe
+@replica_reads
+async def employee_query(request):
+    # The template and the ETag read the user, load it (and the session) before rendering
+    request.user = await request.auser()
+    etag, last_modified = await page_validators(request, LISTING_MODELS)
+    unchanged = not_modified(request, etag, last_modified)
+    if unchanged is not None:
+        return unchanged
+
+    tables = await lookups.aget_tables([Position, Department, Status])
+    form = EmployeeFilterForm(request.GET or None, tables=tables)
+    employees = filter_employees(form, Employee.objects.select_related('status', 'position', 'department'))
+    search_term = form.cleaned_data['search'] if form.is_valid() else ''
+
+    if search_term:
+        # Ranked results from the search index, best matches first
+        employees = await search(employees, search_term)
+    else:
+        employees = await apaginate_listing(request, employees, 'employee')
+
+    context = {
+        'form': form,
+        'employees': employees
+    }
+    return add_validators(render(request, 'query/employee_query.html', context), etag, last_modified)
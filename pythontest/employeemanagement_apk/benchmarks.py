@@ -0,0 +1,65 @@
+import os
+import statistics
+import tempfile
+import time
+from contextlib import contextmanager
+
+from django.db import connections, DEFAULT_DB_ALIAS
+
+'''
+
+Timing helpers of the benchmark commands (run_benchmarks, benchmark_search,
+benchmark_templates, benchmark_writes, benchmark_asgi, benchmark_hierarchy).
+
+
+'''
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def summarize(timings, elapsed=None):
+    '''
+    Latency percentiles (ms) of timings (ms), and the throughput when the total elapsed seconds are given.
+    '''
+    summary = {
+        'requests': len(timings),
+        'p50_ms': round(statistics.median(timings), 3),
+        'p95_ms': round(percentile(timings, 0.95), 3),
+        'p99_ms': round(percentile(timings, 0.99), 3),
+    }
+    if elapsed:
+        summary['per_second'] = round(len(timings) / elapsed, 1)
+    return summary
+
+
+def measure(run, arguments):
+    '''
+    Call run(argument) for each of arguments, returns summarize of the calls.
+    '''
+    timings = []
+    started = time.perf_counter()
+    for argument in arguments:
+        start = time.perf_counter()
+        run(argument)
+        timings.append((time.perf_counter() - start) * 1000)
+    return summarize(timings, time.perf_counter() - started)
+
+
+@contextmanager
+def temporary_database(using=DEFAULT_DB_ALIAS):
+    '''
+    Use a fresh database file with the schema (like the test runner) instead of the configured one, which is not touched.
+    '''
+    connection = connections[using]
+    with tempfile.TemporaryDirectory() as directory:
+        test_name = connection.settings_dict['TEST']['NAME']
+        connection.settings_dict['TEST']['NAME'] = os.path.join(directory, 'benchmark.sqlite3')
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            yield
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            connection.settings_dict['TEST']['NAME'] = test_name
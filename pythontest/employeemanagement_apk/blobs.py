@@ -0,0 +1,136 @@
+import os
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db.models import Count, F, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from employeemanagement_apk.models import Employee, ImageBlob
+from employeemanagement_apk.images import THUMBNAIL_DIR
+
+'''
+
+Reference counting and garbage collection of the stored employee images.
+
+ImageBlob.references is the number of employees whose image is the blob.
+The counts are adjusted when an image is set, replaced or deleted (see
+images.queue_processing and signals.py), recount rebuilds them from the
+Employee table. Nothing is deleted when a count drops to zero:
+collect_garbage deletes the blobs unreferenced for longer than
+IMAGE_GC_GRACE_PERIOD seconds, so an upload that found its content already
+stored cannot lose the file before its employee row references it.
+
+
+'''
+
+DEFAULT_GRACE_PERIOD = 60 * 60
+
+
+def get_grace_period():
+    return getattr(settings, 'IMAGE_GC_GRACE_PERIOD', DEFAULT_GRACE_PERIOD)
+
+
+def _image_storage():
+    return Employee._meta.get_field('image').storage
+
+
+def _by_count(names):
+    # {count: [names]}, one UPDATE per distinct count instead of one per name
+    grouped = {}
+    for name, count in Counter(name for name in names if name).items():
+        grouped.setdefault(count, []).append(name)
+    return grouped
+
+
+def add_references(names, using='default'):
+    for count, group in _by_count(names).items():
+        ImageBlob.objects.using(using).bulk_create([ImageBlob(name=name) for name in group], ignore_conflicts=True)
+        ImageBlob.objects.using(using).filter(name__in=group).update(references=F('references') + count, released_at=None)
+
+
+def release_references(names, using='default'):
+    for count, group in _by_count(names).items():
+        blobs = ImageBlob.objects.using(using).filter(name__in=group)
+        blobs.update(references=Greatest(F('references') - count, Value(0)))
+        blobs.filter(references=0, released_at=None).update(released_at=timezone.now())
+
+
+def track(names, using='default'):
+    '''
+    Register stored files no employee uses (yet), so they get collected if they stay unused.
+    '''
+    add_references(names, using=using)
+    release_references(names, using=using)
+
+
+def recount(using='default'):
+    '''
+    Rebuild every count from the Employee table, returns the number of blobs fixed.
+    '''
+    counts = dict(Employee.objects.using(using).exclude(image='').values_list('image').annotate(Count('id')))
+    fixed = 0
+    for blob in ImageBlob.objects.using(using).iterator():
+        references = counts.pop(blob.name, 0)
+        if blob.references != references:
+            blob.references = references
+            blob.released_at = timezone.now() if references == 0 else None
+            blob.save(update_fields=['references', 'released_at'])
+            fixed += 1
+    ImageBlob.objects.using(using).bulk_create([ImageBlob(name=name, references=references) for name, references in counts.items()])
+    return fixed + len(counts)
+
+
+def _walk(storage, directory):
+    directories, files = storage.listdir(directory)
+    for name in files:
+        yield f'{directory}/{name}'
+    for subdirectory in directories:
+        yield from _walk(storage, f'{directory}/{subdirectory}')
+
+
+def _older_than(storage, name, cutoff):
+    return storage.get_modified_time(name) <= cutoff
+
+
+def collect_garbage(grace_period=None, dry_run=False, using='default'):
+    '''
+    Delete the unreferenced blobs, the thumbnails of images no employee uses
+    and stray files (e.g. uploads of a rolled back transaction), all only
+    once they are older than the grace period. Returns the deleted names.
+    '''
+    grace_period = get_grace_period() if grace_period is None else grace_period
+    cutoff = timezone.now() - timedelta(seconds=grace_period)
+    storage = _image_storage()
+    deleted = []
+
+    for blob in ImageBlob.objects.using(using).filter(references=0, released_at__lte=cutoff).iterator():
+        if dry_run:
+            deleted.append(blob.name)
+            continue
+        # Only if nobody took a reference since the query
+        if ImageBlob.objects.using(using).filter(pk=blob.pk, references=0).delete()[0]:
+            storage.delete(blob.name)
+            deleted.append(blob.name)
+
+    upload_dir = Employee._meta.get_field('image').upload_to.rstrip('/')
+    if storage.exists(upload_dir):
+        known = set(ImageBlob.objects.using(using).values_list('name', flat=True))
+        for name in _walk(storage, upload_dir):
+            if name.startswith(f'{THUMBNAIL_DIR}/') or name in known or name in deleted:
+                continue
+            if _older_than(storage, name, cutoff) and not Employee.objects.using(using).filter(image=name).exists():
+                if not dry_run:
+                    storage.delete(name)
+                deleted.append(name)
+
+    if default_storage.exists(THUMBNAIL_DIR):
+        used = {image_hash[:16] for image_hash in Employee.objects.using(using).exclude(image_hash='').values_list('image_hash', flat=True).distinct()}
+        for name in _walk(default_storage, THUMBNAIL_DIR):
+            if os.path.basename(name).split('_')[0] not in used and _older_than(default_storage, name, cutoff):
+                if not dry_run:
+                    default_storage.delete(name)
+                deleted.append(name)
+    return deleted
@@ -0,0 +1,219 @@
+import json
+
+from django.conf import settings
+from django.db import transaction, models
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.parsers import JSONParser, MultiPartParser, FormParser
+from rest_framework.response import Response
+
+from employeemanagement_apk.signals import bulk_saved
+from employeemanagement_apk import writes
+
+'''
+
+Bulk create / update / delete endpoints for the REST API viewsets.
+
+    POST   /api/<resource>/bulk/   [{...}, {...}]              create every item
+    PATCH  /api/<resource>/bulk/   [{"id": 1, ...}, ...]       partially update every item
+    DELETE /api/<resource>/bulk/   {"ids": [1, 2, 3]}          delete every item
+
+Multipart requests (employees with images) send the items as a JSON string in
+the "items" field, an item refers to an uploaded file by its field name, e.g.
+items=[{"name": "John", "image": "photo_1"}] with the file uploaded as photo_1.
+
+A batch is validated in one pass (foreign keys are resolved with one query
+per related model) and written in one transaction with bulk_create /
+bulk_update. Nothing is written if any item is invalid, the response then
+lists the errors of every invalid item with its index in the batch.
+
+
+'''
+
+DEFAULT_MAX_ITEMS = 10000
+DEFAULT_BATCH_SIZE = 500
+
+
+def get_max_items():
+    return getattr(settings, 'BULK_MAX_ITEMS', DEFAULT_MAX_ITEMS)
+
+
+def get_batch_size():
+    return getattr(settings, 'BULK_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+
+
+class BulkError(Exception):
+    pass
+
+
+def index_errors(errors):
+    return [{'index': index, 'errors': error} for index, error in enumerate(errors) if error]
+
+
+class BulkModelMixin:
+
+    def get_bulk_items(self, request):
+        data = request.data
+        if isinstance(data, list):
+            items = data
+        elif 'items' in data:
+            try:
+                items = json.loads(data['items'])
+            except (TypeError, ValueError):
+                raise BulkError('"items" must be a JSON encoded list.')
+            # Replace file references with the uploaded files
+            for item in items if isinstance(items, list) else []:
+                if isinstance(item, dict):
+                    for key, value in item.items():
+                        if isinstance(value, str) and value in request.FILES:
+                            item[key] = request.FILES[value]
+        else:
+            raise BulkError('Expected a list of items.')
+
+        if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+            raise BulkError('Expected a list of objects.')
+        if not items:
+            raise BulkError('The list of items is empty.')
+        if len(items) > get_max_items():
+            raise BulkError(f'At most {get_max_items()} items can be sent in one request.')
+        return items
+
+    def get_related_objects(self, items):
+        '''
+        Load every related object referenced by the batch, one query per foreign key.
+        '''
+        related_objects = {}
+        serializer = self.get_serializer()
+        for name, field in serializer.fields.items():
+            queryset = getattr(field, 'queryset', None)
+            if field.read_only or queryset is None:
+                continue
+            pks = set()
+            for item in items:
+                try:
+                    pks.add(queryset.model._meta.pk.to_python(item[name]))
+                except Exception:
+                    # Missing or malformed values are reported by the field itself
+                    continue
+            objects = related_objects.setdefault(queryset.model, {})
+            objects.update(queryset.in_bulk(pks) if pks else {})
+        return related_objects
+
+    def get_bulk_context(self, items):
+        context = self.get_serializer_context()
+        context['related_objects'] = self.get_related_objects(items)
+        return context
+
+    def bulk_error_response(self, detail):
+        return Response({'detail': detail}, status=status.HTTP_400_BAD_REQUEST)
+
+    @action(detail=False, methods=['post'], url_path='bulk', parser_classes=[JSONParser, MultiPartParser, FormParser])
+    def bulk(self, request, *args, **kwargs):
+        try:
+            items = self.get_bulk_items(request)
+        except BulkError as error:
+            return self.bulk_error_response(str(error))
+
+        context = self.get_bulk_context(items)
+        serializer = self.get_serializer_class()(data=items, many=True, context=context)
+        if not serializer.is_valid():
+            return Response({'errors': index_errors(serializer.errors)}, status=status.HTTP_400_BAD_REQUEST)
+
+        model = self.get_queryset().model
+        instances = [model(**attrs) for attrs in serializer.validated_data]
+        def save():
+            with transaction.atomic():
+                model.objects.bulk_create(instances, batch_size=get_batch_size())
+                bulk_saved.send(sender=model, instances=instances, created=True, update_fields=None)
+        writes.run(save)
+
+        data = self.get_serializer_class()(instances, many=True, context=context).data
+        return Response(data, status=status.HTTP_201_CREATED)
+
+    @bulk.mapping.patch
+    def bulk_update(self, request, *args, **kwargs):
+        try:
+            items = self.get_bulk_items(request)
+        except BulkError as error:
+            return self.bulk_error_response(str(error))
+
+        model = self.get_queryset().model
+        pk_field = model._meta.pk
+        pks = []
+        for item in items:
+            try:
+                pks.append(pk_field.to_python(item.get('id')))
+            except Exception:
+                pks.append(None)
+        instances = self.get_queryset().in_bulk([pk for pk in pks if pk is not None])
+
+        # Validate the whole batch with one (partial) list serializer, building
+        # a serializer per item would repeat the field setup for every row.
+        context = self.get_bulk_context(items)
+        serializer_class = self.get_serializer_class()
+        serializer = serializer_class(data=items, many=True, partial=True, context=context)
+        serializer.is_valid()
+        errors = list(serializer.errors) if serializer.errors else [{} for _ in items]
+        for index, pk in enumerate(pks):
+            if pk not in instances:
+                errors[index] = {'id': ['Not found.' if pk is not None else 'This field is required.']}
+        if any(errors):
+            return Response({'errors': index_errors(errors)}, status=status.HTTP_400_BAD_REQUEST)
+
+        fields = set()
+        updated = []
+        for pk, validated_data in zip(pks, serializer.validated_data):
+            instance = instances[pk]
+            for attr, value in validated_data.items():
+                setattr(instance, attr, value)
+                fields.add(attr)
+            updated.append(instance)
+
+        def save():
+            with transaction.atomic():
+                # bulk_update does not call pre_save, store new uploads explicitly
+                for field in model._meta.concrete_fields:
+                    if isinstance(field, models.FileField) and field.name in fields:
+                        for instance in updated:
+                            field.pre_save(instance, add=False)
+                if fields:
+                    # bulk_update does not set auto_now fields either
+                    now = timezone.now()
+                    for instance in updated:
+                        instance.updated_at = now
+                    model.objects.bulk_update(updated, sorted(fields | {'updated_at'}), batch_size=get_batch_size())
+                bulk_saved.send(sender=model, instances=updated, created=False, update_fields=sorted(fields))
+        writes.run(save)
+
+        data = serializer_class(updated, many=True, context=context).data
+        return Response(data)
+
+    @bulk.mapping.delete
+    def bulk_destroy(self, request, *args, **kwargs):
+        data = request.data
+        ids = data if isinstance(data, list) else data.get('ids') if hasattr(data, 'get') else None
+        if not isinstance(ids, list) or not ids:
+            return self.bulk_error_response('Expected a non empty list of ids.')
+        if len(ids) > get_max_items():
+            return self.bulk_error_response(f'At most {get_max_items()} items can be sent in one request.')
+
+        pk_field = self.get_queryset().model._meta.pk
+        pks = []
+        errors = []
+        for value in ids:
+            try:
+                pks.append(pk_field.to_python(value))
+                errors.append({})
+            except Exception:
+                pks.append(None)
+                errors.append({'id': ['A valid integer is required.']})
+        existing = set(self.get_queryset().filter(pk__in=[pk for pk in pks if pk is not None]).values_list('pk', flat=True))
+        for index, pk in enumerate(pks):
+            if pk is not None and pk not in existing:
+                errors[index] = {'id': ['Not found.']}
+        if any(errors):
+            return Response({'errors': index_errors(errors)}, status=status.HTTP_400_BAD_REQUEST)
+
+        writes.run(self.get_queryset().filter(pk__in=existing).delete)
+        return Response({'deleted': len(existing)})
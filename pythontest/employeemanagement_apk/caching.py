@@ -0,0 +1,209 @@
+import hashlib
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction, models
+from django.db.models import F
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_http_date_safe
+from rest_framework.response import Response
+
+from employeemanagement_apk.replicas import current_replica
+
+'''
+
+Response cache of the REST API (CachedResponseMixin, used by BaseViewSet).
+
+Serialized detail payloads and list pages are stored in the API_CACHE cache
+alias. Their keys contain a version token:
+
+    detail  api:detail:<model>:<pk>:<object token>:<request hash>
+    list    api:list:<model>:<model token>:<request hash>
+
+and invalidating an object (or the lists of a model) only replaces its
+token, the old entries are never read again and expire with the cache
+timeout. Tokens are replaced by the signal receivers in signals.py on every
+save / delete / bulk save, including the rows a delete changes through
+on_delete=SET_NULL (found before the delete, see pre_delete). Code updating
+rows with QuerySet.update calls invalidate itself.
+
+invalidate also increments the ModelRevision of the model, which the
+conditional GET support (conditional.py) turns into list ETags.
+
+Hits and misses are counted per model in the same cache, so a file or
+database cache gives the totals of every process.
+
+
+'''
+
+DEFAULT_CACHE_ALIAS = 'api'
+
+# Stored with the payload, so a hit can answer conditional requests (conditional.py) without a query
+CACHED_HEADERS = ('ETag', 'Last-Modified')
+
+
+def get_cache():
+    alias = getattr(settings, 'API_CACHE', DEFAULT_CACHE_ALIAS)
+    return caches[alias] if alias else None
+
+
+def model_label(model):
+    return model._meta.label_lower
+
+
+def _token(cache, key):
+    token = cache.get(key)
+    if token is None:
+        # add keeps the token of a concurrent request if it was first
+        cache.add(key, uuid.uuid4().hex, None)
+        token = cache.get(key)
+    return token
+
+
+def _request_hash(request):
+    # Host and scheme are part of the payload (absolute image URLs). The stored ETag
+    # covers the renderer (conditional.py), JSON and the browsable API are kept apart.
+    renderer = getattr(request, 'accepted_renderer', None)
+    return hashlib.md5(f'{request.build_absolute_uri()}|{renderer.format if renderer else ""}'.encode()).hexdigest()
+
+
+def _related_tokens(cache, related_models):
+    # Responses inlining rows of other models (?expand=) also change with those
+    return ''.join(f":{_token(cache, f'api:token:{model_label(model)}')}" for model in related_models)
+
+
+def detail_key(cache, model, pk, request, related_models=()):
+    label = model_label(model)
+    token = _token(cache, f'api:token:{label}:{pk}') + _related_tokens(cache, related_models)
+    return f'api:detail:{label}:{pk}:{token}:{_request_hash(request)}'
+
+
+def list_key(cache, model, request, related_models=()):
+    label = model_label(model)
+    token = _token(cache, f'api:token:{label}') + _related_tokens(cache, related_models)
+    return f'api:list:{label}:{token}:{_request_hash(request)}'
+
+
+def _invalidate(model, pks):
+    cache = get_cache()
+    if cache is None:
+        return
+    label = model_label(model)
+    cache.delete_many([f'api:token:{label}'] + [f'api:token:{label}:{pk}' for pk in pks])
+
+
+def bump_revision(model, using=None):
+    from employeemanagement_apk.models import ModelRevision
+
+    now = timezone.now()
+    revisions = ModelRevision.objects.db_manager(using)
+    if not revisions.filter(label=model_label(model)).update(revision=F('revision') + 1, updated_at=now):
+        revisions.get_or_create(label=model_label(model), defaults={'revision': 1, 'updated_at': now})
+
+
+def invalidate(model, pks=(), using=None):
+    '''
+    Drop the cached lists of model and the cached details of the objects pks,
+    and increment the revision of model. The cache is dropped again once the
+    transaction commits, so a request reading the old rows in the meantime
+    cannot leave them cached.
+    '''
+    pks = list(pks)
+    bump_revision(model, using=using)
+    _invalidate(model, pks)
+    if transaction.get_connection(using).in_atomic_block:
+        transaction.on_commit(lambda: _invalidate(model, pks), using=using)
+
+
+def set_null_dependents(instance, cached_models):
+    '''
+    [(model, pks)] of the cached rows a delete of instance changes through on_delete=SET_NULL.
+    '''
+    dependents = []
+    for relation in instance._meta.related_objects:
+        if relation.on_delete is models.SET_NULL and relation.related_model in cached_models:
+            pks = list(relation.related_model._base_manager.filter(**{relation.field.name: instance}).values_list('pk', flat=True))
+            if pks:
+                dependents.append((relation.related_model, pks))
+    return dependents
+
+
+def record(model, hit):
+    cache = get_cache()
+    key = f'api:stats:{model_label(model)}:{"hits" if hit else "misses"}'
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, None):
+            cache.incr(key)
+
+
+def get_stats(cached_models):
+    cache = get_cache()
+    stats = {}
+    if cache is None:
+        return stats
+    for model in cached_models:
+        label = model_label(model)
+        counts = cache.get_many([f'api:stats:{label}:hits', f'api:stats:{label}:misses'])
+        hits, misses = counts.get(f'api:stats:{label}:hits', 0), counts.get(f'api:stats:{label}:misses', 0)
+        stats[label] = {'hits': hits, 'misses': misses, 'hit_rate': round(hits / (hits + misses), 3) if hits + misses else None}
+    return stats
+
+
+class CachedResponseMixin:
+    '''
+    Serve list and retrieve from the API cache. Responses carry an X-Cache
+    header (HIT / MISS), only successful responses are stored.
+    '''
+
+    def cached_response(self, key_function, view, *args, **kwargs):
+        cache = get_cache()
+        if cache is None:
+            return view(*args, **kwargs)
+        model = self.get_queryset().model
+        key = key_function(cache, model)
+        cached = cache.get(key)
+        record(model, hit=cached is not None)
+        if cached is not None:
+            data, headers = cached
+            response = get_conditional_response(
+                self.request._request,
+                etag=headers.get('ETag'),
+                last_modified=parse_http_date_safe(headers.get('Last-Modified', '')),
+            ) or Response(data)
+            for header, value in headers.items():
+                response[header] = value
+            response['X-Cache'] = 'HIT'
+            return response
+        response = view(*args, **kwargs)
+        # A replica may not have the write that replaced the token yet (see replicas.py)
+        if response.status_code == 200 and current_replica() is None:
+            headers = {header: response[header] for header in CACHED_HEADERS if response.has_header(header)}
+            cache.set(key, (response.data, headers))
+        response['X-Cache'] = 'MISS'
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(
+            lambda cache, model: list_key(cache, model, request, self.get_related_models()),
+            super().list, request, *args, **kwargs,
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup = kwargs[self.lookup_url_kwarg or self.lookup_field]
+
+        def key_function(cache, model):
+            # Same key for /5/ and /05/, invalidate only knows the pk
+            try:
+                pk = model._meta.pk.to_python(lookup)
+            except Exception:
+                pk = lookup
+            return detail_key(cache, model, pk, request, self.get_related_models())
+
+        return self.cached_response(
+            key_function,
+            super().retrieve, request, *args, **kwargs,
+        )
@@ -0,0 +1,147 @@
+import hashlib
+
+from django.contrib import messages
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from employeemanagement_apk.caching import model_label
+
+'''
+
+Conditional GET (ETag / Last-Modified, 304 Not Modified) for the API and
+the HTML listings.
+
+    list / page     ModelRevision of the model(s), incremented on every
+                    change including deletes (see caching.invalidate)
+    detail          updated_at of the object
+
+The ETag also covers the full URL (filters, cursor, ordering) and the
+response format (or the user for HTML pages), and the revisions of the
+models a response inlines (?expand=, see expansion.py). Everything is
+checked with one or two small queries, before the serializer or the
+template runs.
+
+
+'''
+
+
+def make_etag(*parts):
+    return quote_etag(hashlib.md5('|'.join(str(part) for part in parts).encode()).hexdigest())
+
+
+def timestamp(value):
+    return int(value.timestamp()) if value else None
+
+
+def get_revisions(models, using=None):
+    '''
+    {model: (revision, updated_at)}, (0, None) for a model that never changed.
+    '''
+    from employeemanagement_apk.models import ModelRevision
+
+    labels = {model_label(model): model for model in models}
+    rows = ModelRevision.objects.db_manager(using).filter(label__in=labels).values_list('label', 'revision', 'updated_at')
+    revisions = {model: (0, None) for model in models}
+    for label, revision, updated_at in rows:
+        revisions[labels[label]] = (revision, updated_at)
+    return revisions
+
+
+async def aget_revisions(models, using=None):
+    '''
+    get_revisions for async views.
+    '''
+    from employeemanagement_apk.models import ModelRevision
+
+    labels = {model_label(model): model for model in models}
+    rows = ModelRevision.objects.db_manager(using).filter(label__in=labels).values_list('label', 'revision', 'updated_at')
+    revisions = {model: (0, None) for model in models}
+    async for label, revision, updated_at in rows:
+        revisions[labels[label]] = (revision, updated_at)
+    return revisions
+
+
+class ConditionalGetMixin:
+    '''
+    ETag and Last-Modified on list and retrieve, 304 when the client's copy is current.
+    '''
+
+    def get_related_models(self):
+        # Other models whose rows the responses include, their revisions are part of the ETag
+        return []
+
+    def related_revisions(self):
+        related = self.get_related_models()
+        revisions = get_revisions(related).values() if related else []
+        return [revision_key(*revision) for revision in revisions], [updated_at for _, updated_at in revisions if updated_at]
+
+    def conditional_response(self, request, etag, last_modified, view, *args, **kwargs):
+        not_modified = get_conditional_response(request._request, etag=etag, last_modified=timestamp(last_modified))
+        if not_modified is not None:
+            return not_modified
+        response = view(request, *args, **kwargs)
+        if response.status_code == 200:
+            response['ETag'] = etag
+            if last_modified:
+                response['Last-Modified'] = http_date(timestamp(last_modified))
+        return response
+
+    def list(self, request, *args, **kwargs):
+        model = self.get_queryset().model
+        revisions = get_revisions([model, *self.get_related_models()])
+        keys = [revision_key(*revision) for revision in revisions.values()]
+        updated_at = max((updated_at for _, updated_at in revisions.values() if updated_at), default=None)
+        etag = make_etag('list', model_label(model), *keys, request.get_full_path(), request.accepted_renderer.format)
+        return self.conditional_response(request, etag, updated_at, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        queryset = self.filter_queryset(self.get_queryset())
+        try:
+            updated_at = queryset.filter(**{self.lookup_field: kwargs[lookup_url_kwarg]}).values_list('updated_at', flat=True).first()
+        except (TypeError, ValueError):
+            updated_at = None
+        if updated_at is None:
+            # Not found (or malformed), let retrieve answer
+            return super().retrieve(request, *args, **kwargs)
+        model = queryset.model
+        related_keys, related_times = self.related_revisions()
+        updated_at = max([updated_at, *related_times])
+        etag = make_etag('detail', model_label(model), kwargs[lookup_url_kwarg], updated_at.isoformat(), *related_keys, request.get_full_path(), request.accepted_renderer.format)
+        return self.conditional_response(request, etag, updated_at, super().retrieve, *args, **kwargs)
+
+
+def request_revisions(request, models):
+    '''
+    get_revisions, queried once per request (the ETag, Last-Modified and the
+    template fragment keys of a page all need them).
+    '''
+    if not hasattr(request, '_listing_revisions'):
+        request._listing_revisions = get_revisions(models)
+    return request._listing_revisions
+
+
+def revision_key(revision, updated_at):
+    # The time tells apart equal revision numbers of different databases (a restored backup, tests)
+    return f'{revision}-{updated_at.timestamp() if updated_at else 0}'
+
+
+def listing_condition(*models):
+    '''
+    (etag_func, last_modified_func) for django.views.decorators.http.condition,
+    for HTML pages showing rows of models.
+    '''
+
+    def etag(request, *args, **kwargs):
+        if len(messages.get_messages(request)):
+            # Pending messages are shown once, the page has to be rendered
+            return None
+        parts = [revision_key(*revision) for revision in request_revisions(request, models).values()]
+        return make_etag('page', request.user.pk, request.get_full_path(), *parts)
+
+    def last_modified(request, *args, **kwargs):
+        if len(messages.get_messages(request)):
+            return None
+        return max((updated_at for _, updated_at in request_revisions(request, models).values() if updated_at), default=None)
+
+    return etag, last_modified
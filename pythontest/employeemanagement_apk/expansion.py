@@ -0,0 +1,122 @@
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.permissions import SAFE_METHODS
+
+'''
+
+Sparse fieldsets and embedded expansion for the REST API.
+
+    ?fields=id,name,department.name     only these fields (dotted names
+                                        trim an expanded object)
+    ?expand=status,department.manager   related objects inlined instead of
+                                        their id, up to API_EXPAND_MAX_DEPTH
+                                        levels
+
+Serializers opt in with ExpandableFieldsMixin and list the relations that can
+be expanded in Meta.expandable_fields ({field: serializer class or its name in
+serializers.py}). Only read requests are shaped, writes keep taking and
+returning ids. BaseViewSet joins every expanded relation with
+select_related (expand_queryset), so an expanded page costs the same number
+of queries as a plain one, and adds the expanded models to its cache keys
+and ETags (expanded_models). Relations expand into each other (an employee's
+department has a manager, who has a department, ...), deeper expansions are
+refused with a 400 before any query is built: every level is one more join.
+
+
+'''
+
+DEFAULT_MAX_DEPTH = 3
+
+
+def get_max_depth():
+    return getattr(settings, 'API_EXPAND_MAX_DEPTH', DEFAULT_MAX_DEPTH)
+
+
+def parse_paths(value):
+    '''
+    'a,b.c,b.d' -> {'a': {}, 'b': {'c': {}, 'd': {}}}
+    '''
+    tree = {}
+    for path in (value or '').split(','):
+        node = tree
+        for name in path.strip().split('.'):
+            if not name:
+                break
+            node = node.setdefault(name, {})
+    return tree
+
+
+def depth(tree):
+    return 1 + max(map(depth, tree.values())) if tree else 0
+
+
+def request_options(request):
+    # (fields, expand) trees of a read request, (None, {}) otherwise
+    if request is None or request.method not in SAFE_METHODS:
+        return None, {}
+    params = getattr(request, 'query_params', request.GET)
+    fields = parse_paths(params.get('fields')) if params.get('fields') else None
+    expand = parse_paths(params.get('expand'))
+    if depth(expand) > get_max_depth():
+        raise ParseError(f'?expand= can follow at most {get_max_depth()} relations in a row.')
+    return fields, expand
+
+
+def _resolve(serializer_class):
+    if isinstance(serializer_class, str):
+        from employeemanagement_apk import serializers as app_serializers
+        serializer_class = getattr(app_serializers, serializer_class)
+    return serializer_class
+
+
+def expandable_fields(serializer_class):
+    return getattr(serializer_class.Meta, 'expandable_fields', {})
+
+
+def _walk(serializer_class, expand, model, prefix=''):
+    # (lookup path, model) of every expanded relation the serializer knows
+    for name, nested in expand.items():
+        if name not in expandable_fields(serializer_class):
+            continue
+        field = model._meta.get_field(name)
+        path = f'{prefix}{name}'
+        yield path, field.related_model
+        yield from _walk(_resolve(expandable_fields(serializer_class)[name]), nested, field.related_model, f'{path}__')
+
+
+def expand_queryset(queryset, serializer_class, request):
+    paths = [path for path, _ in _walk(serializer_class, request_options(request)[1], queryset.model)]
+    return queryset.select_related(*paths) if paths else queryset
+
+
+def expanded_models(serializer_class, model, request):
+    '''
+    The models whose rows are inlined in the response, their changes change it too.
+    '''
+    return list(dict.fromkeys(related for _, related in _walk(serializer_class, request_options(request)[1], model)))
+
+
+class ExpandableFieldsMixin:
+
+    def __init__(self, *args, **kwargs):
+        # Nested serializers get their part of the trees, the root reads the request
+        self._fields_option = kwargs.pop('fields', None)
+        self._expand_option = kwargs.pop('expand', None)
+        super().__init__(*args, **kwargs)
+
+    def get_fields(self):
+        fields = super().get_fields()
+        if self._expand_option is None:
+            only, expand = request_options(self.context.get('request'))
+        else:
+            only, expand = self._fields_option, self._expand_option
+
+        for name, nested in expand.items():
+            serializer_class = expandable_fields(self).get(name)
+            if serializer_class is not None and name in fields:
+                nested_fields = only.get(name) if only else None
+                fields[name] = _resolve(serializer_class)(read_only=True, fields=nested_fields or None, expand=nested)
+
+        if only:
+            fields = {name: field for name, field in fields.items() if name in only}
+        return fields
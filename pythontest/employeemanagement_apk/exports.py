@@ -0,0 +1,93 @@
+import csv
+import json
+
+from employeemanagement_apk.models import Employee
+
+'''
+
+Streaming employee export (CSV / NDJSON).
+
+Rows are read with values_list + iterator(chunk_size) so only one chunk of
+tuples is in memory at a time, and they are encoded lazily so the response
+(or file) starts receiving bytes before the whole table has been read.
+
+
+'''
+
+# (column name, lookup) of every exported column
+EXPORT_COLUMNS = [
+    ('id', 'id'),
+    ('name', 'name'),
+    ('address', 'address'),
+    ('manager', 'manager'),
+    ('status', 'status__em_status'),
+    ('position', 'position__name'),
+    ('salary', 'position__salary'),
+    ('department', 'department__name'),
+    ('department_manager', 'department__manager__name'),
+    ('image', 'image'),
+]
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+DEFAULT_CHUNK_SIZE = 2000
+
+# Encoded rows are grouped into chunks of about this many characters
+BUFFER_SIZE = 64 * 1024
+
+
+def export_rows(queryset=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    queryset = queryset if queryset is not None else Employee.objects.all()
+    lookups = [lookup for _, lookup in EXPORT_COLUMNS]
+    return queryset.order_by('pk').values_list(*lookups).iterator(chunk_size=chunk_size)
+
+
+class Echo:
+    '''
+    File-like object whose write returns the value, lets csv.writer encode one row at a time.
+    '''
+
+    def write(self, value):
+        return value
+
+
+def _buffered(lines):
+    buffer = []
+    size = 0
+    for line in lines:
+        buffer.append(line)
+        size += len(line)
+        if size >= BUFFER_SIZE:
+            yield ''.join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+def _csv_lines(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow([name for name, _ in EXPORT_COLUMNS])
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def _ndjson_lines(rows):
+    names = [name for name, _ in EXPORT_COLUMNS]
+    for row in rows:
+        yield json.dumps(dict(zip(names, row)), ensure_ascii=False) + '\n'
+
+
+def stream_export(export_format, queryset=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    '''
+    Return an iterator of text chunks with the employees encoded as export_format.
+    '''
+    rows = export_rows(queryset, chunk_size=chunk_size)
+    if export_format == 'csv':
+        return _buffered(_csv_lines(rows))
+    if export_format == 'ndjson':
+        return _buffered(_ndjson_lines(rows))
+    raise ValueError(f'Unknown export format "{export_format}", expected one of {", ".join(EXPORT_FORMATS)}.')
@@ -41,11 +41,19 @@ Form for Employee, Department, Position, and Status models.
 '''
 
 from .models import Department, Position, Status, Employee
+from .lookups import LookupChoiceField, LookupFormMixin
+
+class EmployeeForm(LookupFormMixin, forms.ModelForm):
+    # A plain file field: forms.ImageField would decode the upload with Pillow
+    # during the request, the background worker verifies it instead (see images.py).
+    # The model field still validates the extension.
+    image = forms.FileField(widget=forms.ClearableFileInput(attrs={'accept': 'image/*'}))
 
-class EmployeeForm(forms.ModelForm):
     class Meta:
         model = Employee
         fields = ['name', 'address', 'manager', 'status', 'position', 'department', 'image']
+        # Choices from the lookup table cache instead of a query per field
+        field_classes = {'status': LookupChoiceField, 'position': LookupChoiceField, 'department': LookupChoiceField}
 
     def __init__(self, *args, **kwargs):
         super(EmployeeForm, self).__init__(*args, **kwargs)
@@ -88,8 +96,8 @@ Form for filtering employees by position, department, and status.
 
 '''
 
-class EmployeeFilterForm(forms.Form):
-    position = forms.ModelChoiceField(queryset=Position.objects.all(), required=False)
-    department = forms.ModelChoiceField(queryset=Department.objects.all(), required=False)
-    status = forms.ModelChoiceField(queryset=Status.objects.all(), required=False)
-    search = forms.CharField(required=False, label='Search by Name')
+class EmployeeFilterForm(LookupFormMixin, forms.Form):
+    position = LookupChoiceField(queryset=Position.objects.all(), required=False)
+    department = LookupChoiceField(queryset=Department.objects.all(), required=False)
+    status = LookupChoiceField(queryset=Status.objects.all(), required=False)
+    search = forms.CharField(required=False, label='Search by Name or Address')
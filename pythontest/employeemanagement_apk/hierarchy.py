@@ -0,0 +1,251 @@
+from django.db import connections, transaction, IntegrityError
+from django.db.models import Count, F, Max, Q
+
+from employeemanagement_apk.models import Employee, ReportingPath
+
+'''
+
+Reporting hierarchy (Employee.reports_to) as a closure table.
+
+ReportingPath holds a row for every employee and each of its managers up the
+reporting line, with the distance between them (depth, 1 for the direct
+manager), and one row from every employee to itself at depth 0. The
+hierarchy is read with one indexed query at any depth:
+
+    subtree             everyone reporting to an employee, directly or not
+                        (ReportingPath.ancestor = employee)
+    ancestors           the reporting line up to the top
+                        (ReportingPath.descendant = employee)
+    span_of_control     direct reports, total reports and levels below
+
+The paths are maintained by the signal receivers (signals.py): a new
+employee copies the paths of its manager (one INSERT ... SELECT), a move
+detaches the subtree of the employee from its old managers and attaches it
+under the new one (one DELETE and one INSERT ... SELECT, whatever the size of
+the subtree), a deleted employee leaves its reports at the top of their own
+subtrees (reports_to is SET_NULL). Moving an employee under one of its own
+reports raises HierarchyError.
+
+Code changing reports_to with QuerySet.update must call move_employee
+itself, bulk_create callers call add_employees (seeding.py does). The
+rebuild_reporting_paths command rebuilds (or checks) the table from
+Employee.reports_to.
+
+
+'''
+
+# Primary keys per INSERT ... SELECT, each is bound twice
+CHUNK_SIZE = 400
+
+UNKNOWN = object()
+
+
+class HierarchyError(ValueError):
+    pass
+
+
+def _tables(using):
+    quote = connections[using].ops.quote_name
+    return quote(Employee._meta.db_table), quote(ReportingPath._meta.db_table)
+
+
+'''
+
+Maintenance
+
+'''
+
+def loaded_manager(employee):
+    # reports_to_id the row had when it was loaded, UNKNOWN if it was not loaded
+    return getattr(employee, '_loaded_values', {}).get('reports_to_id', UNKNOWN)
+
+
+def remember_manager(employee):
+    # The paths now follow the current manager, for the next save of the same instance
+    employee._loaded_values = {**getattr(employee, '_loaded_values', {}), 'reports_to_id': employee.reports_to_id}
+
+
+def current_manager(employee_id, using='default'):
+    return ReportingPath.objects.using(using).filter(descendant_id=employee_id, depth=1).values_list('ancestor_id', flat=True).first()
+
+
+def manager_changed(employee, using='default'):
+    '''
+    Whether a save of employee changes the manager its paths were built for.
+    '''
+    manager_id = loaded_manager(employee)
+    if manager_id is UNKNOWN:
+        manager_id = current_manager(employee.pk, using=using)
+    return manager_id != employee.reports_to_id
+
+
+def check_manager(employee, manager_id, using='default'):
+    '''
+    Raise HierarchyError when employee cannot report to manager_id: itself or anyone reporting to it.
+    '''
+    if manager_id is None or employee.pk is None:
+        return
+    if manager_id == employee.pk or ReportingPath.objects.using(using).filter(ancestor_id=employee.pk, descendant_id=manager_id).exists():
+        raise HierarchyError(f'{employee} cannot report to themselves or to one of their reports.')
+
+
+def _insert_paths(employee_ids, using):
+    # The path to itself and a path to every manager of the manager, read from the manager's paths
+    employee_table, path_table = _tables(using)
+    with connections[using].cursor() as cursor:
+        for start in range(0, len(employee_ids), CHUNK_SIZE):
+            chunk = employee_ids[start:start + CHUNK_SIZE]
+            placeholders = ', '.join(['%s'] * len(chunk))
+            cursor.execute(
+                f'INSERT INTO {path_table} (ancestor_id, descendant_id, depth) '
+                f'SELECT id, id, 0 FROM {employee_table} WHERE id IN ({placeholders}) '
+                f'UNION ALL '
+                f'SELECT path.ancestor_id, employee.id, path.depth + 1 FROM {employee_table} employee '
+                f'INNER JOIN {path_table} path ON path.descendant_id = employee.reports_to_id WHERE employee.id IN ({placeholders})',
+                [*chunk, *chunk],
+            )
+
+
+def add_employees(employees, using='default'):
+    '''
+    Add the paths of new employees. Managers created in the same batch are
+    added first, one statement per level.
+    '''
+    pending = {employee.pk: employee.reports_to_id for employee in employees}
+    while pending:
+        level = [pk for pk, manager_id in pending.items() if manager_id not in pending]
+        if not level:
+            raise HierarchyError('The new employees report to each other in a cycle.')
+        _insert_paths(level, using)
+        for pk in level:
+            del pending[pk]
+    for employee in employees:
+        remember_manager(employee)
+
+
+def detach_subtree(employee_id, using='default'):
+    # Drop the paths from the managers of the employee to it and everyone reporting to it
+    paths = ReportingPath.objects.using(using)
+    subtree = paths.filter(ancestor_id=employee_id).values('descendant_id')
+    paths.filter(descendant_id__in=subtree).exclude(ancestor_id__in=subtree).delete()
+
+
+def move_employee(employee_id, manager_id, using='default'):
+    '''
+    Move the employee, and everyone reporting to it, under manager_id (None for the top).
+    '''
+    _, path_table = _tables(using)
+    with transaction.atomic(using=using):
+        detach_subtree(employee_id, using=using)
+        if manager_id is None:
+            return
+        with connections[using].cursor() as cursor:
+            # Every manager of the new manager to every member of the subtree
+            cursor.execute(
+                f'INSERT INTO {path_table} (ancestor_id, descendant_id, depth) '
+                f'SELECT manager.ancestor_id, subtree.descendant_id, manager.depth + subtree.depth + 1 '
+                f'FROM {path_table} manager, {path_table} subtree WHERE manager.descendant_id = %s AND subtree.ancestor_id = %s',
+                [manager_id, employee_id],
+            )
+
+
+def move_employees(employees, using='default'):
+    '''
+    Apply the manager changes of saved employees to their paths, one at a time so a batch can move them under each other.
+    '''
+    for employee in employees:
+        if manager_changed(employee, using=using):
+            check_manager(employee, employee.reports_to_id, using=using)
+            move_employee(employee.pk, employee.reports_to_id, using=using)
+        remember_manager(employee)
+
+
+def _expected_paths(using):
+    # WITH clause generating the paths from Employee.reports_to. The depth is bounded by
+    # the number of employees, a cycle made with QuerySet.update cannot loop forever.
+    employee_table, _ = _tables(using)
+    return (
+        f'WITH RECURSIVE expected (ancestor_id, descendant_id, depth) AS ('
+        f'SELECT id, id, 0 FROM {employee_table} '
+        f'UNION ALL '
+        f'SELECT expected.ancestor_id, employee.id, expected.depth + 1 FROM expected '
+        f'INNER JOIN {employee_table} employee ON employee.reports_to_id = expected.descendant_id '
+        f'WHERE expected.depth < (SELECT COUNT(*) FROM {employee_table})'
+        f') '
+    )
+
+
+def rebuild_paths(using='default'):
+    _, path_table = _tables(using)
+    expected = _expected_paths(using)
+    with transaction.atomic(using=using):
+        ReportingPath.objects.using(using).all().delete()
+        with connections[using].cursor() as cursor:
+            try:
+                cursor.execute(
+                    f'INSERT INTO {path_table} (ancestor_id, descendant_id, depth) '
+                    f'{expected}SELECT ancestor_id, descendant_id, depth FROM expected'
+                )
+            except IntegrityError:
+                # Only a cycle leads to an employee twice (at depth 0 and further up)
+                raise HierarchyError('Employee.reports_to has a cycle, fix it before rebuilding the paths.')
+
+
+def path_differences(using='default'):
+    '''
+    (missing, extra): the number of paths the table lacks and the number it should not have.
+    '''
+    _, path_table = _tables(using)
+    expected = _expected_paths(using)
+    columns = 'ancestor_id, descendant_id, depth'
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            f'{expected}SELECT '
+            f'(SELECT COUNT(*) FROM (SELECT {columns} FROM expected EXCEPT SELECT {columns} FROM {path_table}) missing), '
+            f'(SELECT COUNT(*) FROM (SELECT {columns} FROM {path_table} EXCEPT SELECT {columns} FROM expected) extra)'
+        )
+        return tuple(cursor.fetchone())
+
+
+'''
+
+Queries
+
+'''
+
+def subtree(queryset, employee_id, max_depth=None):
+    '''
+    The employees of queryset reporting to employee_id at any depth (up to
+    max_depth), annotated with their depth below it. Ordered on report_id,
+    the primary key as read from the closure table index: a page of a large
+    subtree does not sort all of it.
+    '''
+    depth = Q(ancestor_paths__depth__gte=1)
+    if max_depth is not None:
+        depth &= Q(ancestor_paths__depth__lte=max_depth)
+    # One filter() call, the annotations read the filtered path
+    return queryset.filter(depth, ancestor_paths__ancestor_id=employee_id).annotate(
+        depth=F('ancestor_paths__depth'), report_id=F('ancestor_paths__descendant_id'),
+    ).order_by('report_id')
+
+
+def ancestors(queryset, employee_id):
+    '''
+    The employee and its managers up to the top, nearest first, annotated with their depth above it (0 for itself).
+    '''
+    return queryset.filter(descendant_paths__descendant_id=employee_id).annotate(depth=F('descendant_paths__depth')).order_by('depth')
+
+
+def span_of_control(employee_id, using=None):
+    '''
+    {'direct_reports', 'total_reports', 'levels'} of the employee, None when it does not exist.
+    '''
+    span = ReportingPath.objects.using(using).filter(ancestor_id=employee_id).aggregate(
+        paths=Count('depth'),
+        direct_reports=Count('depth', filter=Q(depth=1)),
+        total_reports=Count('depth', filter=Q(depth__gte=1)),
+        levels=Max('depth'),
+    )
+    if not span['paths']:
+        return None
+    return {'direct_reports': span['direct_reports'], 'total_reports': span['total_reports'], 'levels': span['levels']}
@@ -0,0 +1,240 @@
+import hashlib
+import logging
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+
+from employeemanagement_apk import tasks, caching, rendering
+from employeemanagement_apk.rendering import THUMBNAIL_SIZES, IMAGE_ERRORS
+
+logger = logging.getLogger(__name__)
+
+'''
+
+Derivative images (thumbnails) for Employee.image.
+
+Every thumbnail size is stored twice, as WebP and as a JPEG (PNG when the
+original has transparency) fallback for browsers without WebP. The file names
+are derived from the SHA-256 of the original, so employees sharing the same
+picture share the thumbnails and a new upload never reuses a stale file:
+
+    images/thumbs/<hash[:16]>_<size>.webp
+    images/thumbs/<hash[:16]>_<size>.jpg
+
+Uploads are stored as received and processed off the request path (see
+tasks.py): process_image verifies the file with Pillow, re-encodes it without
+metadata (EXIF, GPS) and downscaled to IMAGE_MAX_DIMENSION when needed, then
+creates the thumbnails. Employee.image_status tracks the progress
+(pending -> processing -> ready / failed). The Pillow work itself
+(rendering.py) runs on the worker processes of tasks.render, the database
+and storage work on the worker threads.
+
+The originals are content addressed (see storage.py) and reference counted
+(see blobs.py), the thumbnails are in the default storage.
+
+
+'''
+
+THUMBNAIL_DIR = 'images/thumbs'
+
+# Originals larger than this (either side, in pixels) are downscaled
+DEFAULT_MAX_DIMENSION = 2048
+
+
+def get_max_dimension():
+    return getattr(settings, 'IMAGE_MAX_DIMENSION', DEFAULT_MAX_DIMENSION)
+
+
+def content_hash(file):
+    sha256 = hashlib.sha256()
+    file.seek(0)
+    for chunk in iter(lambda: file.read(64 * 1024), b''):
+        sha256.update(chunk)
+    file.seek(0)
+    return sha256.hexdigest()
+
+
+def thumbnail_name(image_hash, size, extension):
+    return f'{THUMBNAIL_DIR}/{image_hash[:16]}_{size}.{extension}'
+
+
+def generate_thumbnails(employee):
+    '''
+    Create the derivatives of employee.image and return (image hash, thumbnails),
+    thumbnails being {size name: {'webp': name, 'fallback': name}} plus the
+    name of the source image, as stored on Employee.image_thumbnails.
+    Files that already exist (same content hash) are not written again.
+    '''
+    storage = default_storage
+    with employee.image.open('rb') as source:
+        data = source.read()
+    image_hash = hashlib.sha256(data).hexdigest()
+    thumbnails = {'source': employee.image.name}
+    for size_name, extension, content in tasks.render(rendering.render_thumbnails, data):
+        name = thumbnail_name(image_hash, size_name, extension)
+        if not storage.exists(name):
+            name = storage.save(name, ContentFile(content))
+        thumbnails.setdefault(size_name, {})['webp' if extension == 'webp' else 'fallback'] = name
+    return image_hash, thumbnails
+
+
+def thumbnails_are_current(employee):
+    '''
+    True when the stored derivatives belong to the current image and exist on disk.
+    '''
+    thumbnails = employee.image_thumbnails or {}
+    if not employee.image or thumbnails.get('source') != employee.image.name:
+        return False
+    storage = default_storage
+    for size_name in THUMBNAIL_SIZES:
+        names = thumbnails.get(size_name)
+        if not names or not all(storage.exists(name) for name in names.values()):
+            return False
+    return True
+
+
+def update_thumbnails(employee, force=False):
+    '''
+    (Re)generate the derivatives of employee when they are missing or stale
+    and store them without calling save (no post_save loop). Returns True if
+    anything was generated.
+    '''
+    from employeemanagement_apk.models import Employee
+
+    if not employee.image:
+        if employee.image_thumbnails or employee.image_hash:
+            employee.image_hash, employee.image_thumbnails = '', {}
+            Employee.objects.filter(pk=employee.pk).update(image_hash='', image_thumbnails={}, updated_at=timezone.now())
+            caching.invalidate(Employee, [employee.pk])
+        return False
+    if not force and (employee.image_thumbnails or {}).get('source') == employee.image.name:
+        return False
+
+    employee.image_hash, employee.image_thumbnails = generate_thumbnails(employee)
+    Employee.objects.filter(pk=employee.pk).update(image_hash=employee.image_hash, image_thumbnails=employee.image_thumbnails, updated_at=timezone.now())
+    caching.invalidate(Employee, [employee.pk])
+    return True
+
+
+def thumbnail_urls(employee):
+    '''
+    {size name: {'webp': url, 'fallback': url}} for templates and the API, empty without thumbnails.
+    '''
+    thumbnails = employee.image_thumbnails or {}
+    if not employee.image or thumbnails.get('source') != employee.image.name:
+        return {}
+    storage = default_storage
+    return {
+        size_name: {kind: storage.url(name) for kind, name in thumbnails[size_name].items()}
+        for size_name in THUMBNAIL_SIZES
+        if size_name in thumbnails
+    }
+
+
+def normalize_original(employee):
+    '''
+    Verify the stored original and, when it carries metadata or is larger than
+    IMAGE_MAX_DIMENSION, store a re-encoded copy without them. Returns the
+    name of the file to keep (the original name when nothing was rewritten).
+    '''
+    storage = employee.image.storage
+    name = employee.image.name
+    with storage.open(name, 'rb') as source:
+        data = source.read()
+    content = tasks.render(rendering.normalize, data, get_max_dimension())
+    if content is None:
+        return name
+    return storage.save(name, ContentFile(content))
+
+
+def process_image(employee_id):
+    '''
+    Background task: verify and normalize the image of an employee and create
+    its thumbnails. Only pending rows are processed, and the result is only
+    stored if the image was not replaced in the meantime.
+    '''
+    from employeemanagement_apk.models import Employee, ImageStatus
+    from employeemanagement_apk import blobs
+
+    employee = Employee.objects.filter(pk=employee_id).first()
+    if employee is None:
+        return False
+    original = employee.image.name
+    employees = Employee.objects.filter(pk=employee_id, image=original)
+    if not employees.filter(image_status=ImageStatus.PENDING).update(image_status=ImageStatus.PROCESSING, updated_at=timezone.now()):
+        # Already taken by another worker
+        return False
+    caching.invalidate(Employee, [employee_id])
+
+    try:
+        name = normalize_original(employee) if original else ''
+        employee.image = name
+        image_hash, thumbnails = generate_thumbnails(employee) if name else ('', {})
+    except IMAGE_ERRORS as error:
+        logger.warning('Could not process the image of employee %s: %s', employee_id, error)
+        employees.update(image_status=ImageStatus.FAILED, image_error=str(error) or error.__class__.__name__, updated_at=timezone.now())
+        caching.invalidate(Employee, [employee_id])
+        return False
+
+    with transaction.atomic():
+        stored = employees.update(image=name, image_hash=image_hash, image_thumbnails=thumbnails, image_status=ImageStatus.READY, image_error='', updated_at=timezone.now())
+        if name != original:
+            # The re-encoded copy replaces the upload, unless a new image arrived meanwhile
+            if stored:
+                blobs.add_references([name])
+                blobs.release_references([original])
+            else:
+                blobs.track([name])
+        caching.invalidate(Employee, [employee_id])
+    return bool(stored)
+
+
+def image_changed(employee):
+    loaded = getattr(employee, '_loaded_values', None)
+    return loaded is None or loaded.get('image') != employee.image.name
+
+
+def queue_processing(employees, using='default'):
+    '''
+    Mark the employees whose image changed as pending, move the blob
+    references from the replaced images to the new ones and queue the
+    processing once the transaction commits. Called by the save signals.
+    '''
+    from employeemanagement_apk.models import Employee, ImageStatus
+    from employeemanagement_apk import blobs
+
+    changed = [employee for employee in employees if image_changed(employee)]
+    if not changed:
+        return
+    # New rows are already pending, replaced images also drop their old derivatives
+    stale = [
+        employee.pk for employee in changed
+        if employee.image_status != ImageStatus.PENDING or employee.image_hash or employee.image_thumbnails
+    ]
+    if stale:
+        Employee.objects.using(using).filter(pk__in=stale).update(
+            image_status=ImageStatus.PENDING, image_error='', image_hash='', image_thumbnails={}, updated_at=timezone.now(),
+        )
+
+    replaced = []
+    for employee in changed:
+        loaded = getattr(employee, '_loaded_values', None)
+        if loaded and loaded.get('image'):
+            replaced.append(loaded['image'])
+        employee.image_status, employee.image_error = ImageStatus.PENDING, ''
+        employee.image_hash, employee.image_thumbnails = '', {}
+        employee._loaded_values = {**(loaded or {}), 'image': employee.image.name}
+
+    blobs.add_references([employee.image.name for employee in changed], using=using)
+    blobs.release_references(replaced, using=using)
+
+    ids = [employee.pk for employee in changed]
+
+    def submit():
+        for employee_id in ids:
+            tasks.submit(process_image, employee_id)
+
+    transaction.on_commit(submit, using=using)
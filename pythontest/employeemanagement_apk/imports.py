@@ -0,0 +1,205 @@
+import csv
+import json
+import os
+
+from django.db import transaction
+from django.utils import timezone
+
+from employeemanagement_apk.models import Employee, Status, Position, Department
+from employeemanagement_apk.signals import bulk_saved
+from employeemanagement_apk import writes
+
+'''
+
+Streaming CSV import of employees.
+
+The CSV needs a header row. Columns:
+
+    name, address                   required
+    manager                         optional, true/false (yes/no, 1/0)
+    status, position, department    optional, matched by name (Status.em_status, Position.name, Department.name)
+    image                           optional, path of an existing file relative to MEDIA_ROOT
+    manages_department              optional, name of a department this employee becomes the manager of
+
+Rows are read one at a time and written with bulk_create in batches, each
+batch in its own transaction (committed by the writer thread with
+WRITE_COALESCING, see writes.py). Invalid rows are skipped and reported with
+their line number. After every batch a checkpoint (number of rows done) can
+be written so an interrupted import can be resumed where it stopped.
+
+
+'''
+
+REQUIRED_COLUMNS = {'name', 'address'}
+KNOWN_COLUMNS = REQUIRED_COLUMNS | {'manager', 'status', 'position', 'department', 'image', 'manages_department'}
+
+TRUE_VALUES = {'1', 'true', 'yes', 'y'}
+FALSE_VALUES = {'', '0', 'false', 'no', 'n'}
+
+DEFAULT_BATCH_SIZE = 1000
+
+# Only the first errors are kept in the result
+MAX_REPORTED_ERRORS = 1000
+
+
+class CSVImportError(Exception):
+    pass
+
+
+class ImportResult:
+
+    def __init__(self):
+        self.rows = 0
+        self.created = 0
+        self.skipped = 0
+        self.errors = []
+
+    def add_error(self, line, errors):
+        self.skipped += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line, 'errors': errors})
+
+    def as_dict(self):
+        return {'rows': self.rows, 'created': self.created, 'skipped': self.skipped, 'errors': self.errors}
+
+
+class LookupCache:
+    '''
+    In-memory name -> instance lookups for Status, Position and Department,
+    loaded once per import (they are small tables).
+    '''
+
+    def __init__(self, using='default'):
+        self.statuses = {status.em_status: status for status in Status.objects.using(using)}
+        self.positions = {position.name: position for position in Position.objects.using(using)}
+        self.departments = {department.name: department for department in Department.objects.using(using)}
+
+
+class EmployeeImporter:
+
+    def __init__(self, batch_size=DEFAULT_BATCH_SIZE, checkpoint_path=None, progress=None, using='default'):
+        self.batch_size = batch_size
+        self.checkpoint_path = checkpoint_path
+        self.progress = progress
+        self.using = using
+
+    def read_checkpoint(self):
+        # {'rows', 'created', 'skipped'} of the rows done before, empty without a checkpoint
+        if not self.checkpoint_path or not os.path.exists(self.checkpoint_path):
+            return {}
+        with open(self.checkpoint_path) as checkpoint:
+            return json.load(checkpoint)
+
+    def write_checkpoint(self, result):
+        if not self.checkpoint_path:
+            return
+        # Write then rename so a crash never leaves a half written checkpoint
+        temporary_path = f'{self.checkpoint_path}.tmp'
+        with open(temporary_path, 'w') as checkpoint:
+            json.dump({'rows': result.rows, 'created': result.created, 'skipped': result.skipped}, checkpoint)
+        os.replace(temporary_path, self.checkpoint_path)
+
+    def parse_row(self, row, lookups):
+        '''
+        Return (employee, managed department name, errors) for one CSV row.
+        '''
+        errors = {}
+        name = (row.get('name') or '').strip()
+        address = (row.get('address') or '').strip()
+        if not name:
+            errors['name'] = 'This field is required.'
+        elif len(name) > Employee._meta.get_field('name').max_length:
+            errors['name'] = 'Ensure this field has no more than 100 characters.'
+        if not address:
+            errors['address'] = 'This field is required.'
+        elif len(address) > Employee._meta.get_field('address').max_length:
+            errors['address'] = 'Ensure this field has no more than 200 characters.'
+
+        manager = (row.get('manager') or '').strip().lower()
+        if manager not in TRUE_VALUES | FALSE_VALUES:
+            errors['manager'] = f'"{manager}" is not a valid boolean.'
+        manager = manager in TRUE_VALUES
+
+        related = {}
+        for column, objects in (('status', lookups.statuses), ('position', lookups.positions), ('department', lookups.departments)):
+            value = (row.get(column) or '').strip()
+            related[column] = objects.get(value) if value else None
+            if value and related[column] is None:
+                errors[column] = f'Unknown {column} "{value}".'
+
+        # Department.save only accepts managers as department managers
+        manages_department = (row.get('manages_department') or '').strip()
+        if manages_department:
+            if manages_department not in lookups.departments:
+                errors['manages_department'] = f'Unknown department "{manages_department}".'
+            elif not manager:
+                errors['manages_department'] = f'The employee {name} is not designated as a manager.'
+
+        if errors:
+            return None, None, errors
+        employee = Employee(name=name, address=address, manager=manager, image=(row.get('image') or '').strip(), **related)
+        return employee, manages_department or None, None
+
+    def write_batch(self, batch, result, lookups):
+        employees = [employee for employee, _ in batch]
+
+        def save():
+            with transaction.atomic(using=self.using):
+                Employee.objects.using(self.using).bulk_create(employees)
+                departments = {}
+                for employee, manages_department in batch:
+                    if manages_department:
+                        department = lookups.departments[manages_department]
+                        department.manager = employee
+                        department.updated_at = timezone.now()
+                        departments[department.pk] = department
+                bulk_saved.send(sender=Employee, instances=employees, created=True, update_fields=None)
+                if departments:
+                    Department.objects.using(self.using).bulk_update(departments.values(), ['manager', 'updated_at'])
+                    bulk_saved.send(sender=Department, instances=list(departments.values()), created=False, update_fields=['manager', 'updated_at'])
+        writes.run(save)
+        result.created += len(employees)
+
+    def run(self, lines, resume=False):
+        '''
+        Import the CSV text lines (a file object or any iterable of lines).
+        '''
+        reader = csv.DictReader(lines)
+        columns = {column.strip() for column in reader.fieldnames or []}
+        missing = REQUIRED_COLUMNS - columns
+        if missing:
+            raise CSVImportError(f'Missing column(s): {", ".join(sorted(missing))}.')
+        unknown = columns - KNOWN_COLUMNS
+        if unknown:
+            raise CSVImportError(f'Unknown column(s): {", ".join(sorted(unknown))}.')
+
+        checkpoint = self.read_checkpoint() if resume else {}
+        skip = checkpoint.get('rows', 0)
+        lookups = LookupCache(self.using)
+        result = ImportResult()
+        # The totals cover the rows imported before the checkpoint too (their errors are not kept)
+        result.created, result.skipped = checkpoint.get('created', 0), checkpoint.get('skipped', 0)
+        batch = []
+        for row in reader:
+            if result.rows < skip:
+                result.rows += 1
+                continue
+            row = {(key or '').strip(): value for key, value in row.items()}
+            employee, manages_department, errors = self.parse_row(row, lookups)
+            result.rows += 1
+            if errors:
+                result.add_error(reader.line_num, errors)
+            else:
+                batch.append((employee, manages_department))
+            if len(batch) >= self.batch_size:
+                self.write_batch(batch, result, lookups)
+                batch = []
+                self.write_checkpoint(result)
+                if self.progress:
+                    self.progress(result)
+        if batch:
+            self.write_batch(batch, result, lookups)
+        self.write_checkpoint(result)
+        if self.progress:
+            self.progress(result)
+        return result
@@ -0,0 +1,341 @@
+import contextvars
+import json
+import logging
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.template import TemplateDoesNotExist
+from django.template.backends.django import DjangoTemplates, Template, reraise
+
+logger = logging.getLogger('employeemanagement_apk.requests')
+
+'''
+
+Per request instrumentation (InstrumentationMiddleware).
+
+Every request records its SQL query count and time (a connection
+execute_wrapper), its template render time (the InstrumentedTemplates
+backend, see TEMPLATES), its duration and its response size. The numbers
+are added up per URL name (resolver_match.view_name, e.g. database,
+employee-list) in an in-process registry:
+
+    /metrics                    Prometheus text format, for scraping
+    /api/request-stats/         per view report (admin users)
+
+Requests slower than SLOW_REQUEST_MS or running more than
+SLOW_REQUEST_QUERIES queries are logged as one JSON line on the
+employeemanagement_apk.requests logger. The numbers are also sent to the
+browser in a Server-Timing header.
+
+Streaming responses are measured until their last chunk was sent.
+
+The middleware serves WSGI and ASGI requests (async views run without a
+thread, see async_views.py). Queries are counted by a wrapper installed on
+every connection when it opens (count_queries, connected in signals.py), it
+counts for the request of the context running the query, so the queries an
+async view runs through the ORM's worker thread are counted too.
+
+
+'''
+
+DEFAULT_SLOW_REQUEST_MS = 500
+DEFAULT_SLOW_REQUEST_QUERIES = 50
+
+# Upper bounds (seconds) of the request duration histogram
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Totals of _ViewStats exported as counters: (metric, help, attribute)
+COUNTERS = [
+    ('http_request_db_queries_total', 'SQL queries run by the requests.', 'queries'),
+    ('http_request_db_seconds_total', 'Time spent in SQL queries.', 'db_time'),
+    ('http_request_template_seconds_total', 'Time spent rendering templates.', 'template_time'),
+    ('http_response_bytes_total', 'Response body bytes sent.', 'response_bytes'),
+]
+
+_current = contextvars.ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.duration = 0.0
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.response_bytes = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        # connection.execute_wrapper
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_time += time.perf_counter() - start
+
+    def as_dict(self):
+        return {
+            'duration_ms': round(self.duration * 1000, 3),
+            'queries': self.queries,
+            'db_ms': round(self.db_time * 1000, 3),
+            'template_ms': round(self.template_time * 1000, 3),
+            'response_bytes': self.response_bytes,
+        }
+
+
+class InstrumentedTemplate(Template):
+
+    def render(self, context=None, request=None):
+        metrics = _current.get()
+        if metrics is None:
+            return super().render(context, request)
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            metrics.template_time += time.perf_counter() - start
+
+
+class InstrumentedTemplates(DjangoTemplates):
+    '''
+    The Django template backend, timing the templates rendered during a request.
+    '''
+
+    def from_string(self, template_code):
+        return InstrumentedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return InstrumentedTemplate(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
+
+
+class _ViewStats:
+
+    def __init__(self):
+        self.statuses = {}
+        self.buckets = [0] * len(DURATION_BUCKETS)
+        self.count = 0
+        self.duration = 0.0
+        self.max_duration = 0.0
+        self.queries = 0
+        self.max_queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.response_bytes = 0
+
+
+class Registry:
+    '''
+    Totals per (view, method), since the process started.
+    '''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.views = {}
+
+    def observe(self, view, method, status, metrics):
+        with self.lock:
+            stats = self.views.setdefault((view, method), _ViewStats())
+            stats.statuses[status] = stats.statuses.get(status, 0) + 1
+            for index, bound in enumerate(DURATION_BUCKETS):
+                if metrics.duration <= bound:
+                    stats.buckets[index] += 1
+            stats.count += 1
+            stats.duration += metrics.duration
+            stats.max_duration = max(stats.max_duration, metrics.duration)
+            stats.queries += metrics.queries
+            stats.max_queries = max(stats.max_queries, metrics.queries)
+            stats.db_time += metrics.db_time
+            stats.template_time += metrics.template_time
+            stats.response_bytes += metrics.response_bytes
+
+    def clear(self):
+        with self.lock:
+            self.views.clear()
+
+    def report(self):
+        with self.lock:
+            return {
+                f'{method} {view}': {
+                    'requests': stats.count,
+                    'statuses': {str(status): count for status, count in sorted(stats.statuses.items())},
+                    'avg_ms': round(stats.duration / stats.count * 1000, 3),
+                    'max_ms': round(stats.max_duration * 1000, 3),
+                    'avg_queries': round(stats.queries / stats.count, 2),
+                    'max_queries': stats.max_queries,
+                    'avg_db_ms': round(stats.db_time / stats.count * 1000, 3),
+                    'avg_template_ms': round(stats.template_time / stats.count * 1000, 3),
+                    'avg_response_bytes': round(stats.response_bytes / stats.count),
+                }
+                for (view, method), stats in sorted(self.views.items())
+            }
+
+    def prometheus(self):
+        with self.lock:
+            views = [(f'view="{_escape(view)}",method="{method}"', stats) for (view, method), stats in sorted(self.views.items())]
+            lines = [
+                '# HELP http_requests_total Requests by view, method and status.',
+                '# TYPE http_requests_total counter',
+            ]
+            for labels, stats in views:
+                lines.extend(f'http_requests_total{{{labels},status="{status}"}} {count}' for status, count in sorted(stats.statuses.items()))
+
+            lines += [
+                '# HELP http_request_duration_seconds Request duration.',
+                '# TYPE http_request_duration_seconds histogram',
+            ]
+            for labels, stats in views:
+                lines.extend(f'http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {count}' for bound, count in zip(DURATION_BUCKETS, stats.buckets))
+                lines.append(f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {stats.count}')
+                lines.append(f'http_request_duration_seconds_sum{{{labels}}} {stats.duration:.6f}')
+                lines.append(f'http_request_duration_seconds_count{{{labels}}} {stats.count}')
+
+            for name, help_text, attribute in COUNTERS:
+                lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+                lines.extend(f'{name}{{{labels}}} {_number(getattr(stats, attribute))}' for labels, stats in views)
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value):
+    return f'{value:.6f}' if isinstance(value, float) else value
+
+
+registry = Registry()
+
+
+def get_thresholds():
+    return (
+        getattr(settings, 'SLOW_REQUEST_MS', DEFAULT_SLOW_REQUEST_MS),
+        getattr(settings, 'SLOW_REQUEST_QUERIES', DEFAULT_SLOW_REQUEST_QUERIES),
+    )
+
+
+_missing = object()
+
+
+def count_queries(execute, sql, params, many, context):
+    # execute_wrapper of every connection, counts the query for the current request
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    return metrics(execute, sql, params, many, context)
+
+
+def install_query_counter(sender, connection, **kwargs):
+    # connection_created receiver, the wrappers outlive reconnections
+    if count_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_queries)
+
+
+def _counted(metrics, content):
+    # Chunks of a streaming response, the queries producing them count for the request
+    iterator = iter(content)
+    while True:
+        token = _current.set(metrics)
+        try:
+            chunk = next(iterator, _missing)
+        finally:
+            _current.reset(token)
+        if chunk is _missing:
+            return
+        yield chunk
+
+
+async def _acounted(metrics, content):
+    iterator = aiter(content)
+    while True:
+        token = _current.set(metrics)
+        try:
+            chunk = await anext(iterator, _missing)
+        finally:
+            _current.reset(token)
+        if chunk is _missing:
+            return
+        yield chunk
+
+
+class InstrumentationMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.process_response(request, response, metrics)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.process_response(request, response, metrics)
+
+    def process_response(self, request, response, metrics):
+        if response.streaming:
+            if response.is_async:
+                response.streaming_content = self.astream(request, response, metrics, response.streaming_content)
+            else:
+                response.streaming_content = self.stream(request, response, metrics, response.streaming_content)
+        else:
+            metrics.response_bytes = len(response.content)
+            self.finish(request, response, metrics)
+            response['Server-Timing'] = (
+                f'db;dur={metrics.db_time * 1000:.1f}, tpl;dur={metrics.template_time * 1000:.1f}, '
+                f'total;dur={metrics.duration * 1000:.1f}'
+            )
+        return response
+
+    def stream(self, request, response, metrics, content):
+        try:
+            for chunk in _counted(metrics, content):
+                metrics.response_bytes += len(chunk)
+                yield chunk
+        finally:
+            self.finish(request, response, metrics)
+
+    async def astream(self, request, response, metrics, content):
+        try:
+            async for chunk in _acounted(metrics, content):
+                metrics.response_bytes += len(chunk)
+                yield chunk
+        finally:
+            self.finish(request, response, metrics)
+
+    def finish(self, request, response, metrics):
+        metrics.duration = time.perf_counter() - metrics.start
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match and match.view_name else 'unresolved'
+        registry.observe(view, request.method, response.status_code, metrics)
+
+        slow_ms, slow_queries = get_thresholds()
+        if metrics.duration * 1000 >= slow_ms or metrics.queries >= slow_queries:
+            logger.warning(json.dumps({
+                'event': 'slow_request',
+                'view': view,
+                'method': request.method,
+                'path': request.get_full_path(),
+                'status': response.status_code,
+                **metrics.as_dict(),
+            }))
@@ -0,0 +1,144 @@
+from django.conf import settings
+from django.utils.functional import SimpleLazyObject
+
+'''
+
+Keyset (cursor) pagination for the HTML listings.
+
+Every page is fetched with a single "WHERE id > cursor ORDER BY id LIMIT n + 1"
+query, so the cost of a page does not depend on how many rows the table holds
+or how far the user has paged (unlike OFFSET pagination).
+
+
+'''
+
+DEFAULT_PAGE_SIZE = 25
+
+
+def get_page_size():
+    return getattr(settings, 'LISTING_PAGE_SIZE', DEFAULT_PAGE_SIZE)
+
+
+def _parse_cursor(value):
+    # Cursors are plain primary keys, anything else is ignored
+    try:
+        cursor = int(value)
+    except (TypeError, ValueError):
+        return None
+    return cursor if cursor >= 0 else None
+
+
+class KeysetPage:
+    '''
+    One page of a keyset paginated listing.
+
+    The page is iterable so templates can loop over it like a queryset.
+    next_query / previous_query are ready to use query strings (they keep the
+    cursors of the other listings rendered on the same page).
+    '''
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None, prefix='', params=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.prefix = prefix
+        self.params = params
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def _query(self, direction, cursor):
+        params = self.params.copy() if self.params is not None else None
+        if params is None:
+            return f'{self.prefix}_{direction}={cursor}'
+        params.pop(f'{self.prefix}_after', None)
+        params.pop(f'{self.prefix}_before', None)
+        params[f'{self.prefix}_{direction}'] = cursor
+        return params.urlencode()
+
+    @property
+    def next_query(self):
+        return self._query('after', self.next_cursor) if self.has_next else ''
+
+    @property
+    def previous_query(self):
+        return self._query('before', self.previous_cursor) if self.has_previous else ''
+
+
+def _page_rows(queryset, after, before, page_size):
+    # The rows of the page and one more, in the order they are fetched
+    if before is not None:
+        return queryset.filter(pk__lt=before).order_by('-pk')[:page_size + 1]
+    if after is not None:
+        queryset = queryset.filter(pk__gt=after)
+    return queryset.order_by('pk')[:page_size + 1]
+
+
+def _make_page(rows, after, before, page_size, prefix, params):
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if before is not None:
+        rows.reverse()
+        previous_cursor = rows[0].pk if rows and has_more else None
+        next_cursor = rows[-1].pk if rows else None
+    else:
+        next_cursor = rows[-1].pk if rows and has_more else None
+        # Coming from a cursor means there are rows before this page
+        previous_cursor = rows[0].pk if rows and after is not None else None
+    return KeysetPage(rows, next_cursor=next_cursor, previous_cursor=previous_cursor, prefix=prefix, params=params)
+
+
+def keyset_page(queryset, after=None, before=None, page_size=None, prefix='', params=None):
+    '''
+    Return the page of queryset that follows `after` (or precedes `before`).
+
+    The queryset is always ordered on the primary key so the index on it is used.
+    One extra row is fetched to find out whether there is another page.
+    '''
+    page_size = page_size or get_page_size()
+    rows = list(_page_rows(queryset, after, before, page_size))
+    return _make_page(rows, after, before, page_size, prefix, params)
+
+
+async def akeyset_page(queryset, after=None, before=None, page_size=None, prefix='', params=None):
+    '''
+    keyset_page for async views.
+    '''
+    page_size = page_size or get_page_size()
+    rows = [row async for row in _page_rows(queryset, after, before, page_size).aiterator()]
+    return _make_page(rows, after, before, page_size, prefix, params)
+
+
+def paginate_listing(request, queryset, prefix, page_size=None):
+    '''
+    Keyset paginate queryset using the `<prefix>_after` / `<prefix>_before`
+    GET parameters, so several listings can be paginated on the same page.
+
+    The page is only queried when the template uses it, a listing rendered
+    from a cached fragment costs no query.
+    '''
+    after = _parse_cursor(request.GET.get(f'{prefix}_after'))
+    before = _parse_cursor(request.GET.get(f'{prefix}_before'))
+    return SimpleLazyObject(
+        lambda: keyset_page(queryset, after=after, before=before, page_size=page_size, prefix=prefix, params=request.GET)
+    )
+
+
+async def apaginate_listing(request, queryset, prefix, page_size=None):
+    '''
+    paginate_listing for async views, the page is queried right away.
+    '''
+    after = _parse_cursor(request.GET.get(f'{prefix}_after'))
+    before = _parse_cursor(request.GET.get(f'{prefix}_before'))
+    return await akeyset_page(queryset, after=after, before=before, page_size=page_size, prefix=prefix, params=request.GET)
@@ -0,0 +1,123 @@
+import threading
+
+from django import forms
+from django.core.exceptions import ValidationError
+from django.forms.models import ModelChoiceIterator
+
+from employeemanagement_apk.conditional import aget_revisions, get_revisions, revision_key
+
+'''
+
+In-process cache of the lookup tables (Status, Position, Department).
+
+The forms and /api/lookups/ read the rows from memory. Every read checks the
+ModelRevision of the tables (one query for all of them, see
+conditional.get_revisions) and only reloads a table whose revision changed,
+so a change made by any process is seen by the next read.
+
+LookupChoiceField is a ModelChoiceField whose choices and validation come
+from this cache instead of a query per field. Forms using LookupFormMixin
+check all their lookup tables with one query. Async views load the tables
+with aget_tables and pass them to the form (tables=).
+
+
+'''
+
+_tables = {}
+_lock = threading.Lock()
+
+
+def get_tables(models, using=None):
+    '''
+    {model: (version, [instances ordered by pk], {pk: instance})}, the instances are shared, do not modify them.
+    '''
+    versions = {model: revision_key(*revision) for model, revision in get_revisions(models, using=using).items()}
+    tables = {}
+    for model in models:
+        cached = _tables.get((using, model))
+        if cached is None or cached[0] != versions[model]:
+            with _lock:
+                rows = list(model._default_manager.db_manager(using).order_by('pk'))
+                cached = _tables[(using, model)] = (versions[model], rows, {row.pk: row for row in rows})
+        tables[model] = cached
+    return tables
+
+
+async def aget_tables(models, using=None):
+    '''
+    get_tables for async views.
+    '''
+    revisions = await aget_revisions(models, using=using)
+    tables = {}
+    for model in models:
+        version = revision_key(*revisions[model])
+        cached = _tables.get((using, model))
+        if cached is None or cached[0] != version:
+            # No lock, it would block the event loop: concurrent reloads store equal tables
+            rows = [row async for row in model._default_manager.db_manager(using).order_by('pk').aiterator()]
+            cached = _tables[(using, model)] = (version, rows, {row.pk: row for row in rows})
+        tables[model] = cached
+    return tables
+
+
+def clear():
+    _tables.clear()
+
+
+class LookupChoiceIterator(ModelChoiceIterator):
+
+    def __iter__(self):
+        if self.field.empty_label is not None:
+            yield ('', self.field.empty_label)
+        for obj in self.field.get_rows():
+            yield self.choice(obj)
+
+    def __len__(self):
+        return len(self.field.get_rows()) + (1 if self.field.empty_label is not None else 0)
+
+    def __bool__(self):
+        return self.field.empty_label is not None or bool(self.field.get_rows())
+
+
+class LookupChoiceField(forms.ModelChoiceField):
+    '''
+    ModelChoiceField over all rows of a lookup table, served from the cache.
+    '''
+    iterator = LookupChoiceIterator
+    # (version, rows, {pk: row}), read once per form
+    table = None
+
+    def get_table(self):
+        if self.table is None:
+            model = self.queryset.model
+            self.table = get_tables([model])[model]
+        return self.table
+
+    def get_rows(self):
+        return self.get_table()[1]
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        model = self.queryset.model
+        try:
+            if isinstance(value, model):
+                value = value.pk
+            return self.get_table()[2][model._meta.pk.to_python(value)]
+        except (KeyError, ValueError, TypeError, ValidationError):
+            raise ValidationError(self.error_messages['invalid_choice'], code='invalid_choice', params={'value': value})
+
+
+class LookupFormMixin:
+    '''
+    Load the tables of every LookupChoiceField of the form with one revision check,
+    or use the tables given ({model: table}, from aget_tables).
+    '''
+
+    def __init__(self, *args, tables=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        fields = [field for field in self.fields.values() if isinstance(field, LookupChoiceField)]
+        if tables is None:
+            tables = get_tables(list(dict.fromkeys(field.queryset.model for field in fields)))
+        for field in fields:
+            field.table = tables[field.queryset.model]
@@ -0,0 +1,189 @@
+import asyncio
+import io
+import json
+import random
+import threading
+import time
+from wsgiref.util import setup_testing_defaults
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import override_settings
+
+from employeemanagement_apk.benchmarks import summarize, temporary_database
+from employeemanagement_apk.models import Employee, Department
+from employeemanagement_apk.seeding import seed_employees
+
+HOST = '127.0.0.1'
+
+# (name, sync view path, async view path), {employee} and {department} are random ids
+ENDPOINTS = [
+    ('employee list', '/api/employees/', '/api/async/employees/'),
+    ('employee detail', '/api/employees/{employee}/', '/api/async/employees/{employee}/'),
+    ('lookups', '/api/lookups/', '/api/async/lookups/'),
+    ('employee query', '/employee_query?department={department}', '/async/employee_query?department={department}'),
+]
+
+# (mode, handler, views)
+MODES = [
+    ('wsgi sync', 'wsgi', 'sync'),
+    ('asgi sync', 'asgi', 'sync'),
+    ('asgi async', 'asgi', 'async'),
+]
+
+
+def wsgi_get(handler, url):
+    path, _, query = url.partition('?')
+    environ = {'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': query, 'HTTP_HOST': HOST, 'wsgi.input': io.BytesIO()}
+    setup_testing_defaults(environ)
+    started = []
+    body = handler(environ, lambda status, headers, exc_info=None: started.append(status))
+    try:
+        b''.join(body)
+    finally:
+        body.close()
+    return int(started[0].split()[0])
+
+
+async def asgi_get(application, url):
+    path, _, query = url.partition('?')
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+        'path': path, 'raw_path': path.encode(), 'query_string': query.encode(), 'root_path': '',
+        'headers': [(b'host', HOST.encode())], 'client': (HOST, 50000), 'server': (HOST, 80),
+    }
+    requested = False
+    status = []
+
+    async def receive():
+        nonlocal requested
+        if not requested:
+            requested = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        # The client stays connected, the handler cancels this wait once it responded
+        await asyncio.Event().wait()
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            status.append(message['status'])
+
+    await application(scope, receive, send)
+    return status[0]
+
+
+class Command(BaseCommand):
+    help = ('Measure the throughput and latency of the read endpoints that have an async view (async_views.py) '
+            'with many concurrent clients: the sync views behind the WSGI handler (a thread per client, like a '
+            'threaded WSGI server), the sync views behind the ASGI handler and the async views behind the ASGI '
+            'handler (one event loop). The handlers are called in-process, without a server or sockets. '
+            'Runs on a temporary database with seeded employees, without the API response cache.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--employees', type=int, default=10000, help='Employees seeded for the run.')
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[100], help='Concurrent clients.')
+        parser.add_argument('--seconds', type=float, default=2.0, help='Duration of each run.')
+        parser.add_argument('--only', help='Only run the endpoints whose name contains this text.')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--json', action='store_true', help='Print the results as JSON.')
+
+    def urls(self, template, rng, count=1000):
+        return [template.format(employee=rng.choice(self.ids[Employee]), department=rng.choice(self.ids[Department])) for _ in range(count)]
+
+    def run_wsgi(self, urls, clients):
+        handler = WSGIHandler()
+        deadline = time.perf_counter() + self.options['seconds']
+        results = [{'timings': [], 'errors': 0} for _ in range(clients)]
+
+        def client(number, result):
+            try:
+                index = number
+                while time.perf_counter() < deadline:
+                    start = time.perf_counter()
+                    if wsgi_get(handler, urls[index % len(urls)]) != 200:
+                        result['errors'] += 1
+                    result['timings'].append((time.perf_counter() - start) * 1000)
+                    index += clients
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=client, args=(number, result)) for number, result in enumerate(results)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results, time.perf_counter() - started
+
+    def run_asgi(self, urls, clients):
+        application = ASGIHandler()
+
+        async def client(number, deadline, result):
+            index = number
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                if await asgi_get(application, urls[index % len(urls)]) != 200:
+                    result['errors'] += 1
+                result['timings'].append((time.perf_counter() - start) * 1000)
+                index += clients
+
+        async def main():
+            results = [{'timings': [], 'errors': 0} for _ in range(clients)]
+            deadline = time.perf_counter() + self.options['seconds']
+            started = time.perf_counter()
+            await asyncio.gather(*(client(number, deadline, result) for number, result in enumerate(results)))
+            elapsed = time.perf_counter() - started
+            # The connections of the ORM's database thread
+            await sync_to_async(connections.close_all)()
+            return results, elapsed
+
+        return asyncio.run(main())
+
+    def run(self, endpoint, mode, clients):
+        name, sync_path, async_path = endpoint
+        mode_name, handler, views = mode
+        urls = self.urls(async_path if views == 'async' else sync_path, random.Random(self.options['seed']))
+        if handler == 'wsgi':
+            results, elapsed = self.run_wsgi(urls, clients)
+        else:
+            results, elapsed = self.run_asgi(urls, clients)
+        timings = [timing for result in results for timing in result['timings']]
+        return {
+            'endpoint': name,
+            'mode': mode_name,
+            'clients': clients,
+            'errors': sum(result['errors'] for result in results),
+            **summarize(timings or [0], elapsed),
+        }
+
+    def handle(self, *args, **options):
+        self.options = options
+        if min(options['concurrency']) < 1 or options['seconds'] <= 0 or options['employees'] < 1:
+            raise CommandError('--employees, --concurrency and --seconds must be positive.')
+        endpoints = [endpoint for endpoint in ENDPOINTS if not options['only'] or options['only'] in endpoint[0]]
+        if not endpoints:
+            raise CommandError(f'No endpoint matches "{options["only"]}".')
+
+        results = []
+        # Every request runs its views and queries, none is answered from the API response cache,
+        # the slow request log would report most requests at this concurrency
+        overrides = {'API_CACHE': None, 'ALLOWED_HOSTS': [HOST], 'IMAGE_WORKERS': 0, 'SLOW_REQUEST_MS': float('inf'), 'SLOW_REQUEST_QUERIES': float('inf')}
+        with override_settings(**overrides), temporary_database():
+            seed_employees(options['employees'], seed=options['seed'], image_count=0)
+            self.ids = {model: list(model.objects.values_list('pk', flat=True)) for model in (Employee, Department)}
+            connection.close()
+            for clients in options['concurrency']:
+                for endpoint in endpoints:
+                    for mode in MODES:
+                        results.append(self.run(endpoint, mode, clients))
+                        if not options['json']:
+                            row = results[-1]
+                            self.stdout.write(
+                                f"{row['endpoint']:<16} {row['mode']:<11} {clients:>4} clients | {row['per_second']:>8}/s "
+                                f"errors {row['errors']:>4} | p50 {row['p50_ms']:>8} ms p99 {row['p99_ms']:>8} ms"
+                            )
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
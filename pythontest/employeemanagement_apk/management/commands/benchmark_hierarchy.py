@@ -0,0 +1,172 @@
+import json
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, reset_queries
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+
+from employeemanagement_apk import hierarchy
+from employeemanagement_apk.benchmarks import summarize, temporary_database
+from employeemanagement_apk.models import Employee, ReportingPath
+from employeemanagement_apk.seeding import seed_employees, tree_fanout
+
+# Managers per "reports_to IN (...)" query of the walks
+CHUNK_SIZE = 500
+
+
+def walk_levels(employee_id):
+    '''
+    [[ids of the direct reports], [their reports], ...], one query per level (and per chunk of a level).
+    '''
+    levels, level = [], [employee_id]
+    while level:
+        below = []
+        for start in range(0, len(level), CHUNK_SIZE):
+            below += Employee.objects.filter(reports_to__in=level[start:start + CHUNK_SIZE]).values_list('pk', flat=True)
+        if below:
+            levels.append(below)
+        level = below
+    return levels
+
+
+def walk_subtree(employee_id):
+    return [pk for level in walk_levels(employee_id) for pk in level]
+
+
+def walk_ancestors(employee_id):
+    # One query per manager up the line
+    line = []
+    manager_id = Employee.objects.filter(pk=employee_id).values_list('reports_to_id', flat=True).first()
+    while manager_id is not None:
+        line.append(manager_id)
+        manager_id = Employee.objects.filter(pk=manager_id).values_list('reports_to_id', flat=True).first()
+    return line
+
+
+def walk_span_of_control(employee_id):
+    levels = walk_levels(employee_id)
+    return {'direct_reports': len(levels[0]) if levels else 0, 'total_reports': sum(map(len, levels)), 'levels': len(levels)}
+
+
+# (operation, method, function of an employee id)
+OPERATIONS = [
+    ('subtree', 'closure', lambda pk: list(hierarchy.subtree(Employee.objects.all(), pk).values_list('pk', flat=True))),
+    ('subtree', 'walk', walk_subtree),
+    ('ancestors', 'closure', lambda pk: list(hierarchy.ancestors(Employee.objects.all(), pk).values_list('pk', flat=True))[1:]),
+    ('ancestors', 'walk', walk_ancestors),
+    ('span of control', 'closure', hierarchy.span_of_control),
+    ('span of control', 'walk', walk_span_of_control),
+]
+
+
+class Command(BaseCommand):
+    help = ('Measure the reporting hierarchy (hierarchy.py) on a seeded org tree: the subtree, the reporting line '
+            'and the span of control of employees at several depths, read from the closure table in one query and '
+            'by walking Employee.reports_to one level per query. Also times building the paths and moving '
+            'subtrees. Runs on a temporary database.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--employees', type=int, default=100000, help='Employees seeded for the run.')
+        parser.add_argument('--levels', type=int, default=10, help='Depth of the seeded reporting tree.')
+        parser.add_argument('--depths', type=int, nargs='+', help='Depths of the measured employees, default every third level.')
+        parser.add_argument('--samples', type=int, default=20, help='Employees measured per depth and operation.')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--json', action='store_true', help='Print the results as JSON.')
+
+    def write(self, row):
+        if self.options['json']:
+            return
+        if 'method' in row:
+            self.stdout.write(
+                f"{row['operation']:<16} depth {row['depth']:>2} {row['method']:<8} | {row['queries']:>6} queries "
+                f"{row['rows']:>7} rows | p50 {row['p50_ms']:>9} ms p99 {row['p99_ms']:>9} ms"
+            )
+        else:
+            self.stdout.write(f"{row['operation']:<16} {row['ms']:>10} ms  {row.get('detail', '')}")
+
+    def timed(self, operation, function, **detail):
+        start = time.perf_counter()
+        function()
+        row = {'operation': operation, 'ms': round((time.perf_counter() - start) * 1000, 1), **detail}
+        self.write(row)
+        return row
+
+    def measure(self, operation, method, function, depth, employee_ids):
+        # The query log is capped, counts past the cap would be wrong
+        reset_queries()
+        with CaptureQueriesContext(connection) as context:
+            result = function(employee_ids[0])
+        timings = []
+        for pk in employee_ids:
+            start = time.perf_counter()
+            function(pk)
+            timings.append((time.perf_counter() - start) * 1000)
+        row = {
+            'operation': operation, 'method': method, 'depth': depth,
+            'queries': len(context.captured_queries),
+            'rows': len(result) if isinstance(result, list) else result['total_reports'],
+            **summarize(timings),
+        }
+        self.write(row)
+        return row
+
+    def move_subtrees(self, rng, depth):
+        # Employees (and their subtrees) moved under another manager one level up, and back
+        candidates = self.at_depth(depth)
+        employees = list(Employee.objects.filter(pk__in=rng.sample(candidates, min(self.options['samples'], len(candidates)))))
+        managers = self.at_depth(depth - 1)
+        timings = []
+        for employee in employees:
+            for manager_id in (rng.choice(managers), employee.reports_to_id):
+                employee.reports_to_id = manager_id
+                reset_queries()
+                with CaptureQueriesContext(connection) as context:
+                    start = time.perf_counter()
+                    employee.save(update_fields=['reports_to', 'updated_at'])
+                    timings.append((time.perf_counter() - start) * 1000)
+        row = {
+            'operation': 'move', 'method': 'closure', 'depth': depth,
+            # Every query of the save, the updated row and the other signal receivers included
+            'queries': len(context.captured_queries),
+            'rows': sum(ReportingPath.objects.filter(ancestor=employee).count() for employee in employees) // len(employees),
+            **summarize(timings),
+        }
+        self.write(row)
+        return row
+
+    def at_depth(self, depth):
+        if depth not in self.depth_ids:
+            self.depth_ids[depth] = list(ReportingPath.objects.filter(ancestor=self.top, depth=depth).values_list('descendant_id', flat=True))
+        return self.depth_ids[depth]
+
+    def handle(self, *args, **options):
+        self.options = options
+        if options['employees'] < 2 or options['levels'] < 2 or options['samples'] < 1:
+            raise CommandError('--employees and --levels must be at least 2, --samples positive.')
+        depths = options['depths'] or list(range(0, options['levels'], 3))
+        if min(depths) < 0 or max(depths) >= options['levels']:
+            raise CommandError(f'--depths must be between 0 and {options["levels"] - 1}.')
+
+        rng = random.Random(options['seed'])
+        results = []
+        with override_settings(IMAGE_WORKERS=0), temporary_database():
+            fanout = tree_fanout(options['employees'], options['levels'])
+            results.append(self.timed(
+                'seed', lambda: seed_employees(options['employees'], seed=options['seed'], image_count=0, levels=options['levels']),
+                detail=f"{options['employees']} employees, {fanout} direct reports each",
+            ))
+            results.append(self.timed('rebuild paths', hierarchy.rebuild_paths, detail=f'{ReportingPath.objects.count()} paths'))
+            self.top = Employee.objects.get(reports_to=None)
+            self.depth_ids = {}
+
+            for depth in depths:
+                employee_ids = rng.choices(self.at_depth(depth), k=options['samples'])
+                for operation, method, function in OPERATIONS:
+                    results.append(self.measure(operation, method, function, depth, employee_ids))
+            for depth in [depth for depth in depths if depth > 0]:
+                results.append(self.move_subtrees(rng, depth))
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
@@ -0,0 +1,63 @@
+import json
+import random
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from employeemanagement_apk.models import Employee
+from employeemanagement_apk import search
+from employeemanagement_apk.benchmarks import measure
+from employeemanagement_apk.seeding import random_employee, FIRST_NAMES, LAST_NAMES
+
+
+class Command(BaseCommand):
+    help = ('Measure employee search latency at growing table sizes. '
+            'Rows are generated inside a transaction that is rolled back, the database is left untouched.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000, 1000000])
+        parser.add_argument('--queries', type=int, default=50, help='Searches per size.')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--json', action='store_true', help='Print the results as JSON.')
+
+    def time_queries(self, terms, run):
+        summary = measure(run, terms)
+        return {'p50_ms': summary['p50_ms'], 'p95_ms': summary['p95_ms']}
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        # Typed prefixes of real names, like a search-as-you-type box would send,
+        # plus a few searches without any match (the worst case for icontains).
+        terms = [rng.choice(FIRST_NAMES + LAST_NAMES)[:rng.randint(2, 5)] for _ in range(options['queries'])]
+        terms[::10] = ['qzx'] * len(terms[::10])
+        results = []
+
+        with transaction.atomic():
+            created = Employee.objects.count()
+            for size in sorted(options['sizes']):
+                while created < size:
+                    batch = [random_employee(rng) for _ in range(min(5000, size - created))]
+                    Employee.objects.bulk_create(batch)
+                    # bulk_create skips the signals, index the rows explicitly
+                    search.index_employees(batch)
+                    created += len(batch)
+
+                queryset = Employee.objects.all()
+                results.append({
+                    'employees': size,
+                    'search': self.time_queries(terms, lambda term: list(search.search_employees(queryset, term))),
+                    'icontains': self.time_queries(
+                        terms, lambda term: list(queryset.filter(name__icontains=term)[:search.get_result_limit()])
+                    ),
+                })
+                if not options['json']:
+                    row = results[-1]
+                    self.stdout.write(
+                        f"{size:>9} employees | search p50 {row['search']['p50_ms']:>8} ms "
+                        f"p95 {row['search']['p95_ms']:>8} ms | icontains p50 {row['icontains']['p50_ms']:>8} ms "
+                        f"p95 {row['icontains']['p95_ms']:>8} ms"
+                    )
+            transaction.set_rollback(True)
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
@@ -0,0 +1,153 @@
+import json
+import multiprocessing
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from employeemanagement_apk.benchmarks import summarize
+from employeemanagement_apk.sqlite import connect, get_pragmas
+
+PAGE_SIZE = 25
+
+
+def create_database(path, rows, pragmas, seed):
+    # A copy of the employee table shape, filled with generated rows
+    # (imported here: the worker processes only need the functions below, not the models)
+    from employeemanagement_apk.seeding import random_employee
+    rng = random.Random(seed)
+    connection = connect(path, pragmas)
+    connection.execute('CREATE TABLE employee (id INTEGER PRIMARY KEY, name TEXT, address TEXT, department_id INTEGER, updated_at REAL)')
+    connection.execute('CREATE INDEX employee_department ON employee (department_id, id)')
+    connection.execute('BEGIN')
+    connection.executemany('INSERT INTO employee (name, address, department_id, updated_at) VALUES (?, ?, ?, ?)', [
+        (employee.name, employee.address, rng.randint(1, 10), time.time()) for employee in (random_employee(rng) for _ in range(rows))
+    ])
+    connection.execute('COMMIT')
+    connection.close()
+
+
+def read(connection, rng, rows):
+    # A keyset page of a department, like /database and the list endpoints
+    after = rng.randint(0, rows)
+    connection.execute(
+        'SELECT id, name, address FROM employee WHERE department_id = ? AND id > ? ORDER BY id LIMIT ?',
+        (rng.randint(1, 10), after, PAGE_SIZE),
+    ).fetchall()
+
+
+def write(connection, rng, rows, transaction_mode):
+    # Read then update in one transaction, like a form or API save
+    connection.execute(f'BEGIN {transaction_mode}')
+    try:
+        pk = rng.randint(1, rows)
+        connection.execute('SELECT id, name FROM employee WHERE id = ?', (pk,)).fetchone()
+        connection.execute('UPDATE employee SET address = ?, updated_at = ? WHERE id = ?', (f'{rng.randint(1, 999)} Main St', time.time(), pk))
+        connection.execute('COMMIT')
+    except sqlite3.Error:
+        connection.execute('ROLLBACK')
+        raise
+
+
+def run_worker(path, rows, pragmas, transaction_mode, persistent, seconds, write_ratio, seed):
+    '''
+    Requests for `seconds`: {'reads', 'writes', 'locked', 'timings'}.
+    '''
+    rng = random.Random(seed)
+    result = {'reads': 0, 'writes': 0, 'locked': 0, 'timings': []}
+    connection = None
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            # Without persistent connections every request connects and runs the pragmas
+            if connection is None:
+                connection = connect(path, pragmas)
+            if rng.random() < write_ratio:
+                write(connection, rng, rows, transaction_mode)
+                result['writes'] += 1
+            else:
+                read(connection, rng, rows)
+                result['reads'] += 1
+        except sqlite3.OperationalError:
+            # database is locked
+            result['locked'] += 1
+        # connection is still None when connect itself hit the lock
+        if not persistent and connection is not None:
+            connection.close()
+            connection = None
+        result['timings'].append((time.perf_counter() - start) * 1000)
+    if connection is not None:
+        connection.close()
+    return result
+
+
+class Command(BaseCommand):
+    help = ('Measure SQLite read and write throughput with concurrent worker processes, with the SQLite and '
+            'Django defaults (rollback journal, a connection per request, deferred transactions) and with a '
+            'tuning profile of SQLITE_PROFILES (its pragmas, persistent connections, BEGIN IMMEDIATE). '
+            'Runs on a generated database in a temporary directory.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, nargs='+', default=[1, 4, 16])
+        parser.add_argument('--profile', default='tuned', help='SQLITE_PROFILES entry compared with the defaults.')
+        parser.add_argument('--seconds', type=float, default=3.0, help='Duration of each run.')
+        parser.add_argument('--write-ratio', type=float, default=0.2, help='Share of the requests that write.')
+        parser.add_argument('--rows', type=int, default=10000, help='Employees in the generated table.')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--json', action='store_true', help='Print the results as JSON.')
+
+    def run(self, setup, workers, directory):
+        options = self.options
+        path = os.path.join(directory, f'{setup["name"]}-{workers}.sqlite3')
+        create_database(path, options['rows'], setup['pragmas'], options['seed'])
+        arguments = [
+            (path, options['rows'], setup['pragmas'], setup['transaction_mode'], setup['persistent'],
+             options['seconds'], options['write_ratio'], options['seed'] + worker)
+            for worker in range(workers)
+        ]
+        started = time.perf_counter()
+        with multiprocessing.Pool(workers) as pool:
+            results = pool.starmap(run_worker, arguments)
+        elapsed = time.perf_counter() - started
+
+        timings = [timing for result in results for timing in result['timings']]
+        seconds = options['seconds']
+        return {
+            'setup': setup['name'],
+            'workers': workers,
+            'reads_per_second': round(sum(result['reads'] for result in results) / seconds, 1),
+            'writes_per_second': round(sum(result['writes'] for result in results) / seconds, 1),
+            'locked': sum(result['locked'] for result in results),
+            **{key: value for key, value in summarize(timings, elapsed).items() if key.endswith('_ms')},
+        }
+
+    def handle(self, *args, **options):
+        self.options = options
+        if not 0 <= options['write_ratio'] <= 1:
+            raise CommandError('--write-ratio must be between 0 and 1.')
+        if min(options['workers']) < 1 or options['rows'] < 1:
+            raise CommandError('--workers and --rows must be positive.')
+        setups = [
+            {'name': 'defaults', 'pragmas': {}, 'transaction_mode': 'DEFERRED', 'persistent': False},
+            {'name': options['profile'], 'pragmas': get_pragmas(options['profile']), 'transaction_mode': 'IMMEDIATE', 'persistent': True},
+        ]
+
+        results = []
+        with tempfile.TemporaryDirectory() as directory:
+            for workers in options['workers']:
+                for setup in setups:
+                    results.append(self.run(setup, workers, directory))
+                    if not options['json']:
+                        row = results[-1]
+                        self.stdout.write(
+                            f"{row['setup']:<10} {workers:>3} workers | reads {row['reads_per_second']:>9}/s "
+                            f"writes {row['writes_per_second']:>8}/s locked {row['locked']:>5} | "
+                            f"p50 {row['p50_ms']:>7} ms p99 {row['p99_ms']:>8} ms"
+                        )
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
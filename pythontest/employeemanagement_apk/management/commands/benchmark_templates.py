@@ -0,0 +1,100 @@
+import json
+import random
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import Client, override_settings
+
+from employeemanagement_apk.models import Employee, Department, Position, Status
+from employeemanagement_apk import search
+from employeemanagement_apk.benchmarks import measure
+from employeemanagement_apk.seeding import random_employee
+
+PAGES = ['/', '/about', '/database', '/employee_query']
+
+LOADERS = ['django.template.loaders.filesystem.Loader', 'django.template.loaders.app_directories.Loader']
+
+
+def template_settings(cached_loader):
+    templates = [dict(engine, OPTIONS=dict(engine.get('OPTIONS', {}))) for engine in settings.TEMPLATES]
+    for engine in templates:
+        engine.pop('APP_DIRS', None)
+        engine['OPTIONS']['loaders'] = [('django.template.loaders.cached.Loader', LOADERS)] if cached_loader else LOADERS
+    return templates
+
+
+def cache_settings(fragment_cache):
+    caches = dict(settings.CACHES)
+    # The fragments are stored in the default cache, a dummy cache stores nothing
+    caches['default'] = {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'benchmark'} if fragment_cache \
+        else {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}
+    return caches
+
+
+class Command(BaseCommand):
+    help = ('Measure the render time of the HTML pages without and with the cached template loader '
+            'and the template fragment cache. Rows are generated inside a transaction that is rolled back, '
+            'the database is left untouched.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--employees', type=int, default=1000, help='Employees in the table during the run.')
+        parser.add_argument('--requests', type=int, default=50, help='Requests per page and configuration.')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--json', action='store_true', help='Print the results as JSON.')
+
+    def time_page(self, client, url, requests):
+        # One request outside the timings: compiles the templates and fills the fragment cache
+        client.get(url)
+
+        def run(_):
+            response = client.get(url)
+            assert response.status_code == 200, f'{url} answered {response.status_code}'
+
+        summary = measure(run, range(requests))
+        return {'p50_ms': summary['p50_ms'], 'p95_ms': summary['p95_ms']}
+
+    def time_pages(self, user, requests, cached):
+        with override_settings(ALLOWED_HOSTS=['testserver'], TEMPLATES=template_settings(cached), CACHES=cache_settings(cached)):
+            client = Client()
+            client.force_login(user)
+            return {url: self.time_page(client, url, requests) for url in PAGES}
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        results = []
+
+        with transaction.atomic():
+            status = Status.objects.create(em_status='benchmark')
+            position = Position.objects.create(name='Benchmark', salary=1000)
+            department = Department.objects.create(name='Benchmark')
+            created = Employee.objects.count()
+            while created < options['employees']:
+                batch = [random_employee(rng) for _ in range(min(5000, options['employees'] - created))]
+                for employee in batch:
+                    employee.status, employee.position, employee.department = status, position, department
+                Employee.objects.bulk_create(batch)
+                search.index_employees(batch)
+                created += len(batch)
+            user = User.objects.create_user(username=f'benchmark-{rng.randint(0, 10 ** 9)}')
+
+            before = self.time_pages(user, options['requests'], cached=False)
+            after = self.time_pages(user, options['requests'], cached=True)
+            for url in PAGES:
+                results.append({
+                    'page': url,
+                    'before': before[url],
+                    'after': after[url],
+                    'speedup': round(before[url]['p50_ms'] / after[url]['p50_ms'], 2) if after[url]['p50_ms'] else None,
+                })
+                if not options['json']:
+                    row = results[-1]
+                    self.stdout.write(
+                        f"{url:<16} | before p50 {row['before']['p50_ms']:>8} ms p95 {row['before']['p95_ms']:>8} ms "
+                        f"| after p50 {row['after']['p50_ms']:>8} ms p95 {row['after']['p95_ms']:>8} ms | x{row['speedup']}"
+                    )
+            transaction.set_rollback(True)
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
@@ -0,0 +1,117 @@
+import json
+import random
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, OperationalError
+from django.test import override_settings
+
+from employeemanagement_apk.models import Employee
+from employeemanagement_apk import writes
+from employeemanagement_apk.benchmarks import summarize, temporary_database
+from employeemanagement_apk.seeding import random_employee, seed_lookups
+
+
+def create_employee(rng, statuses, departments):
+    employee = random_employee(rng)
+    employee.status = rng.choice(statuses)
+    employee.department = rng.choice(departments)
+    employee.save()
+    return employee.pk
+
+
+def update_employee(pk, address):
+    employee = Employee.objects.get(pk=pk)
+    employee.address = address
+    employee.save()
+
+
+class Command(BaseCommand):
+    help = ('Measure write operations per second with concurrent clients (threads of this process), writing '
+            'directly and through the write coalescing queue (writes.py). Half of the writes create an employee, '
+            'half update one, with every signal receiver. Runs on a temporary copy of the schema.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=16)
+        parser.add_argument('--seconds', type=float, default=3.0, help='Duration of each run.')
+        parser.add_argument('--profile', help='SQLITE_PROFILES entry to use instead of SQLITE_PROFILE.')
+        parser.add_argument('--batch-wait-ms', type=float, help='WRITE_BATCH_WAIT_MS of the coalesced run.')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--json', action='store_true', help='Print the results as JSON.')
+
+    def client(self, number, deadline, result):
+        rng = random.Random(self.options['seed'] + number)
+        statuses, departments = self.lookups
+        own = []
+        try:
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                try:
+                    if own and rng.random() < 0.5:
+                        writes.run(update_employee, rng.choice(own), f'{rng.randint(1, 999)} Main St')
+                    else:
+                        own.append(writes.run(create_employee, rng, statuses, departments))
+                    result['writes'] += 1
+                except OperationalError:
+                    # database is locked
+                    result['locked'] += 1
+                result['timings'].append((time.perf_counter() - start) * 1000)
+        finally:
+            connections.close_all()
+
+    def run(self, mode):
+        deadline = time.perf_counter() + self.options['seconds']
+        results = [{'writes': 0, 'locked': 0, 'timings': []} for _ in range(self.options['clients'])]
+        settings = {'WRITE_COALESCING': mode == 'coalesced'}
+        if self.options['batch_wait_ms'] is not None:
+            settings['WRITE_BATCH_WAIT_MS'] = self.options['batch_wait_ms']
+        before = writes.get_stats()
+        with override_settings(**settings):
+            threads = [threading.Thread(target=self.client, args=(number, deadline, result)) for number, result in enumerate(results)]
+            started = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - started
+            writes.stop()
+        after = writes.get_stats()
+
+        timings = [timing for result in results for timing in result['timings']]
+        batches = after['batches'] - before['batches']
+        return {
+            'mode': mode,
+            'clients': self.options['clients'],
+            'writes_per_second': round(sum(result['writes'] for result in results) / elapsed, 1),
+            'locked': sum(result['locked'] for result in results),
+            'writes_per_commit': round((after['writes'] - before['writes']) / batches, 1) if batches else 1,
+            **{key: value for key, value in summarize(timings or [0]).items() if key.endswith('_ms')},
+        }
+
+    def handle(self, *args, **options):
+        self.options = options
+        if options['clients'] < 1 or options['seconds'] <= 0:
+            raise CommandError('--clients and --seconds must be positive.')
+        if connection.vendor != 'sqlite':
+            raise CommandError('The benchmark measures SQLite lock contention, the default database is not SQLite.')
+
+        # Image processing runs after each commit in the writing thread, not on the pool
+        overrides = {'IMAGE_WORKERS': 0, **({'SQLITE_PROFILE': options['profile']} if options['profile'] else {})}
+        results = []
+        with override_settings(**overrides), temporary_database():
+            statuses, _, departments = seed_lookups()
+            self.lookups = ([status for status, _ in statuses], [department for department, _ in departments])
+            connections.close_all()
+            for mode in ('direct', 'coalesced'):
+                results.append(self.run(mode))
+                if not options['json']:
+                    row = results[-1]
+                    self.stdout.write(
+                        f"{mode:<10} {row['clients']:>3} clients | {row['writes_per_second']:>8} writes/s "
+                        f"locked {row['locked']:>5} | {row['writes_per_commit']:>6} writes/commit | "
+                        f"p50 {row['p50_ms']:>8} ms p99 {row['p99_ms']:>8} ms"
+                    )
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
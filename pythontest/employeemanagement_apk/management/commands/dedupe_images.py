@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from employeemanagement_apk.models import Employee
+from employeemanagement_apk.storage import is_content_addressed
+from employeemanagement_apk import blobs, caching
+
+
+class Command(BaseCommand):
+    help = (
+        'Move the employee images stored before the content addressed storage to their content '
+        'addressed names, so duplicates are stored once. The old files are left to gc_images.'
+    )
+
+    def handle(self, *args, **options):
+        storage = Employee._meta.get_field('image').storage
+        names = Employee.objects.exclude(image='').values_list('image', flat=True).distinct().order_by('image')
+        moved = missing = 0
+        for name in names.iterator():
+            if is_content_addressed(name):
+                continue
+            if not storage.exists(name):
+                missing += 1
+                self.stdout.write(self.style.WARNING(f'{name} does not exist.'))
+                continue
+            with storage.open(name, 'rb') as source:
+                new_name = storage.save(name, source)
+            with transaction.atomic():
+                employees = Employee.objects.filter(image=name)
+                pks = list(employees.values_list('pk', flat=True))
+                count = len(pks)
+                # Same content, the thumbnails stay valid, only their source name changes
+                for employee in employees.only('id', 'image_thumbnails').iterator():
+                    if employee.image_thumbnails.get('source') == name:
+                        employee.image_thumbnails['source'] = new_name
+                        Employee.objects.filter(pk=employee.pk).update(image_thumbnails=employee.image_thumbnails, updated_at=timezone.now())
+                employees.update(image=new_name, updated_at=timezone.now())
+                blobs.add_references([new_name] * count)
+                blobs.release_references([name] * count)
+                caching.invalidate(Employee, pks)
+            moved += 1
+        self.stdout.write(self.style.SUCCESS(f'Moved {moved} images ({missing} missing).'))
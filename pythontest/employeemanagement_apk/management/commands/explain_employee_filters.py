@@ -0,0 +1,74 @@
+import itertools
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from employeemanagement_apk.models import Employee
+from employeemanagement_apk.listing import get_page_size
+
+# Filters offered by employee_query (EmployeeFilterForm) plus the manager
+# filter of DepartmentForm. The values only matter for the query shape.
+FILTERS = {
+    'position': 1,
+    'department': 1,
+    'status': 1,
+}
+MANAGER_FILTER = {'manager': True}
+
+SCAN_RE = re.compile(r'\bSCAN (?P<table>\w+)(?: USING (?:COVERING )?INDEX (?P<index>\w+))?')
+
+
+def filter_combinations():
+    for size in range(1, len(FILTERS) + 1):
+        for names in itertools.combinations(FILTERS, size):
+            yield {name: FILTERS[name] for name in names}
+    yield MANAGER_FILTER
+
+
+def full_scans(plan):
+    '''
+    Return the lines of an EXPLAIN QUERY PLAN output that read the whole
+    Employee table (a scan of the table itself or of a non partial index).
+    '''
+    table = Employee._meta.db_table
+    partial_indexes = {index.name for index in Employee._meta.indexes if index.condition is not None}
+    lines = []
+    for line in plan.splitlines():
+        match = SCAN_RE.search(line)
+        if match and match.group('table') == table and match.group('index') not in partial_indexes:
+            lines.append(line.strip())
+    return lines
+
+
+class Command(BaseCommand):
+    help = ('Run EXPLAIN QUERY PLAN for every filter combination of employee_query '
+            'and fail if any of them scans the whole Employee table.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        using = options['database']
+        if connections[using].vendor != 'sqlite':
+            raise CommandError('EXPLAIN QUERY PLAN checks are only implemented for SQLite.')
+
+        base = Employee.objects.using(using).select_related('status', 'position', 'department')
+        failures = []
+        for filters in filter_combinations():
+            label = ', '.join(filters)
+            # Same shapes as the views: the keyset paginated listing and the plain filter
+            for shape, queryset in (
+                ('listing', base.filter(**filters).order_by('pk')[:get_page_size() + 1]),
+                ('filter', base.filter(**filters)),
+            ):
+                scans = full_scans(queryset.explain())
+                if scans:
+                    failures.append(f'{label} ({shape})')
+                    self.stdout.write(self.style.ERROR(f'FULL SCAN  {label} ({shape}): {"; ".join(scans)}'))
+                else:
+                    self.stdout.write(f'ok         {label} ({shape})')
+
+        if failures:
+            raise CommandError(f'{len(failures)} filter combination(s) fall back to a full scan: {", ".join(failures)}')
+        self.stdout.write(self.style.SUCCESS('Every filter combination uses an index.'))
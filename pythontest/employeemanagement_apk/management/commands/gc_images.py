@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from employeemanagement_apk import blobs
+
+
+class Command(BaseCommand):
+    help = 'Delete the stored employee images and thumbnails no employee uses any more.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace-period', type=int, default=None, help='Only delete files unused for this many seconds (default IMAGE_GC_GRACE_PERIOD).')
+        parser.add_argument('--recount', action='store_true', help='Rebuild the reference counts from the employees first.')
+        parser.add_argument('--dry-run', action='store_true', help='Only list what would be deleted.')
+
+    def handle(self, *args, **options):
+        if options['recount']:
+            self.stdout.write(f'Fixed {blobs.recount()} reference counts.')
+        deleted = blobs.collect_garbage(grace_period=options['grace_period'], dry_run=options['dry_run'])
+        if options['dry_run'] or options['verbosity'] > 1:
+            for name in deleted:
+                self.stdout.write(name)
+        verb = 'Would delete' if options['dry_run'] else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {len(deleted)} files.'))
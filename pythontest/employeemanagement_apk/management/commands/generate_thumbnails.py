@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from employeemanagement_apk.models import Employee
+from employeemanagement_apk import images
+
+
+class Command(BaseCommand):
+    help = 'Generate the missing or stale thumbnails of existing employee images.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Regenerate every thumbnail, even the current ones.')
+        parser.add_argument('--chunk-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        generated = failed = 0
+        employees = Employee.objects.exclude(image='').only('id', 'name', 'image', 'image_hash', 'image_thumbnails')
+        for employee in employees.iterator(chunk_size=options['chunk_size']):
+            if not options['force'] and images.thumbnails_are_current(employee):
+                continue
+            try:
+                images.update_thumbnails(employee, force=True)
+                generated += 1
+            except (OSError, ValueError) as error:
+                failed += 1
+                self.stdout.write(self.style.WARNING(f'Employee {employee.pk} ({employee.image.name}): {error}'))
+        self.stdout.write(self.style.SUCCESS(f'Generated thumbnails for {generated} employees ({failed} failed).'))
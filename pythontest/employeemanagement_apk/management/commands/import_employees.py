@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from employeemanagement_apk.imports import EmployeeImporter, CSVImportError, DEFAULT_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = 'Import employees from a CSV file in batches (see imports.py for the columns).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV file to import.')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help='Rows written per transaction.')
+        parser.add_argument('--checkpoint', help='Checkpoint file, defaults to <path>.checkpoint.')
+        parser.add_argument('--resume', action='store_true', help='Skip the rows recorded in the checkpoint file.')
+
+    def report(self, result):
+        self.stdout.write(f'{result.rows} rows read, {result.created} created, {result.skipped} skipped')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive.')
+        importer = EmployeeImporter(
+            batch_size=options['batch_size'],
+            checkpoint_path=options['checkpoint'] or f'{options["path"]}.checkpoint',
+            progress=self.report,
+        )
+        try:
+            with open(options['path'], newline='', encoding='utf-8-sig') as lines:
+                result = importer.run(lines, resume=options['resume'])
+        except (OSError, CSVImportError) as error:
+            raise CommandError(str(error))
+
+        for error in result.errors:
+            self.stdout.write(self.style.WARNING(f'line {error["line"]}: {error["errors"]}'))
+        self.stdout.write(self.style.SUCCESS(f'Imported {result.created} employees ({result.skipped} rows skipped).'))
@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from employeemanagement_apk.models import Employee, ImageStatus
+from employeemanagement_apk.images import process_image
+from employeemanagement_apk import caching
+
+
+class Command(BaseCommand):
+    help = (
+        'Process the pending employee images. The web process does this on its own worker pools, '
+        'run this command for the rows it did not finish (e.g. after a restart) or as a standalone worker.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retry', action='store_true', help='Also retry failed images and images left "processing" by a stopped worker.')
+        parser.add_argument('--watch', action='store_true', help='Keep polling for pending images.')
+        parser.add_argument('--interval', type=float, default=2.0, help='Seconds between two polls with --watch.')
+
+    def handle(self, *args, **options):
+        if options['retry']:
+            employees = Employee.objects.filter(image_status__in=[ImageStatus.FAILED, ImageStatus.PROCESSING])
+            pks = list(employees.values_list('pk', flat=True))
+            retried = employees.update(image_status=ImageStatus.PENDING, image_error='', updated_at=timezone.now())
+            caching.invalidate(Employee, pks)
+            self.stdout.write(f'Queued {retried} images again.')
+
+        while True:
+            processed = failed = 0
+            pending = Employee.objects.filter(image_status=ImageStatus.PENDING).order_by('pk').values_list('pk', flat=True)
+            for employee_id in pending.iterator():
+                if process_image(employee_id):
+                    processed += 1
+                elif Employee.objects.filter(pk=employee_id, image_status=ImageStatus.FAILED).exists():
+                    failed += 1
+            if processed or failed or not options['watch']:
+                self.stdout.write(self.style.SUCCESS(f'Processed {processed} images ({failed} failed).'))
+            if not options['watch']:
+                return
+            time.sleep(options['interval'])
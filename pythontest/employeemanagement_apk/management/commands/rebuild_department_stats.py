@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from employeemanagement_apk import reports
+
+
+class Command(BaseCommand):
+    help = 'Recompute the employee count and total salary of every department from the Employee table.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help='Only compare, exit with an error when a department is off.')
+
+    def handle(self, *args, **options):
+        if options['check']:
+            differences = reports.department_stats_differences()
+            for pk, (stored, actual) in sorted(differences.items()):
+                self.stdout.write(f'department={pk}: employees/salary {stored[0]}/{stored[1]} instead of {actual[0]}/{actual[1]}')
+            if differences:
+                raise CommandError(f'{len(differences)} departments are off, run rebuild_department_stats.')
+            self.stdout.write(self.style.SUCCESS('The department stats are up to date.'))
+            return
+        fixed = reports.rebuild_department_stats()
+        self.stdout.write(self.style.SUCCESS(f'Fixed {len(fixed)} departments.'))
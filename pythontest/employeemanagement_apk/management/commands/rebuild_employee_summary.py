@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from employeemanagement_apk import reports
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the headcount summary of the employee reports from the Employee table.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help='Only compare, exit with an error when the summary is off.')
+
+    def handle(self, *args, **options):
+        if options['check']:
+            differences = reports.summary_differences()
+            for (status_id, position_id, department_id), (stored, actual) in sorted(differences.items(), key=str):
+                self.stdout.write(f'status={status_id} position={position_id} department={department_id}: {stored} instead of {actual}')
+            if differences:
+                raise CommandError(f'{len(differences)} groups are off, run rebuild_employee_summary.')
+            self.stdout.write(self.style.SUCCESS('The summary is up to date.'))
+            return
+        with transaction.atomic():
+            reports.rebuild_summary()
+        self.stdout.write(self.style.SUCCESS('Rebuilt the employee summary.'))
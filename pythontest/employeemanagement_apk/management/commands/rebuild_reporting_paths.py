@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from employeemanagement_apk import hierarchy
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the reporting paths (the closure table of Employee.reports_to) from the Employee table.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help='Only compare, exit with an error when the paths are off.')
+
+    def handle(self, *args, **options):
+        if options['check']:
+            missing, extra = hierarchy.path_differences()
+            if missing or extra:
+                raise CommandError(f'{missing} paths are missing and {extra} should not exist, run rebuild_reporting_paths.')
+            self.stdout.write(self.style.SUCCESS('The reporting paths are up to date.'))
+            return
+        try:
+            hierarchy.rebuild_paths()
+        except hierarchy.HierarchyError as error:
+            raise CommandError(str(error))
+        self.stdout.write(self.style.SUCCESS('Rebuilt the reporting paths.'))
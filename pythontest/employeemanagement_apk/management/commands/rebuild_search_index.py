@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from employeemanagement_apk import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the employee search index from the Employee table.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default', help='Database alias to rebuild.')
+
+    def handle(self, *args, **options):
+        using = options['database']
+        if not search.has_search_table(using):
+            self.stdout.write(self.style.WARNING(f'No search index table on database "{using}", nothing to do.'))
+            return
+        count = search.rebuild_index(using=using)
+        self.stdout.write(self.style.SUCCESS(f'Indexed {count} employees.'))
@@ -0,0 +1,46 @@
+import time
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from employeemanagement_apk.replicas import get_replicas, refresh_replica
+
+
+class Command(BaseCommand):
+    help = ('Copy the default database into the SQLite read replicas (DATABASE_REPLICAS, or the --database '
+            'aliases) with the SQLite backup API, after stamping the replica heartbeat. With --interval the '
+            'copies are repeated every that many seconds until interrupted; keep it below '
+            'REPLICA_MAX_LAG_SECONDS or the replicas are skipped as stale between two copies.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', action='append', dest='aliases', help='Replica alias (repeatable), default DATABASE_REPLICAS.')
+        parser.add_argument('--interval', type=float, help='Repeat every this many seconds.')
+
+    def refresh(self, aliases):
+        for alias in aliases:
+            start = time.perf_counter()
+            try:
+                refresh_replica(alias)
+            except ImproperlyConfigured as error:
+                raise CommandError(str(error))
+            finally:
+                connections[alias].close()
+            if self.verbosity:
+                self.stdout.write(f'Refreshed {alias} in {(time.perf_counter() - start) * 1000:.1f} ms')
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        aliases = options['aliases'] or get_replicas()
+        if not aliases:
+            raise CommandError('No replica to refresh, list them in DATABASE_REPLICAS or pass --database.')
+        unknown = [alias for alias in aliases if alias not in connections.settings]
+        if unknown:
+            raise CommandError(f'Unknown database alias {", ".join(unknown)}.')
+        if options['interval'] is not None and options['interval'] <= 0:
+            raise CommandError('--interval must be positive.')
+
+        self.refresh(aliases)
+        while options['interval']:
+            time.sleep(options['interval'])
+            self.refresh(aliases)
@@ -0,0 +1,157 @@
+import json
+import platform
+import random
+import subprocess
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import Client, override_settings
+from django.test.client import encode_multipart, BOUNDARY
+from django.utils import timezone
+
+from employeemanagement_apk.models import Employee, Department, Position, Status
+from employeemanagement_apk.benchmarks import measure
+from employeemanagement_apk.seeding import seed_employees, FIRST_NAMES
+
+
+def git_commit():
+    try:
+        result = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True, text=True, timeout=10)
+    except OSError:
+        return None
+    return result.stdout.strip() or None
+
+
+class Command(BaseCommand):
+    help = ('Measure throughput and p50/p95/p99 latency of the HTML pages and of every API list, detail, '
+            'create and update endpoint against seeded employees. Everything runs inside a transaction '
+            'that is rolled back (only the shared seed pictures stay in MEDIA_ROOT). '
+            'Write the JSON report with --output and compare it with an earlier one with --baseline.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--employees', type=int, default=10000, help='Employees seeded for the run.')
+        parser.add_argument('--requests', type=int, default=50, help='Timed requests per case.')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--only', help='Only run the cases whose name contains this text.')
+        parser.add_argument('--output', help='Write the JSON report to this file.')
+        parser.add_argument('--baseline', help='JSON report of an earlier run, p50 regressions are reported.')
+        parser.add_argument('--tolerance', type=float, default=0.25, help='p50 increase over the baseline counted as a regression.')
+        parser.add_argument('--json', action='store_true', help='Print the JSON report instead of a table.')
+
+    def request(self, client, method, url, expected, **kwargs):
+        response = getattr(client, method)(url, **kwargs)
+        if response.status_code != expected:
+            raise CommandError(f'{method.upper()} {url} answered {response.status_code}, expected {expected}.')
+        if response.streaming:
+            b''.join(response.streaming_content)
+        return response
+
+    def cases(self, client, rng):
+        '''
+        {name: (run(argument), [arguments])}
+        '''
+        count = self.options['requests'] + 1
+        ids = {model: list(model.objects.values_list('pk', flat=True)) for model in (Employee, Position, Department, Status)}
+        sample = {model: [rng.choice(pks) for _ in range(count)] for model, pks in ids.items()}
+        department, status, position = ids[Department][0], ids[Status][-2], ids[Position][0]
+
+        def get(url, expected=200):
+            return lambda _: self.request(client, 'get', url, expected)
+
+        def multipart(data):
+            # The employee API only takes forms (it accepts an image upload), encoded here for PATCH too
+            return {'data': encode_multipart(BOUNDARY, data), 'content_type': f'multipart/form-data; boundary={BOUNDARY}'}
+
+        def as_json(data):
+            return {'data': json.dumps(data), 'content_type': 'application/json'}
+
+        repeated = [None] * count
+        cases = {
+            'html /database': (get('/database'), repeated),
+            'html /employee_query department': (get(f'/employee_query?department={department}'), repeated),
+            'html /employee_query status+position': (get(f'/employee_query?status={status}&position={position}'), repeated),
+            'html /employee_query search': (get(f'/employee_query?search={FIRST_NAMES[0][:3]}&department={department}'), repeated),
+            'api employees list expanded': (get('/api/employees/?expand=status,position,department'), repeated),
+        }
+
+        # (model, route, request body of the i-th create or update)
+        resources = [
+            (Employee, 'employees', lambda i: multipart({'name': f'Bench {i}', 'address': 'Main St', 'manager': 'false', 'status': status, 'department': department})),
+            (Position, 'positions', lambda i: as_json({'name': f'Bench {i}', 'salary': 1000 + i})),
+            (Department, 'departments', lambda i: as_json({'name': f'Bench {i}'})),
+            (Status, 'statuses', lambda i: as_json({'em_status': f'Bench {i}'})),
+        ]
+        for model, resource, body in resources:
+            url = f'/api/{resource}/'
+            cases[f'api {resource} list'] = (get(url), repeated)
+            cases[f'api {resource} detail'] = (lambda pk, url=url: self.request(client, 'get', f'{url}{pk}/', 200), sample[model])
+            cases[f'api {resource} create'] = (lambda i, url=url, body=body: self.request(client, 'post', url, 201, **body(i)), range(count))
+            cases[f'api {resource} update'] = (lambda pk, url=url, body=body: self.request(client, 'patch', f'{url}{pk}/', 200, **body(pk)), sample[model])
+
+        only = self.options['only']
+        return {name: case for name, case in cases.items() if not only or only in name}
+
+    def run_cases(self, cases):
+        results = {}
+        for name, (run, arguments) in cases.items():
+            arguments = list(arguments)
+            # The first call is not timed: compiles templates, warms the connection and the caches
+            run(arguments[0])
+            results[name] = measure(run, arguments[1:])
+            if not self.options['json']:
+                row = results[name]
+                self.stdout.write(
+                    f"{name:<40} {row['per_second']:>8}/s  p50 {row['p50_ms']:>8} ms  p95 {row['p95_ms']:>8} ms  p99 {row['p99_ms']:>8} ms"
+                )
+        return results
+
+    def compare(self, report, baseline_path):
+        with open(baseline_path) as baseline_file:
+            baseline = json.load(baseline_file)['results']
+        regressions = {}
+        for name, row in report['results'].items():
+            before = baseline.get(name)
+            if before and row['p50_ms'] > before['p50_ms'] * (1 + self.options['tolerance']):
+                regressions[name] = {'baseline_p50_ms': before['p50_ms'], 'p50_ms': row['p50_ms']}
+        return regressions
+
+    def handle(self, *args, **options):
+        self.options = options
+        if options['employees'] < 1 or options['requests'] < 1:
+            raise CommandError('--employees and --requests must be positive.')
+        rng = random.Random(options['seed'])
+
+        with transaction.atomic():
+            seed_employees(options['employees'], seed=options['seed'], image_count=3)
+            user = User.objects.create_user(username=f'benchmark-{options["seed"]}-{rng.randrange(10 ** 9)}')
+            with override_settings(ALLOWED_HOSTS=['testserver']):
+                client = Client()
+                client.force_login(user)
+                results = self.run_cases(self.cases(client, rng))
+            transaction.set_rollback(True)
+
+        report = {
+            'commit': git_commit(),
+            'created_at': timezone.now().isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': settings.DATABASES['default']['ENGINE'],
+            'employees': options['employees'],
+            'requests': options['requests'],
+            'seed': options['seed'],
+            'results': results,
+        }
+        if options['baseline']:
+            report['regressions'] = self.compare(report, options['baseline'])
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(report, output, indent=2)
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+        for name, regression in report.get('regressions', {}).items():
+            self.stdout.write(self.style.WARNING(f"{name}: p50 {regression['baseline_p50_ms']} ms -> {regression['p50_ms']} ms"))
+        if report.get('regressions'):
+            raise CommandError(f"{len(report['regressions'])} cases regressed by more than {options['tolerance']:.0%}.")
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from employeemanagement_apk.seeding import seed_employees, DEFAULT_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = ('Generate synthetic employees with realistic statuses, positions, departments, managers and '
+            'shared pictures (see seeding.py), in a reporting tree with --levels. The same --seed generates the same rows.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, required=True, help='Employees to create.')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--images', type=int, default=5, help='Distinct pictures shared by the employees, 0 for none.')
+        parser.add_argument('--levels', type=int, default=0, help='Depth of the reporting tree, 0 for none.')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help='Rows written per transaction.')
+
+    def handle(self, *args, **options):
+        if options['count'] < 1 or options['batch_size'] < 1 or options['levels'] < 0:
+            raise CommandError('--count and --batch-size must be positive, --levels cannot be negative.')
+        created = seed_employees(
+            options['count'], seed=options['seed'], image_count=options['images'], batch_size=options['batch_size'],
+            levels=options['levels'],
+            progress=lambda created: self.stdout.write(f'{created} employees created'),
+        )
+        self.stdout.write(self.style.SUCCESS(f'Created {created} employees.'))
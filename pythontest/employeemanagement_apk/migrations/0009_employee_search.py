@@ -0,0 +1,60 @@
+from django.db import migrations
+
+# Search index over Employee.name and Employee.address, see search.py.
+# The index is backend specific, so it is created with raw SQL for the
+# backends that support it and skipped everywhere else.
+
+SEARCH_TABLE = 'employeemanagement_apk_employee_search'
+EMPLOYEE_TABLE = 'employeemanagement_apk_employee'
+
+
+def sqlite_has_fts5(cursor):
+    cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+    if cursor.fetchone()[0]:
+        return True
+    # FTS5 may also be available as a loadable module
+    try:
+        cursor.execute('CREATE VIRTUAL TABLE temp.fts5_probe USING fts5(value)')
+        cursor.execute('DROP TABLE temp.fts5_probe')
+    except Exception:
+        return False
+    return True
+
+
+def create_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite' and sqlite_has_fts5(cursor):
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE {SEARCH_TABLE} USING fts5("
+                f"name, address, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+            )
+            cursor.execute(
+                f'INSERT INTO {SEARCH_TABLE} (rowid, name, address) '
+                f'SELECT id, name, address FROM {EMPLOYEE_TABLE}'
+            )
+        elif connection.vendor == 'postgresql':
+            cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+            cursor.execute(f'CREATE INDEX employee_name_trgm ON {EMPLOYEE_TABLE} USING gin (name gin_trgm_ops)')
+            cursor.execute(f'CREATE INDEX employee_address_trgm ON {EMPLOYEE_TABLE} USING gin (address gin_trgm_ops)')
+
+
+def drop_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(f'DROP TABLE IF EXISTS {SEARCH_TABLE}')
+        elif connection.vendor == 'postgresql':
+            cursor.execute('DROP INDEX IF EXISTS employee_name_trgm')
+            cursor.execute('DROP INDEX IF EXISTS employee_address_trgm')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('employeemanagement_apk', '0008_alter_department_manager'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
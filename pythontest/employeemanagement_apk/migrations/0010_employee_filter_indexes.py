@@ -0,0 +1,29 @@
+# Generated by Django 5.1.15 on 2026-10-18 06:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('employeemanagement_apk', '0009_employee_search'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='employee',
+            index=models.Index(fields=['department', 'status'], name='employee_department_status'),
+        ),
+        migrations.AddIndex(
+            model_name='employee',
+            index=models.Index(fields=['position', 'status'], name='employee_position_status'),
+        ),
+        migrations.AddIndex(
+            model_name='employee',
+            index=models.Index(fields=['department', 'position'], name='employee_department_position'),
+        ),
+        migrations.AddIndex(
+            model_name='employee',
+            index=models.Index(condition=models.Q(('manager', True)), fields=['id'], name='employee_manager'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.15 on 2026-10-18 06:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('employeemanagement_apk', '0011_employee_image_thumbnails'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='employee',
+            name='image_error',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.AddField(
+            model_name='employee',
+            name='image_status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('ready', 'Ready'), ('failed', 'Failed')], default='pending', editable=False, max_length=10),
+        ),
+    ]
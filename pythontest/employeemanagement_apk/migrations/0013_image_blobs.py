@@ -0,0 +1,42 @@
+# Generated by Django 5.1.15 on 2026-10-18 06:49
+
+import employeemanagement_apk.storage
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_references(apps, schema_editor):
+    # One blob per image already in use, legacy names included (see the dedupe_images command)
+    Employee = apps.get_model('employeemanagement_apk', 'Employee')
+    ImageBlob = apps.get_model('employeemanagement_apk', 'ImageBlob')
+    using = schema_editor.connection.alias
+    counts = Employee.objects.using(using).exclude(image='').values('image').annotate(references=Count('id'))
+    ImageBlob.objects.using(using).bulk_create(
+        [ImageBlob(name=row['image'], references=row['references']) for row in counts.iterator()],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('employeemanagement_apk', '0012_employee_image_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('references', models.PositiveIntegerField(default=0)),
+                ('released_at', models.DateTimeField(blank=True, default=None, null=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='employee',
+            name='image',
+            field=models.ImageField(storage=employeemanagement_apk.storage.image_storage, upload_to='images/'),
+        ),
+        migrations.RunPython(count_references, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.1.15 on 2026-10-18 06:54
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def create_revisions(apps, schema_editor):
+    # One row per model, changes only have to increment it
+    ModelRevision = apps.get_model('employeemanagement_apk', 'ModelRevision')
+    now = timezone.now()
+    ModelRevision.objects.using(schema_editor.connection.alias).bulk_create([
+        ModelRevision(label=f'employeemanagement_apk.{name}', revision=1, updated_at=now)
+        for name in ('employee', 'position', 'department', 'status')
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('employeemanagement_apk', '0013_image_blobs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ModelRevision',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('label', models.CharField(max_length=100, unique=True)),
+                ('revision', models.PositiveBigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='department',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AddField(
+            model_name='employee',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AddField(
+            model_name='position',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AddField(
+            model_name='status',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.RunPython(create_revisions, migrations.RunPython.noop),
+    ]
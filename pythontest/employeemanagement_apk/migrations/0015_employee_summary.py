@@ -0,0 +1,35 @@
+# Generated by Django 5.1.15 on 2026-10-18 06:59
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def summarize_employees(apps, schema_editor):
+    # Same as reports.rebuild_summary, with the historical models
+    Employee = apps.get_model('employeemanagement_apk', 'Employee')
+    EmployeeSummary = apps.get_model('employeemanagement_apk', 'EmployeeSummary')
+    using = schema_editor.connection.alias
+    groups = Employee.objects.using(using).values('status_id', 'position_id', 'department_id').annotate(headcount=Count('id')).order_by()
+    EmployeeSummary.objects.using(using).bulk_create([EmployeeSummary(**group) for group in groups.iterator()], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('employeemanagement_apk', '0014_model_revisions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmployeeSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('headcount', models.IntegerField(default=0)),
+                ('department', models.ForeignKey(default=None, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='employeemanagement_apk.department')),
+                ('position', models.ForeignKey(default=None, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='employeemanagement_apk.position')),
+                ('status', models.ForeignKey(default=None, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='employeemanagement_apk.status')),
+            ],
+        ),
+        migrations.RunPython(summarize_employees, migrations.RunPython.noop),
+    ]
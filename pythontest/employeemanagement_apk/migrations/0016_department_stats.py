@@ -0,0 +1,35 @@
+# Generated by Django 5.1.15 on 2026-10-18 07:01
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def count_employees(apps, schema_editor):
+    # Same as reports.rebuild_department_stats, with the historical models
+    Employee = apps.get_model('employeemanagement_apk', 'Employee')
+    Department = apps.get_model('employeemanagement_apk', 'Department')
+    using = schema_editor.connection.alias
+    rows = Employee.objects.using(using).exclude(department=None).values('department').annotate(count=Count('id'), salary=Sum('position__salary')).order_by()
+    for row in rows.iterator():
+        Department.objects.using(using).filter(pk=row['department']).update(employee_count=row['count'], total_salary=row['salary'] or 0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('employeemanagement_apk', '0015_employee_summary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='department',
+            name='employee_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='department',
+            name='total_salary',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_employees, migrations.RunPython.noop),
+    ]
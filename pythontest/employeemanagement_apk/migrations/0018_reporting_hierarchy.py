@@ -0,0 +1,43 @@
+# Generated by Django 5.1.15 on 2026-10-18 07:34
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def add_self_paths(apps, schema_editor):
+    # Every existing employee reports to nobody yet, its only path is to itself
+    Employee = apps.get_model('employeemanagement_apk', 'Employee')
+    ReportingPath = apps.get_model('employeemanagement_apk', 'ReportingPath')
+    using = schema_editor.connection.alias
+    ReportingPath.objects.using(using).bulk_create(
+        (ReportingPath(ancestor_id=pk, descendant_id=pk, depth=0) for pk in Employee.objects.using(using).values_list('pk', flat=True).iterator()),
+        batch_size=500,
+    )
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('employeemanagement_apk', '0017_replica_heartbeat'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='employee',
+            name='reports_to',
+            field=models.ForeignKey(blank=True, default=None, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='direct_reports', to='employeemanagement_apk.employee'),
+        ),
+        migrations.CreateModel(
+            name='ReportingPath',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('depth', models.PositiveSmallIntegerField()),
+                ('ancestor', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='descendant_paths', to='employeemanagement_apk.employee')),
+                ('descendant', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='ancestor_paths', to='employeemanagement_apk.employee')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['ancestor', 'depth'], name='reporting_path_ancestor'), models.Index(fields=['descendant', 'depth'], name='reporting_path_descendant')],
+                'constraints': [models.UniqueConstraint(fields=('ancestor', 'descendant'), name='reporting_path_unique')],
+            },
+        ),
+        migrations.RunPython(add_self_paths, migrations.RunPython.noop),
+    ]
@@ -1,13 +1,28 @@
 from django.db import models
 from django.core.exceptions import ValidationError
+from employeemanagement_apk.images import thumbnail_urls
+from employeemanagement_apk.storage import image_storage
 # Database schema for the employee management system
 # The schema contains four models: Status, Department, Position, and Employee.
 
 class Department(models.Model):
     name = models.CharField(max_length=100)
     manager = models.ForeignKey('Employee', on_delete=models.SET_NULL, null=True, default=None, blank=True, related_name='managed_department')
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+    # Denormalized roster of the department, maintained with the employee
+    # summary (see reports.py), rebuild_department_stats repairs them
+    employee_count = models.PositiveIntegerField(default=0, editable=False)
+    total_salary = models.BigIntegerField(default=0, editable=False)
+
+    STATS_FIELDS = ('employee_count', 'total_salary')
 
     def save(self, *args, **kwargs):
+        if not self._state.adding and not args and kwargs.get('update_fields') is None:
+            # The stats change under the instance, a full save must not write back the loaded values
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.STATS_FIELDS
+            ]
         if self.manager is not None:
             # Ensure the manager field refers to an Employee who is a manager
             if not self.manager.manager:  # self.manager is an Employee instance
@@ -23,6 +38,7 @@ class Position(models.Model):
     #  Contains position name (Text) and salary (Number).
     name = models.TextField(max_length=100, null=False)
     salary = models.IntegerField(null=False)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
     
     def __str__(self):
         return self.name
@@ -31,24 +47,125 @@ class Status(models.Model):
     # Contains the current status of the employee (e.g., in recruitmentprocess, waiting for onboarding, in probation period, normal, and resigned)
     # The status is a char field with a maximum length of 100 characters.
     em_status = models.CharField(max_length=100)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
     
     def __str__(self):
         return self.em_status
 
+class ImageStatus(models.TextChoices):
+    # Processing state of Employee.image, see images.process_image
+    PENDING = 'pending', 'Pending'
+    PROCESSING = 'processing', 'Processing'
+    READY = 'ready', 'Ready'
+    FAILED = 'failed', 'Failed'
+
 class Employee(models.Model):
     # Base Requirements: Contains employee name (Text), address (Text), manager (Boolean), status (Status model), and image (Image).
     name = models.CharField(max_length=100)
     address = models.TextField(max_length=200)
     manager = models.BooleanField(default=False)
     status = models.ForeignKey(Status, on_delete=models.SET_NULL, null=True, default=None)
-    image = models.ImageField(upload_to='images/')
+    image = models.ImageField(upload_to='images/', storage=image_storage)
+    # Derivatives of image (see images.py), filled after the upload is stored
+    image_hash = models.CharField(max_length=64, blank=True, default='', editable=False)
+    image_thumbnails = models.JSONField(blank=True, default=dict, editable=False)
+    # Uploads are verified and processed by a background worker (see tasks.py), poll these for the outcome
+    image_status = models.CharField(max_length=10, choices=ImageStatus.choices, default=ImageStatus.PENDING, editable=False)
+    image_error = models.TextField(blank=True, default='', editable=False)
     
     # Advacned Query: Contains department (Department model) and position (Position model).
     department = models.ForeignKey(Department, on_delete=models.SET_NULL, null=True, default=None, blank=True)
     position = models.ForeignKey(Position, on_delete=models.SET_NULL, null=True, default=None, blank=True)
+    # Reporting line, every (manager, report) pair at any depth is in ReportingPath (see hierarchy.py)
+    reports_to = models.ForeignKey('self', on_delete=models.SET_NULL, null=True, default=None, blank=True, related_name='direct_reports')
+
+    # Set on every save, QuerySet.update and bulk_update callers set it themselves.
+    # Detail ETags / Last-Modified are derived from it (see conditional.py).
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
     
+    class Meta:
+        # Indexes for the filter combinations of employee_query (see the
+        # explain_employee_filters command) and the manager choices of DepartmentForm.
+        indexes = [
+            models.Index(fields=['department', 'status'], name='employee_department_status'),
+            models.Index(fields=['position', 'status'], name='employee_position_status'),
+            models.Index(fields=['department', 'position'], name='employee_department_position'),
+            models.Index(fields=['id'], condition=models.Q(manager=True), name='employee_manager'),
+        ]
+
+    def __str__(self):
+        return self.name
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Values as loaded, tells the signal receivers which fields a save changed
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    @property
+    def thumbnails(self):
+        # {'small': {'webp': url, 'fallback': url}, 'medium': {...}}, empty until generated
+        return thumbnail_urls(self)
+
+class ReportingPath(models.Model):
+    # Closure table of Employee.reports_to: a row per employee and each of its
+    # managers up the reporting line (depth 1 is the direct manager), plus the
+    # employee itself at depth 0. Maintained by the signal receivers, see hierarchy.py.
+    ancestor = models.ForeignKey(Employee, on_delete=models.CASCADE, related_name='descendant_paths', db_index=False)
+    descendant = models.ForeignKey(Employee, on_delete=models.CASCADE, related_name='ancestor_paths', db_index=False)
+    depth = models.PositiveSmallIntegerField()
+
+    class Meta:
+        # Subtrees are read by ancestor, reporting lines by descendant
+        constraints = [models.UniqueConstraint(fields=['ancestor', 'descendant'], name='reporting_path_unique')]
+        indexes = [
+            models.Index(fields=['ancestor', 'depth'], name='reporting_path_ancestor'),
+            models.Index(fields=['descendant', 'depth'], name='reporting_path_descendant'),
+        ]
+
+    def __str__(self):
+        return f'{self.ancestor_id} > {self.descendant_id} ({self.depth})'
+
+class ImageBlob(models.Model):
+    # A stored image file (see storage.py) and the number of employees using it.
+    # Unreferenced blobs are deleted by the gc_images command (see blobs.py).
+    name = models.CharField(max_length=255, unique=True)
+    references = models.PositiveIntegerField(default=0)
+    # When references dropped to 0, blobs are only collected after a grace period
+    released_at = models.DateTimeField(null=True, blank=True, default=None)
+
     def __str__(self):
         return self.name
 
+class ModelRevision(models.Model):
+    # Revision of the rows of one model, incremented on every change (deletes
+    # included), the list ETags / Last-Modified are derived from it (see conditional.py).
+    label = models.CharField(max_length=100, unique=True)
+    revision = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField()
+
+    def __str__(self):
+        return f'{self.label} r{self.revision}'
+
+class ReplicaHeartbeat(models.Model):
+    # One row, stamped on the primary right before the replicas copy it (see
+    # replicas.py): the time on a replica tells how old its data is.
+    updated_at = models.DateTimeField()
 
+    def __str__(self):
+        return f'heartbeat {self.updated_at}'
 
+class EmployeeSummary(models.Model):
+    # Headcount of one (status, position, department) combination, kept up to
+    # date by the signal receivers so the reports read the groups instead of
+    # every employee (see reports.py). Payroll is headcount * position.salary.
+    # A combination can have several rows (a deleted status merges groups
+    # through SET_NULL), the reports sum them.
+    status = models.ForeignKey(Status, on_delete=models.SET_NULL, null=True, default=None, related_name='+')
+    position = models.ForeignKey(Position, on_delete=models.SET_NULL, null=True, default=None, related_name='+')
+    department = models.ForeignKey(Department, on_delete=models.SET_NULL, null=True, default=None, related_name='+')
+    headcount = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f'{self.status_id}/{self.position_id}/{self.department_id}: {self.headcount}'
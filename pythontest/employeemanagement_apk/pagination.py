@@ -0,0 +1,43 @@
+from rest_framework.pagination import CursorPagination
+
+'''
+
+Cursor pagination for the REST API.
+
+The cursor is an opaque, base64 encoded position in the ordering, so fetching
+the next page is a "WHERE id > position LIMIT n" query that costs the same no
+matter how deep the client has paged.
+
+The default page size comes from REST_FRAMEWORK['PAGE_SIZE'] in the settings,
+clients may ask for a different one with ?page_size= (capped at max_page_size).
+
+
+'''
+
+
+class KeysetCursorPagination(CursorPagination):
+    ordering = 'id'
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+        # Secondary orderings (e.g. ?ordering=name) are not unique, add the
+        # primary key as a tie breaker so every row has a stable position.
+        if ordering[0].lstrip('-') not in ('id', 'pk'):
+            tie_breaker = '-id' if ordering[0].startswith('-') else 'id'
+            ordering = ordering + (tie_breaker,)
+        return ordering
+
+
+class SubtreeCursorPagination(KeysetCursorPagination):
+    '''
+    Pages of hierarchy.subtree, ordered on the primary key as stored in the
+    closure table (report_id) so the (ancestor, descendant) index returns the
+    page in order, without sorting the whole subtree. ?ordering= is ignored.
+    '''
+    ordering = 'report_id'
+
+    def get_ordering(self, request, queryset, view):
+        # report_id is unique within a subtree, no tie breaker
+        return (self.ordering,)
@@ -0,0 +1,85 @@
+import io
+
+from PIL import Image, ImageOps
+
+'''
+
+Pillow work of the image processing (images.py): bytes in, bytes out.
+
+These functions hold the GIL while Pillow decodes and resizes, so they run
+on the worker processes of tasks.render, away from the request threads.
+The module must stay importable without Django being set up, the worker
+processes are spawned and only import what they unpickle.
+
+
+'''
+
+# Square thumbnails, twice the size they are displayed at (50px on
+# employee_query, 100px on database) so they stay sharp on HiDPI screens.
+THUMBNAIL_SIZES = {
+    'small': 100,
+    'medium': 200,
+}
+
+WEBP_QUALITY = 80
+JPEG_QUALITY = 85
+
+# Pillow format of a stored original -> (format it is re-encoded as, save options).
+# Other formats are only verified, never rewritten.
+ORIGINAL_FORMATS = {
+    'JPEG': ('JPEG', {'quality': 90, 'optimize': True}),
+    'MPO': ('JPEG', {'quality': 90, 'optimize': True}),
+    'PNG': ('PNG', {'optimize': True}),
+    'WEBP': ('WEBP', {'quality': 90}),
+}
+
+# Errors Pillow raises for truncated, corrupted or oversized files
+IMAGE_ERRORS = (OSError, ValueError, SyntaxError, Image.DecompressionBombError)
+
+
+def encode(image, image_format, **options):
+    output = io.BytesIO()
+    image.save(output, image_format, **options)
+    return output.getvalue()
+
+
+def render_thumbnails(data):
+    '''
+    [(size name, extension, bytes)] of every derivative of the image data.
+    '''
+    thumbnails = []
+    with Image.open(io.BytesIO(data)) as original:
+        original = ImageOps.exif_transpose(original)
+        has_alpha = original.mode in ('RGBA', 'LA') or (original.mode == 'P' and 'transparency' in original.info)
+        original = original.convert('RGBA' if has_alpha else 'RGB')
+
+        for size_name, size in THUMBNAIL_SIZES.items():
+            thumbnail = ImageOps.fit(original, (size, size), Image.LANCZOS)
+            thumbnails.append((size_name, 'webp', encode(thumbnail, 'WEBP', quality=WEBP_QUALITY, method=4)))
+            if has_alpha:
+                thumbnails.append((size_name, 'png', encode(thumbnail, 'PNG', optimize=True)))
+            else:
+                thumbnails.append((size_name, 'jpg', encode(thumbnail, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)))
+    return thumbnails
+
+
+def normalize(data, max_dimension):
+    '''
+    Verify the image data. Returns it re-encoded without metadata (EXIF, GPS)
+    and downscaled to max_dimension when needed, None when it can be kept as is.
+    '''
+    with Image.open(io.BytesIO(data)) as image:
+        image.verify()
+    # verify leaves the image unusable, it has to be opened again
+    with Image.open(io.BytesIO(data)) as image:
+        animated = getattr(image, 'n_frames', 1) > 1 and image.format != 'MPO'
+        if image.format not in ORIGINAL_FORMATS or animated:
+            return None
+        has_metadata = bool(image.getexif()) or 'exif' in image.info or 'xmp' in image.info
+        if not has_metadata and max(image.size) <= max_dimension:
+            return None
+        image_format, options = ORIGINAL_FORMATS[image.format]
+        # Apply the EXIF orientation before it is dropped
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+        return encode(image, image_format, **options)
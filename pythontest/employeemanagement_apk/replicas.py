@@ -0,0 +1,319 @@
+import contextvars
+import logging
+import random
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connections, DatabaseError, DEFAULT_DB_ALIAS
+from django.utils import timezone
+from rest_framework.permissions import SAFE_METHODS
+
+logger = logging.getLogger('employeemanagement_apk.replicas')
+
+'''
+
+Read replicas.
+
+DATABASE_REPLICAS in the settings lists the aliases of databases holding a
+copy of the default (primary) one. The listing and report views read this
+app's tables from one of them:
+
+    @replica_reads                      views.database, employee_query,
+                                        employee_report, the async views
+    with reading_from_replica():        EmployeeViewSet.list
+
+Every other read, every write, and the sessions and users read anywhere go
+to the primary (ReplicaRouter, in DATABASE_ROUTERS).
+
+Read your writes: once a request wrote, the rest of it reads from the
+primary, and ReplicaMiddleware pins the client to the primary for
+REPLICA_PIN_SECONDS (a cookie, so API clients without a session are pinned
+too). API responses read from a replica are not stored in the API cache, they
+may predate the invalidation of the write that replaced the cache token.
+
+Staleness: the ReplicaHeartbeat row of a replica is read before its first
+use and then every REPLICA_CHECK_SECONDS. A replica whose heartbeat is
+older than REPLICA_MAX_LAG_SECONDS, or that cannot be read, is skipped; with
+none left the reads go to the primary.
+
+The refresh_replicas command stamps the heartbeat on the primary and copies
+it into SQLite replicas with the backup API (--interval repeats it).
+
+
+'''
+
+APP_LABEL = 'employeemanagement_apk'
+PIN_COOKIE = 'primary_pin'
+
+DEFAULT_PIN_SECONDS = 5
+DEFAULT_MAX_LAG_SECONDS = 30
+DEFAULT_CHECK_SECONDS = 1
+
+
+def get_replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+def get_pin_seconds():
+    return getattr(settings, 'REPLICA_PIN_SECONDS', DEFAULT_PIN_SECONDS)
+
+
+def get_max_lag():
+    return getattr(settings, 'REPLICA_MAX_LAG_SECONDS', DEFAULT_MAX_LAG_SECONDS)
+
+
+def get_check_interval():
+    return getattr(settings, 'REPLICA_CHECK_SECONDS', DEFAULT_CHECK_SECONDS)
+
+
+class _Reads:
+    # Replica state of one request (or of a replica_reads block outside a request)
+
+    def __init__(self, pinned=False):
+        self.pinned = pinned
+        self.wrote = False
+        # Alias the reads of the current replica_reads block go to
+        self.replica = None
+
+
+_state = contextvars.ContextVar('replica_reads', default=None)
+
+# alias: (time.monotonic() of the check, lag in seconds then or None)
+_checks = {}
+
+
+def current_replica():
+    '''
+    Alias of the replica this code reads from, None on the primary.
+    '''
+    state = _state.get()
+    return state.replica if state is not None else None
+
+
+'''
+
+Staleness
+
+'''
+
+def get_lag(alias):
+    '''
+    Seconds since the heartbeat of the replica, None without a heartbeat or when it cannot be read.
+    '''
+    from employeemanagement_apk.models import ReplicaHeartbeat
+    try:
+        updated_at = ReplicaHeartbeat.objects.using(alias).values_list('updated_at', flat=True).first()
+    except DatabaseError as error:
+        logger.warning('Replica %s cannot be read: %s', alias, error)
+        return None
+    return (timezone.now() - updated_at).total_seconds() if updated_at else None
+
+
+async def aget_lag(alias):
+    from employeemanagement_apk.models import ReplicaHeartbeat
+    try:
+        updated_at = await ReplicaHeartbeat.objects.using(alias).values_list('updated_at', flat=True).afirst()
+    except DatabaseError as error:
+        logger.warning('Replica %s cannot be read: %s', alias, error)
+        return None
+    return (timezone.now() - updated_at).total_seconds() if updated_at else None
+
+
+def _due_checks():
+    now = time.monotonic()
+    return [alias for alias in get_replicas() if alias not in _checks or now - _checks[alias][0] >= get_check_interval()]
+
+
+def _pick():
+    # A random fresh replica, the lag grows by the time since its check
+    now = time.monotonic()
+    fresh = [
+        alias for alias in get_replicas()
+        if _checks[alias][1] is not None and _checks[alias][1] + now - _checks[alias][0] <= get_max_lag()
+    ]
+    return random.choice(fresh) if fresh else None
+
+
+def choose_replica():
+    '''
+    Alias of a fresh replica, None when there is none.
+    '''
+    for alias in _due_checks():
+        _checks[alias] = (time.monotonic(), get_lag(alias))
+    return _pick()
+
+
+async def achoose_replica():
+    for alias in _due_checks():
+        _checks[alias] = (time.monotonic(), await aget_lag(alias))
+    return _pick()
+
+
+def clear_checks():
+    _checks.clear()
+
+
+'''
+
+Routing
+
+'''
+
+def _use_replica(state):
+    return bool(get_replicas()) and not (state is not None and (state.pinned or state.wrote))
+
+
+@contextmanager
+def _reading(replica):
+    state = _state.get()
+    token = None
+    if state is None:
+        state = _Reads()
+        token = _state.set(state)
+    previous = state.replica
+    state.replica = replica
+    try:
+        yield
+    finally:
+        state.replica = previous
+        if token is not None:
+            _state.reset(token)
+
+
+@contextmanager
+def reading_from_replica():
+    '''
+    Read this app's tables from a fresh replica in the block, unless the client is pinned to the primary.
+    '''
+    with _reading(choose_replica() if _use_replica(_state.get()) else None):
+        yield
+
+
+def replica_reads(view):
+    '''
+    View decorator (sync or async views), the view reads from a replica (reading_from_replica).
+    '''
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            replica = await achoose_replica() if _use_replica(_state.get()) else None
+            with _reading(replica):
+                return await view(request, *args, **kwargs)
+    else:
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            with reading_from_replica():
+                return view(request, *args, **kwargs)
+    return wrapper
+
+
+class ReplicaRouter:
+    '''
+    Reads of this app's models in a replica_reads block go to its replica, writes go to the primary.
+    '''
+
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or state.replica is None or model._meta.app_label != APP_LABEL:
+            return None
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            # Related rows come from the database of the object
+            return instance._state.db
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            # The rest of the request reads its own write
+            state.wrote = True
+            state.replica = None
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db in get_replicas():
+            return DEFAULT_DB_ALIAS
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *get_replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas are copies of the primary, schema included
+        return False if db in get_replicas() else None
+
+
+class ReplicaMiddleware:
+    '''
+    Read your writes: clients that wrote read from the primary for REPLICA_PIN_SECONDS.
+    '''
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state = _Reads(pinned=PIN_COOKIE in request.COOKIES)
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self.pin(request, response, state)
+
+    async def __acall__(self, request):
+        state = _Reads(pinned=PIN_COOKIE in request.COOKIES)
+        token = _state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self.pin(request, response, state)
+
+    def pin(self, request, response, state):
+        # Writes made by the writer thread (writes.py) are not seen by the router, a successful
+        # unsafe request is assumed to have written
+        wrote = state.wrote or (request.method not in SAFE_METHODS and response.status_code < 400)
+        if wrote and get_replicas():
+            response.set_cookie(
+                PIN_COOKIE, '1', max_age=get_pin_seconds(), httponly=True, samesite='Lax',
+                secure=settings.SESSION_COOKIE_SECURE,
+            )
+        return response
+
+
+'''
+
+Refreshing SQLite replicas
+
+'''
+
+def beat(using=DEFAULT_DB_ALIAS):
+    from employeemanagement_apk.models import ReplicaHeartbeat
+    ReplicaHeartbeat.objects.using(using).update_or_create(pk=1, defaults={'updated_at': timezone.now()})
+
+
+def refresh_replica(alias, source=DEFAULT_DB_ALIAS):
+    '''
+    Copy the primary into the SQLite replica alias with the backup API, in one
+    step: the primary stays readable and writable meanwhile, the replica's
+    readers wait for the copy (busy_timeout) and then see all of it.
+    '''
+    source_connection, target_connection = connections[source], connections[alias]
+    if source_connection.vendor != 'sqlite' or target_connection.vendor != 'sqlite':
+        raise ImproperlyConfigured(f'Replica "{alias}" and its primary must be SQLite databases to be refreshed.')
+    beat(source)
+    source_connection.ensure_connection()
+    target_connection.ensure_connection()
+    source_connection.connection.backup(target_connection.connection)
+    _checks.pop(alias, None)
@@ -0,0 +1,293 @@
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Count, F, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from employeemanagement_apk.models import Employee, EmployeeSummary, Department, Position
+from employeemanagement_apk import caching
+
+'''
+
+Headcount and payroll reports, grouped by any combination of department,
+status and position.
+
+The reports are computed in the database from EmployeeSummary, one row per
+(status, position, department) combination holding its headcount, so they
+cost O(groups) instead of O(employees). Payroll is joined from
+Position.salary at query time, a salary change needs no summary update.
+
+The headcounts are adjusted by the signal receivers (signals.py) on every
+save, delete and bulk save of an employee, from the group the row was
+loaded with to its new one. The group of an instance that was not loaded
+with it (only() / defer(), built by hand) is read before the save with one
+query (load_groups), bulk_saved senders pass loaded instances. Code changing
+the status, position or department of employees with QuerySet.update must
+call adjust_summary or rebuild_summary itself. The rebuild_employee_summary
+command rebuilds (or checks) the table from the Employee table.
+
+source='live' computes the same report from the Employee table directly.
+
+The same deltas maintain Department.employee_count / total_salary in the
+same transaction, a save only updates the departments it moves an employee
+out of and into. A salary change or a deleted position recomputes the
+departments concerned from the summary (see refresh_department_stats), the
+rebuild_department_stats command repairs (or checks) them from the
+Employee table.
+
+
+'''
+
+# Group by name: (foreign key, label field)
+DIMENSIONS = {
+    'department': ('department', 'department__name'),
+    'status': ('status', 'status__em_status'),
+    'position': ('position', 'position__name'),
+}
+
+SOURCES = ('summary', 'live')
+
+GROUP_FIELDS = ('status_id', 'position_id', 'department_id')
+
+
+class ReportError(ValueError):
+    pass
+
+
+def employee_group(employee):
+    return tuple(getattr(employee, field) for field in GROUP_FIELDS)
+
+
+def loaded_group(employee):
+    # The group the row had when it was loaded, None if unknown
+    loaded = getattr(employee, '_loaded_values', None)
+    if loaded is None or any(field not in loaded for field in GROUP_FIELDS):
+        return None
+    return tuple(loaded[field] for field in GROUP_FIELDS)
+
+
+def load_groups(employees, using='default'):
+    '''
+    Read the stored group of the employees whose loaded group is unknown, one query for all of them.
+    '''
+    unknown = {employee.pk: employee for employee in employees if employee.pk is not None and loaded_group(employee) is None}
+    if not unknown:
+        return
+    for pk, *group in Employee.objects.using(using).filter(pk__in=list(unknown)).values_list('pk', *GROUP_FIELDS):
+        employee = unknown[pk]
+        employee._loaded_values = {**getattr(employee, '_loaded_values', {}), **dict(zip(GROUP_FIELDS, group))}
+
+
+def remember_group(employee):
+    # The row is now in its current group, for the next save of the same instance
+    employee._loaded_values = {**getattr(employee, '_loaded_values', {}), **dict(zip(GROUP_FIELDS, employee_group(employee)))}
+
+
+def _group_filter(group):
+    return {
+        (f'{field}__isnull' if value is None else field): (True if value is None else value)
+        for field, value in zip(GROUP_FIELDS, group)
+    }
+
+
+def adjust_summary(deltas, using='default'):
+    '''
+    Add {group: delta} to the headcounts, group being (status_id, position_id, department_id).
+    '''
+    deltas = {group: delta for group, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    summaries = EmployeeSummary.objects.using(using)
+    with transaction.atomic(using=using):
+        for group, delta in deltas.items():
+            # A group can have several rows (see EmployeeSummary), any of them takes the delta
+            pk = summaries.filter(**_group_filter(group)).order_by('pk').values_list('pk', flat=True).first()
+            if pk is None:
+                summaries.create(headcount=delta, **dict(zip(GROUP_FIELDS, group)))
+            else:
+                summaries.filter(pk=pk).update(headcount=F('headcount') + delta)
+        summaries.filter(headcount=0).delete()
+        adjust_department_stats(deltas, using=using)
+
+
+def adjust_department_stats(deltas, using='default'):
+    position_ids = {position_id for _, position_id, department_id in deltas if position_id and department_id}
+    salaries = dict(Position.objects.using(using).filter(pk__in=position_ids).values_list('pk', 'salary')) if position_ids else {}
+    changes = {}
+    for (_, position_id, department_id), delta in deltas.items():
+        if department_id is not None:
+            count, salary = changes.get(department_id, (0, 0))
+            changes[department_id] = (count + delta, salary + delta * salaries.get(position_id, 0))
+    changes = {department_id: change for department_id, change in changes.items() if change != (0, 0)}
+    if not changes:
+        return
+    now = timezone.now()
+    for department_id, (count, salary) in changes.items():
+        Department.objects.using(using).filter(pk=department_id).update(
+            employee_count=F('employee_count') + count, total_salary=F('total_salary') + salary, updated_at=now,
+        )
+    caching.invalidate(Department, list(changes), using=using)
+
+
+def employees_changed(employees, created, using='default'):
+    '''
+    Adjust the summary for saved employees, updated ones move out of the group they were loaded with.
+    '''
+    deltas = Counter()
+    for employee in employees:
+        if not created:
+            old = loaded_group(employee)
+            if old is None:
+                # After the save the previous group can no longer be read
+                raise ReportError(f'The previous group of {employee!r} is unknown, call load_groups before saving it.')
+            deltas[old] -= 1
+        deltas[employee_group(employee)] += 1
+    adjust_summary(deltas, using=using)
+    for employee in employees:
+        remember_group(employee)
+
+
+def employees_deleted(employees, using='default'):
+    deltas = Counter()
+    for employee in employees:
+        deltas[loaded_group(employee) or employee_group(employee)] -= 1
+    adjust_summary(deltas, using=using)
+
+
+def summarize_employees(using='default'):
+    return Employee.objects.using(using).values(*GROUP_FIELDS).annotate(headcount=Count('id')).order_by()
+
+
+def rebuild_summary(using='default'):
+    summaries = EmployeeSummary.objects.using(using)
+    summaries.all().delete()
+    summaries.bulk_create([EmployeeSummary(**group) for group in summarize_employees(using).iterator()], batch_size=500)
+
+
+def summary_differences(using=None):
+    '''
+    {group: (summary headcount, actual headcount)} of the groups that are off.
+    '''
+    expected = {tuple(row[field] for field in GROUP_FIELDS): row['headcount'] for row in summarize_employees(using)}
+    stored = Counter()
+    for row in EmployeeSummary.objects.using(using).values(*GROUP_FIELDS, 'headcount'):
+        stored[tuple(row[field] for field in GROUP_FIELDS)] += row['headcount']
+    return {
+        group: (stored.get(group, 0), expected.get(group, 0))
+        for group in set(stored) | set(expected)
+        if stored.get(group, 0) != expected.get(group, 0)
+    }
+
+
+def department_stats(department_ids=None, live=False, using=None):
+    '''
+    {department_id: (employee_count, total_salary)}, from the summary or (live) the Employee table.
+    '''
+    if live:
+        rows = Employee.objects.using(using).exclude(department=None).values('department_id').annotate(
+            count=Count('id'), salary=Coalesce(Sum('position__salary'), Value(0)),
+        )
+    else:
+        rows = EmployeeSummary.objects.using(using).exclude(department=None).values('department_id').annotate(
+            count=Sum('headcount'), salary=Coalesce(Sum(F('headcount') * F('position__salary')), Value(0)),
+        )
+    if department_ids is not None:
+        rows = rows.filter(department_id__in=department_ids)
+    return {row['department_id']: (row['count'], row['salary']) for row in rows.order_by()}
+
+
+def _write_department_stats(stats, departments, using):
+    now = timezone.now()
+    changed = []
+    for pk, employee_count, total_salary in departments.values_list('pk', *Department.STATS_FIELDS):
+        expected = stats.get(pk, (0, 0))
+        if (employee_count, total_salary) != expected:
+            Department.objects.using(using).filter(pk=pk).update(employee_count=expected[0], total_salary=expected[1], updated_at=now)
+            changed.append(pk)
+    if changed:
+        caching.invalidate(Department, changed, using=using)
+    return changed
+
+
+def refresh_department_stats(department_ids, using='default'):
+    '''
+    Recompute the stats of the departments from the summary (O(groups)).
+    '''
+    department_ids = list(department_ids)
+    if department_ids:
+        with transaction.atomic(using=using):
+            stats = department_stats(department_ids, using=using)
+            _write_department_stats(stats, Department.objects.using(using).filter(pk__in=department_ids), using)
+
+
+def departments_with_positions(position_ids, using='default'):
+    return set(
+        EmployeeSummary.objects.using(using).filter(position_id__in=position_ids)
+        .exclude(department=None).values_list('department_id', flat=True).distinct()
+    )
+
+
+def rebuild_department_stats(using='default'):
+    '''
+    Recompute every department from the Employee table, returns the pks of the departments fixed.
+    '''
+    with transaction.atomic(using=using):
+        return _write_department_stats(department_stats(live=True, using=using), Department.objects.using(using), using)
+
+
+def department_stats_differences(using=None):
+    '''
+    {department_id: (stored, actual)} of the departments whose stats are off.
+    '''
+    stats = department_stats(live=True, using=using)
+    return {
+        pk: ((employee_count, total_salary), stats.get(pk, (0, 0)))
+        for pk, employee_count, total_salary in Department.objects.using(using).values_list('pk', *Department.STATS_FIELDS)
+        if (employee_count, total_salary) != stats.get(pk, (0, 0))
+    }
+
+
+def parse_group_by(value):
+    names = [name.strip() for name in (value or '').split(',') if name.strip()]
+    unknown = [name for name in names if name not in DIMENSIONS]
+    if unknown:
+        raise ReportError(f'Unknown group_by {", ".join(unknown)}, choose from {", ".join(DIMENSIONS)}.')
+    # Keep the given order, drop repeats
+    return list(dict.fromkeys(names))
+
+
+def employee_report(group_by=(), source='summary', using=None):
+    '''
+    {'group_by': [...], 'results': [{<dimension>: {'id', 'name'}, 'headcount', 'payroll'}], 'total': {...}}
+    The router picks the database unless using is given (a replica in the views, see replicas.py).
+    '''
+    if source not in SOURCES:
+        raise ReportError(f'Unknown source {source}, choose from {", ".join(SOURCES)}.')
+    if source == 'summary':
+        queryset = EmployeeSummary.objects.using(using)
+        headcount, payroll = Sum('headcount'), Sum(F('headcount') * F('position__salary'))
+    else:
+        queryset = Employee.objects.using(using)
+        headcount, payroll = Count('id'), Sum('position__salary')
+    # Not named headcount, the summary has a field of that name
+    aggregates = {'total_headcount': Coalesce(headcount, Value(0)), 'total_payroll': Coalesce(payroll, Value(0))}
+
+    total = queryset.aggregate(**aggregates)
+    total = {'headcount': total['total_headcount'], 'payroll': total['total_payroll']}
+    report = {'group_by': list(group_by), 'source': source, 'results': [total] if total['headcount'] else [], 'total': total}
+    if not group_by:
+        return report
+
+    fields = [field for name in group_by for field in DIMENSIONS[name]]
+    rows = queryset.values(*fields).annotate(**aggregates).filter(total_headcount__gt=0).order_by(*fields)
+    report['results'] = []
+    for row in rows:
+        result = {}
+        for name in group_by:
+            key, label = DIMENSIONS[name]
+            result[name] = {'id': row[key], 'name': row[label]} if row[key] is not None else None
+        result['headcount'] = row['total_headcount']
+        result['payroll'] = row['total_payroll']
+        report['results'].append(result)
+    return report
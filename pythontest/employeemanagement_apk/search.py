@@ -0,0 +1,210 @@
+import re
+
+from django.conf import settings
+from django.db import connections, router
+from django.db.models import Case, When, Q, Value, FloatField
+from django.db.models.functions import Greatest
+from django.db.models.expressions import RawSQL
+
+from employeemanagement_apk.models import Employee
+
+'''
+
+Employee search over name and address.
+
+SQLite:     an FTS5 table (created by migration 0009) mirrors Employee.name and
+            Employee.address, it is kept in sync by the signals in signals.py.
+            Every search term is matched as a prefix and results are ranked
+            with bm25, name matches weigh more than address matches. Searches
+            matching more than SEARCH_RANK_CANDIDATES rows are not scored
+            (name matches come first) so latency does not grow with the table.
+PostgreSQL: trigram similarity, backed by the GIN trigram indexes created by
+            the same migration.
+Others:     plain icontains filtering (no index, no ranking).
+
+
+'''
+
+SEARCH_TABLE = 'employeemanagement_apk_employee_search'
+
+DEFAULT_RESULT_LIMIT = 100
+DEFAULT_RANK_CANDIDATES = 1000
+
+# bm25 weights for the name and address columns
+NAME_WEIGHT = 10.0
+ADDRESS_WEIGHT = 1.0
+
+# Aliases whose database has the FTS5 table, filled on first use
+_fts_available = {}
+
+
+def get_result_limit():
+    return getattr(settings, 'SEARCH_RESULT_LIMIT', DEFAULT_RESULT_LIMIT)
+
+
+def get_rank_candidates():
+    return getattr(settings, 'SEARCH_RANK_CANDIDATES', DEFAULT_RANK_CANDIDATES)
+
+
+def has_search_table(using):
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return False
+    if using not in _fts_available:
+        with connection.cursor() as cursor:
+            _fts_available[using] = SEARCH_TABLE in connection.introspection.table_names(cursor)
+    return _fts_available[using]
+
+
+def build_match_query(term):
+    '''
+    Turn user input into an FTS5 query: every word must match as a prefix.
+    Quoting each word keeps FTS5 operators typed by the user from being parsed.
+    '''
+    words = re.findall(r'\w+', term)
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def _preserve_order(queryset, ids):
+    if not ids:
+        return queryset.none()
+    ordering = Case(*[When(pk=pk, then=position) for position, pk in enumerate(ids)])
+    return queryset.filter(pk__in=ids).order_by(ordering)
+
+
+def _search_fts(queryset, term, limit, using):
+    match = build_match_query(term)
+    if not match:
+        return queryset.none()
+    filtered = bool(queryset.query.where)
+    candidates = get_rank_candidates()
+
+    with connections[using].cursor() as cursor:
+        # Only look at the first candidates + 1 matches to find out whether
+        # the search is precise enough to be ranked.
+        cursor.execute(f'SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s LIMIT %s', [match, candidates + 1])
+        precise = len(cursor.fetchall()) <= candidates
+        if precise:
+            cursor.execute(
+                f'SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s ORDER BY bm25({SEARCH_TABLE}, %s, %s)',
+                [match, NAME_WEIGHT, ADDRESS_WEIGHT],
+            )
+            ranked = [row[0] for row in cursor.fetchall()]
+
+    if precise:
+        if filtered:
+            # Apply the other filters (position, department, ...) before the limit
+            allowed = set(queryset.filter(pk__in=ranked).values_list('pk', flat=True))
+            ranked = [pk for pk in ranked if pk in allowed]
+        return _preserve_order(queryset, ranked[:limit])
+
+    # Broad searches (e.g. a two letter prefix) can match a large part of the
+    # table and bm25 has to score every match, so instead of ranking them the
+    # name matches are listed before the address only matches.
+    ids = []
+    for column_match in (f'name : ({match})', f'address : ({match}) NOT name : ({match})'):
+        subquery = f'SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s'
+        params = [column_match]
+        if not filtered:
+            subquery += ' LIMIT %s'
+            params.append(limit - len(ids))
+        ids += queryset.filter(pk__in=RawSQL(subquery, params)).order_by('pk').values_list('pk', flat=True)[:limit - len(ids)]
+        if len(ids) >= limit:
+            break
+    return _preserve_order(queryset, ids)
+
+
+def _search_trigram(queryset, term, limit):
+    from django.contrib.postgres.search import TrigramSimilarity
+
+    return queryset.filter(
+        Q(name__icontains=term) | Q(address__icontains=term)
+    ).annotate(
+        rank=Greatest(TrigramSimilarity('name', term), TrigramSimilarity('address', term) * Value(0.5, output_field=FloatField()))
+    ).order_by('-rank', 'pk')[:limit]
+
+
+def search_employees(queryset, term, limit=None):
+    '''
+    Return the employees of queryset matching term, best matches first.
+    At most `limit` (default settings.SEARCH_RESULT_LIMIT) rows are returned.
+    '''
+    limit = limit or get_result_limit()
+    term = term.strip()
+    using = queryset.db
+    vendor = connections[using].vendor
+
+    if has_search_table(using):
+        return _search_fts(queryset, term, limit, using)
+    if vendor == 'postgresql':
+        return _search_trigram(queryset, term, limit)
+    return queryset.filter(Q(name__icontains=term) | Q(address__icontains=term)).order_by('pk')[:limit]
+
+
+def filter_matches(queryset, term):
+    '''
+    Every employee of queryset matching term (same matches as search_employees),
+    unranked and unlimited. A filter on a subquery of the search index, for the
+    exports: no primary keys are loaded.
+    '''
+    term = term.strip()
+    using = queryset.db
+    if has_search_table(using):
+        match = build_match_query(term)
+        if not match:
+            return queryset.none()
+        return queryset.filter(pk__in=RawSQL(f'SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s', [match]))
+    return queryset.filter(Q(name__icontains=term) | Q(address__icontains=term))
+
+
+'''
+
+Index maintenance (SQLite only, PostgreSQL indexes are maintained by the database)
+
+
+'''
+
+def index_employees(employees, using=None):
+    '''
+    (Re)index the given employees. Used by the post_save signal and by code
+    paths that bypass signals such as bulk_create / bulk_update.
+    '''
+    using = using or router.db_for_write(Employee)
+    employees = [employee for employee in employees if employee.pk is not None]
+    if not employees or not has_search_table(using):
+        return
+    with connections[using].cursor() as cursor:
+        cursor.executemany(
+            f'DELETE FROM {SEARCH_TABLE} WHERE rowid = %s',
+            [(employee.pk,) for employee in employees],
+        )
+        cursor.executemany(
+            f'INSERT INTO {SEARCH_TABLE} (rowid, name, address) VALUES (%s, %s, %s)',
+            [(employee.pk, employee.name, employee.address) for employee in employees],
+        )
+
+
+def unindex_employees(ids, using=None):
+    using = using or router.db_for_write(Employee)
+    ids = list(ids)
+    if not ids or not has_search_table(using):
+        return
+    with connections[using].cursor() as cursor:
+        cursor.executemany(f'DELETE FROM {SEARCH_TABLE} WHERE rowid = %s', [(pk,) for pk in ids])
+
+
+def rebuild_index(using=None):
+    '''
+    Rebuild the whole index from the Employee table, returns the number of rows indexed.
+    '''
+    using = using or router.db_for_write(Employee)
+    if not has_search_table(using):
+        return 0
+    with connections[using].cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE}')
+        cursor.execute(
+            f'INSERT INTO {SEARCH_TABLE} (rowid, name, address) '
+            f'SELECT id, name, address FROM {Employee._meta.db_table}'
+        )
+        cursor.execute(f"INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}) VALUES ('optimize')")
+    return Employee.objects.using(using).count()
@@ -0,0 +1,178 @@
+import io
+import random
+
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image
+
+from employeemanagement_apk.models import Employee, Department, Position, Status, ImageStatus
+from employeemanagement_apk import search, images, blobs, reports, caching, hierarchy
+
+'''
+
+Synthetic employees for benchmarks and local testing (seed_employees command).
+
+The data follows a realistic shape: most employees are "normal", positions
+and departments are unevenly sized (a few large ones, a long tail), about
+one employee in ten is a manager and every department gets one of them.
+Employees with a picture share a small set of stored images, like the
+content addressed storage does for re-uploaded pictures. The same seed
+generates the same rows.
+
+With levels, the employees also form a reporting tree (Employee.reports_to)
+that many levels deep: the first one is at the top and every employee has
+the same number of direct reports (the smallest fanout that fits count
+employees in the levels), the last level is partly filled.
+
+Rows are written with bulk_create, the derived data (search index, report
+summary, department stats, image references, caches) is updated per batch.
+
+
+'''
+
+FIRST_NAMES = ['Anan', 'Somchai', 'Malee', 'John', 'Jane', 'Maria', 'Ahmed', 'Yuki', 'Olga', 'Pedro',
+               'Niran', 'Kanya', 'Liam', 'Emma', 'Noah', 'Ava', 'Chen', 'Fatima', 'Ivan', 'Sara']
+LAST_NAMES = ['Srisuk', 'Wong', 'Smith', 'Garcia', 'Tanaka', 'Ivanova', 'Khan', 'Muller', 'Rossi', 'Silva',
+              'Chaiyaporn', 'Brown', 'Lee', 'Nguyen', 'Kim', 'Jones', 'Martin', 'Lopez', 'Suzuki', 'Novak']
+STREETS = ['Sukhumvit Rd', 'Main St', 'Silom Rd', 'Oak Ave', 'Rama IV Rd', 'Park Lane', 'Ratchada Rd', 'High St']
+
+# (name, weight)
+STATUSES = [('in recruitment process', 3), ('waiting for onboarding', 2), ('in probation period', 10), ('normal', 75), ('resigned', 10)]
+# (name, salary, weight)
+POSITIONS = [
+    ('Developer', 55000, 30), ('Senior Developer', 80000, 12), ('Designer', 45000, 8), ('Analyst', 50000, 10),
+    ('Tester', 40000, 10), ('Support', 30000, 15), ('Sales', 35000, 8), ('Accountant', 42000, 4),
+    ('Team Lead', 95000, 2), ('Director', 150000, 1),
+]
+# (name, weight)
+DEPARTMENTS = [
+    ('Engineering', 35), ('Support', 15), ('Sales', 12), ('Operations', 10), ('Marketing', 8),
+    ('Finance', 6), ('HR', 5), ('Legal', 3), ('Research', 4), ('Executive', 2),
+]
+
+MANAGER_RATE = 0.1
+IMAGE_RATE = 0.6
+DEFAULT_BATCH_SIZE = 2000
+
+
+def random_employee(rng):
+    return Employee(
+        name=f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}{rng.randint(1, 9999)}',
+        address=f'{rng.randint(1, 999)} {rng.choice(STREETS)}',
+        manager=rng.random() < MANAGER_RATE,
+    )
+
+
+def _lookup(model, field, names, using, **defaults):
+    # The existing rows of these names, created when missing
+    existing = {getattr(row, field): row for row in model.objects.using(using).filter(**{f'{field}__in': names})}
+    for index, name in enumerate(names):
+        if name not in existing:
+            existing[name] = model.objects.using(using).create(**{field: name}, **{key: values[index] for key, values in defaults.items()})
+    return [existing[name] for name in names]
+
+
+def seed_lookups(using='default'):
+    '''
+    ([(status, weight)], [(position, weight)], [(department, weight)])
+    '''
+    statuses = _lookup(Status, 'em_status', [name for name, _ in STATUSES], using)
+    positions = _lookup(Position, 'name', [name for name, _, _ in POSITIONS], using, salary=[salary for _, salary, _ in POSITIONS])
+    departments = _lookup(Department, 'name', [name for name, _ in DEPARTMENTS], using)
+    return (
+        list(zip(statuses, [weight for _, weight in STATUSES])),
+        list(zip(positions, [weight for _, _, weight in POSITIONS])),
+        list(zip(departments, [weight for _, weight in DEPARTMENTS])),
+    )
+
+
+def seed_images(count, rng):
+    '''
+    [(name, image hash, thumbnails)] of count stored pictures, with their thumbnails.
+    '''
+    storage = Employee._meta.get_field('image').storage
+    stored = []
+    for index in range(count):
+        picture = Image.new('RGB', (320, 320), tuple(rng.randrange(256) for _ in range(3)))
+        picture.paste(tuple(rng.randrange(256) for _ in range(3)), (80, 80, 240, 240))
+        content = io.BytesIO()
+        picture.save(content, 'PNG')
+        name = storage.save(f'images/seed_{index}.png', ContentFile(content.getvalue()))
+        image_hash, thumbnails = images.generate_thumbnails(Employee(image=name))
+        stored.append((name, image_hash, thumbnails))
+    return stored
+
+
+def _choose(rng, weighted):
+    return rng.choices([item for item, _ in weighted], weights=[weight for _, weight in weighted])[0]
+
+
+def tree_fanout(count, levels):
+    '''
+    Smallest number of direct reports per employee that fits count employees in a tree levels deep.
+    '''
+    fanout = 1
+    while sum(fanout ** level for level in range(levels)) < count:
+        fanout += 1
+    return fanout
+
+
+def seed_employees(count, seed=42, image_count=5, batch_size=DEFAULT_BATCH_SIZE, using='default', progress=None, levels=0):
+    '''
+    Create count employees, returns the number created.
+    '''
+    rng = random.Random(seed)
+    statuses, positions, departments = seed_lookups(using)
+    pictures = seed_images(image_count, rng) if image_count else []
+    # Tree in breadth first order: the manager of employee n is employee (n - 1) // fanout
+    fanout = tree_fanout(count, levels) if levels > 1 else 0
+    pks = []
+    level_end = 1
+
+    created = 0
+    while created < count:
+        size = min(batch_size, count - created)
+        if fanout:
+            # A batch stops at the end of its level, the managers of the next one have their ids then
+            while level_end <= created:
+                level_end = level_end * fanout + 1
+            size = min(size, level_end - created)
+        batch = []
+        for _ in range(size):
+            employee = random_employee(rng)
+            if fanout:
+                number = created + len(batch)
+                employee.reports_to_id = pks[(number - 1) // fanout] if number else None
+                employee.manager = number * fanout + 1 < count
+            employee.status = _choose(rng, statuses)
+            # Some employees are not placed yet
+            employee.position = _choose(rng, positions) if rng.random() < 0.95 else None
+            employee.department = _choose(rng, departments) if rng.random() < 0.97 else None
+            if pictures and rng.random() < IMAGE_RATE:
+                employee.image, employee.image_hash, employee.image_thumbnails = rng.choice(pictures)
+                employee.image_status = ImageStatus.READY
+            batch.append(employee)
+
+        with transaction.atomic(using=using):
+            Employee.objects.using(using).bulk_create(batch)
+            # bulk_create skips the signals, update the derived data explicitly
+            search.index_employees(batch, using=using)
+            reports.employees_changed(batch, created=True, using=using)
+            hierarchy.add_employees(batch, using=using)
+            blobs.add_references([employee.image.name for employee in batch], using=using)
+            caching.invalidate(Employee, using=using)
+        created += len(batch)
+        if fanout:
+            pks += [employee.pk for employee in batch]
+        if progress:
+            progress(created)
+
+    # Every department is led by one of its managers
+    without_manager = Department.objects.using(using).filter(manager=None)
+    for department in without_manager:
+        manager = Employee.objects.using(using).filter(department=department, manager=True).order_by('pk').first()
+        if manager:
+            Department.objects.using(using).filter(pk=department.pk).update(manager=manager, updated_at=timezone.now())
+            caching.invalidate(Department, [department.pk], using=using)
+    return created
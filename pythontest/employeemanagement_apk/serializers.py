@@ -1,15 +1,69 @@
+from django.core.validators import validate_image_file_extension
 from rest_framework import serializers
 from employeemanagement_apk.models import Employee, Position, Department, Status
+from employeemanagement_apk.expansion import ExpandableFieldsMixin
+from employeemanagement_apk import hierarchy
+
+class CachedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    '''
+    PrimaryKeyRelatedField that looks the related object up in
+    context['related_objects'] ({model: {pk: instance}}) when the view has
+    preloaded it, e.g. the bulk endpoints resolve every foreign key of a batch
+    with one query per model instead of one query per item.
+    '''
+
+    def to_internal_value(self, data):
+        queryset = self.get_queryset()
+        related = self.context.get('related_objects', {}).get(queryset.model)
+        if related is None:
+            return super().to_internal_value(data)
+        try:
+            pk = queryset.model._meta.pk.to_python(data)
+        except Exception:
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        if pk not in related:
+            self.fail('does_not_exist', pk_value=data)
+        return related[pk]
+
+class BaseModelSerializer(ExpandableFieldsMixin, serializers.ModelSerializer):
+    # ?fields= / ?expand= on reads, see expansion.py
+    serializer_related_field = CachedPrimaryKeyRelatedField
 
 # REST API Serializer for the Employee model
-class EmployeeSerializer(serializers.ModelSerializer):
+class EmployeeSerializer(BaseModelSerializer):
     
     # Define the fields to be serialized
-    image = serializers.ImageField(required=False) # Allow image to be optional in the request
+    # Allow image to be optional in the request. Only the extension is checked
+    # here, the content is verified by the background worker (image_status).
+    image = serializers.FileField(required=False, validators=[validate_image_file_extension])
+    thumbnails = serializers.SerializerMethodField()
     
     class Meta:
         model = Employee
-        fields = ['id', 'name', 'address', 'manager', 'status', 'position', 'department', 'image']
+        fields = ['id', 'name', 'address', 'manager', 'status', 'position', 'department', 'reports_to', 'image', 'image_status', 'image_error', 'thumbnails']
+        read_only_fields = ['image_status', 'image_error']
+        expandable_fields = {
+            'status': 'StatusSerializer', 'position': 'PositionSerializer', 'department': 'DepartmentSerializer',
+            # A few levels at most (API_EXPAND_MAX_DEPTH), the whole line is the ancestors action
+            'reports_to': 'EmployeeSerializer',
+        }
+
+    def get_thumbnails(self, employee):
+        # Absolute URLs of the WebP and fallback thumbnails of every size
+        request = self.context.get('request')
+        return {
+            size: {kind: request.build_absolute_uri(url) if request else url for kind, url in urls.items()}
+            for size, urls in employee.thumbnails.items()
+        }
+
+    def validate_reports_to(self, reports_to):
+        # A batch of the bulk endpoint has no instance, its moves are checked when they are applied
+        if reports_to is not None and isinstance(self.instance, Employee):
+            try:
+                hierarchy.check_manager(self.instance, reports_to.pk)
+            except hierarchy.HierarchyError as error:
+                raise serializers.ValidationError(str(error))
+        return reports_to
 
     def create(self, validated_data):
         return Employee.objects.create(**validated_data)
@@ -22,6 +76,8 @@ class EmployeeSerializer(serializers.ModelSerializer):
         instance.status = validated_data.get('status', instance.status)
         instance.position = validated_data.get('position', instance.position)
         instance.department = validated_data.get('department', instance.department)
+        if 'reports_to' in validated_data:
+            instance.reports_to = validated_data['reports_to']
         
         # Handle the image field specifically - if no new image is provided, keep the old one
         if 'image' in validated_data:
@@ -30,7 +86,7 @@ class EmployeeSerializer(serializers.ModelSerializer):
         instance.save()
         return instance
     
-class PositionSerializer(serializers.ModelSerializer):
+class PositionSerializer(BaseModelSerializer):
     class Meta:
         model = Position
         fields = ['id', 'name', 'salary']
@@ -44,16 +100,23 @@ class PositionSerializer(serializers.ModelSerializer):
         instance.save()
         return instance
     
-class DepartmentSerializer(serializers.ModelSerializer):
+class DepartmentSerializer(BaseModelSerializer):
     class Meta:
         model = Department
-        fields = ['id', 'name', 'manager']
+        fields = ['id', 'name', 'manager', 'employee_count', 'total_salary']
+        read_only_fields = ['employee_count', 'total_salary']
+        expandable_fields = {'manager': EmployeeSerializer}
         
-    def create(self, validated_data):
-        if validated_data.get('manager') and not validated_data['manager'].manager:
+    def validate_manager(self, manager):
+        # Same rule as Department.save, checked here so the bulk endpoints
+        # (which do not call save) enforce it too.
+        if manager and not manager.manager:
             raise serializers.ValidationError(
-                f'The employee {validated_data["manager"].name} is not designated as a manager.'
+                f'The employee {manager.name} is not designated as a manager.'
             )
+        return manager
+
+    def create(self, validated_data):
         return super().create(validated_data)
     
     def update(self, instance, validated_data):
@@ -62,7 +125,7 @@ class DepartmentSerializer(serializers.ModelSerializer):
         instance.save()
         return instance
     
-class StatusSerializer(serializers.ModelSerializer):
+class StatusSerializer(BaseModelSerializer):
     class Meta:
         model = Status
         fields = ['id', 'em_status']
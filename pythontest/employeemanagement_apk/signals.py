@@ -0,0 +1,171 @@
+from django.db.backends.signals import connection_created
+from django.db.models.signals import pre_save, post_save, post_delete, pre_delete
+from django.dispatch import receiver, Signal
+from django.utils import timezone
+
+from employeemanagement_apk.models import Employee, Position, Department, Status
+from employeemanagement_apk import search, images, blobs, caching, reports, sqlite, instrumentation, hierarchy
+
+'''
+
+Signal receivers keeping derived data in sync with the models.
+
+
+'''
+
+# Sent after bulk_create / bulk_update, which do not send post_save.
+# Arguments: sender (the model), instances, created, update_fields.
+bulk_saved = Signal()
+
+# Search index
+@receiver(post_save, sender=Employee)
+def index_employee(sender, instance, using, update_fields=None, **kwargs):
+    # Skip saves that did not touch the indexed columns
+    if update_fields is not None and not {'name', 'address'} & set(update_fields):
+        return
+    search.index_employees([instance], using=using)
+
+@receiver(post_delete, sender=Employee)
+def unindex_employee(sender, instance, using, **kwargs):
+    search.unindex_employees([instance.pk], using=using)
+
+@receiver(bulk_saved, sender=Employee)
+def index_employees(sender, instances, update_fields=None, **kwargs):
+    if update_fields is not None and not {'name', 'address'} & set(update_fields):
+        return
+    search.index_employees(instances)
+
+# Image processing (verification, metadata stripping, thumbnails) runs in the background
+@receiver(post_save, sender=Employee)
+def queue_employee_image(sender, instance, using, update_fields=None, **kwargs):
+    if update_fields is not None and 'image' not in update_fields:
+        return
+    images.queue_processing([instance], using=using)
+
+@receiver(bulk_saved, sender=Employee)
+def queue_employees_images(sender, instances, update_fields=None, **kwargs):
+    if update_fields is not None and 'image' not in update_fields:
+        return
+    images.queue_processing(instances)
+
+@receiver(post_delete, sender=Employee)
+def release_employee_image(sender, instance, using, **kwargs):
+    # The file itself is deleted by the gc_images command
+    blobs.release_references([instance.image.name], using=using)
+
+# API response cache
+CACHED_MODELS = [Employee, Position, Department, Status]
+
+def invalidate_instance(sender, instance, using, **kwargs):
+    caching.invalidate(sender, [instance.pk], using=using)
+
+def remember_set_null_dependents(sender, instance, **kwargs):
+    # After the delete the rows set to NULL can no longer be found
+    instance._cache_dependents = caching.set_null_dependents(instance, CACHED_MODELS)
+
+def invalidate_deleted(sender, instance, using, **kwargs):
+    caching.invalidate(sender, [instance.pk], using=using)
+    for model, pks in getattr(instance, '_cache_dependents', []):
+        # SET_NULL changed these rows without save, keep their updated_at current
+        model._base_manager.using(using).filter(pk__in=pks).update(updated_at=timezone.now())
+        caching.invalidate(model, pks, using=using)
+
+def invalidate_instances(sender, instances, **kwargs):
+    caching.invalidate(sender, [instance.pk for instance in instances])
+
+for model in CACHED_MODELS:
+    post_save.connect(invalidate_instance, sender=model, dispatch_uid=f'cache_save_{model.__name__}')
+    pre_delete.connect(remember_set_null_dependents, sender=model, dispatch_uid=f'cache_pre_delete_{model.__name__}')
+    post_delete.connect(invalidate_deleted, sender=model, dispatch_uid=f'cache_delete_{model.__name__}')
+    bulk_saved.connect(invalidate_instances, sender=model, dispatch_uid=f'cache_bulk_{model.__name__}')
+
+# Headcount summary of the reports (SET_NULL of a deleted status / position /
+# department is applied to the summary rows by the delete itself). Saves of
+# instances loaded with only() / defer() list attnames in update_fields.
+SUMMARY_FIELDS = {'status', 'position', 'department', 'status_id', 'position_id', 'department_id'}
+
+@receiver(pre_save, sender=Employee)
+def load_employee_group(sender, instance, using, update_fields=None, **kwargs):
+    # The group of an instance that was not loaded with it, read before the save overwrites it
+    if update_fields is not None and not SUMMARY_FIELDS & set(update_fields):
+        return
+    reports.load_groups([instance], using=using)
+
+@receiver(post_save, sender=Employee)
+def summarize_employee(sender, instance, created, using, update_fields=None, **kwargs):
+    if update_fields is not None and not SUMMARY_FIELDS & set(update_fields):
+        return
+    reports.employees_changed([instance], created, using=using)
+
+@receiver(pre_delete, sender=Employee)
+def load_deleted_employee_group(sender, instance, using, **kwargs):
+    reports.load_groups([instance], using=using)
+
+@receiver(post_delete, sender=Employee)
+def unsummarize_employee(sender, instance, using, **kwargs):
+    reports.employees_deleted([instance], using=using)
+
+@receiver(bulk_saved, sender=Employee)
+def summarize_employees(sender, instances, created, update_fields=None, **kwargs):
+    if update_fields is not None and not SUMMARY_FIELDS & set(update_fields):
+        return
+    reports.employees_changed(instances, created)
+
+# Department.total_salary follows the salaries (employee changes are handled with the summary)
+@receiver(post_save, sender=Position)
+def refresh_position_departments(sender, instance, created, using, update_fields=None, **kwargs):
+    if created or (update_fields is not None and 'salary' not in update_fields):
+        return
+    reports.refresh_department_stats(reports.departments_with_positions([instance.pk], using=using), using=using)
+
+@receiver(bulk_saved, sender=Position)
+def refresh_positions_departments(sender, instances, created, update_fields=None, **kwargs):
+    if created or (update_fields is not None and 'salary' not in update_fields):
+        return
+    reports.refresh_department_stats(reports.departments_with_positions([instance.pk for instance in instances]))
+
+@receiver(pre_delete, sender=Position)
+def remember_position_departments(sender, instance, using, **kwargs):
+    instance._stats_departments = reports.departments_with_positions([instance.pk], using=using)
+
+@receiver(post_delete, sender=Position)
+def refresh_deleted_position_departments(sender, instance, using, **kwargs):
+    reports.refresh_department_stats(getattr(instance, '_stats_departments', ()), using=using)
+
+# Reporting paths of Employee.reports_to (see hierarchy.py)
+@receiver(pre_save, sender=Employee)
+def check_reports_to(sender, instance, using, update_fields=None, **kwargs):
+    # Refused before the row is written: a move under one of the employee's own reports
+    instance._manager_changed = False
+    # update_fields of a deferred instance's save holds reports_to_id (see SUMMARY_FIELDS)
+    if instance.pk is None or (update_fields is not None and not {'reports_to', 'reports_to_id'} & set(update_fields)):
+        return
+    if hierarchy.manager_changed(instance, using=using):
+        hierarchy.check_manager(instance, instance.reports_to_id, using=using)
+        instance._manager_changed = True
+
+@receiver(post_save, sender=Employee)
+def update_reporting_paths(sender, instance, created, using, **kwargs):
+    if created:
+        hierarchy.add_employees([instance], using=using)
+    elif instance._manager_changed:
+        hierarchy.move_employee(instance.pk, instance.reports_to_id, using=using)
+        hierarchy.remember_manager(instance)
+
+@receiver(bulk_saved, sender=Employee)
+def update_bulk_reporting_paths(sender, instances, created, update_fields=None, **kwargs):
+    if created:
+        hierarchy.add_employees(instances)
+    elif update_fields is None or 'reports_to' in update_fields:
+        hierarchy.move_employees(instances)
+
+@receiver(pre_delete, sender=Employee)
+def detach_reporting_paths(sender, instance, using, **kwargs):
+    # The reports of a deleted employee are left at the top of their own subtrees (SET_NULL)
+    hierarchy.detach_subtree(instance.pk, using=using)
+
+# SQLite tuning profile (settings.SQLITE_PROFILE), run on every new connection
+connection_created.connect(sqlite.configure_connection, dispatch_uid='employeemanagement_apk.sqlite')
+
+# Query counting of the instrumentation middleware, on every new connection
+connection_created.connect(instrumentation.install_query_counter, dispatch_uid='employeemanagement_apk.instrumentation')
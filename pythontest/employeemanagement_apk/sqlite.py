@@ -0,0 +1,70 @@
+import sqlite3
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+'''
+
+SQLite tuning profiles.
+
+SQLITE_PROFILES in the settings names sets of PRAGMAs, the profile picked by
+SQLITE_PROFILE is run on every new connection to a sqlite3 database (the
+connection_created receiver in signals.py). Most of them only last for the
+connection, journal_mode=WAL is stored in the database file.
+
+With persistent connections (CONN_MAX_AGE) a worker opens its connection,
+and runs the pragmas, once instead of once per request. The
+benchmark_sqlite command measures the difference.
+
+
+'''
+
+
+def get_pragmas(profile=None):
+    '''
+    {pragma: value} of the profile (default settings.SQLITE_PROFILE), {} without a profile.
+    '''
+    name = profile or getattr(settings, 'SQLITE_PROFILE', None)
+    if name is None:
+        return {}
+    profiles = getattr(settings, 'SQLITE_PROFILES', {})
+    if name not in profiles:
+        raise ImproperlyConfigured(f'Unknown SQLite profile "{name}", expected one of {", ".join(profiles)}.')
+    return profiles[name]
+
+
+def apply_pragmas(cursor, pragmas):
+    # A Django or a plain sqlite3 cursor
+    for name, value in pragmas.items():
+        cursor.execute(f'PRAGMA {name} = {value}')
+
+
+def read_pragmas(cursor, names):
+    '''
+    {pragma: current value}
+    '''
+    values = {}
+    for name in names:
+        cursor.execute(f'PRAGMA {name}')
+        row = cursor.fetchone()
+        values[name] = row[0] if row else None
+    return values
+
+
+def connect(path, pragmas, timeout=5.0):
+    '''
+    A plain sqlite3 connection set up like Django's: autocommit, explicit BEGIN, then the pragmas.
+    '''
+    connection = sqlite3.connect(path, timeout=timeout, isolation_level=None, check_same_thread=False)
+    apply_pragmas(connection, pragmas)
+    return connection
+
+
+def configure_connection(sender, connection, **kwargs):
+    # connection_created receiver
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = get_pragmas()
+    if pragmas:
+        with connection.cursor() as cursor:
+            apply_pragmas(cursor, pragmas)
@@ -0,0 +1,70 @@
+import os
+import re
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+
+from employeemanagement_apk.images import content_hash
+
+'''
+
+Content addressed storage for Employee.image.
+
+A file is stored under the SHA-256 of its content instead of its upload name:
+
+    images/<hash[:2]>/<hash>.<extension>
+
+Uploading the same picture twice stores it once (the second save finds the
+file and returns its name, no random suffix is added), and since a name
+always maps to the same bytes the files can be served with far-future
+cache headers. Files are never overwritten or deleted by the application:
+ImageBlob counts the employees using every file and the gc_images command
+deletes the unreferenced ones (see blobs.py).
+
+
+'''
+
+# Served as immutable: content addressed originals and the thumbnails
+# (named from the hash of their original, see images.thumbnail_name)
+IMMUTABLE_NAME = re.compile(r'(^|/)([0-9a-f]{2}/[0-9a-f]{64}|[0-9a-f]{16}_[a-z]+)\.[a-z0-9]+$')
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+def is_content_addressed(name):
+    return bool(IMMUTABLE_NAME.search(name))
+
+
+class _AlreadyStored(Exception):
+    pass
+
+
+class ContentAddressedStorage(FileSystemStorage):
+
+    def content_name(self, name, content):
+        directory = os.path.dirname(name)
+        extension = os.path.splitext(name)[1].lower()
+        image_hash = content_hash(content)
+        return os.path.join(directory, image_hash[:2], f'{image_hash}{extension}').replace('\\', '/')
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.content_name(name, content)
+        try:
+            return super().save(name, content, max_length=max_length)
+        except _AlreadyStored:
+            return name
+
+    def get_available_name(self, name, max_length=None):
+        # Same name, same content: keep the stored file instead of adding a suffix
+        if self.exists(name):
+            raise _AlreadyStored(name)
+        return super().get_available_name(name, max_length=max_length)
+
+
+def image_storage():
+    # Callable so the storage is not serialized into the migrations
+    return ContentAddressedStorage()
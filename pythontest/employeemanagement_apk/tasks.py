@@ -0,0 +1,95 @@
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+'''
+
+Local background task pool (no external services).
+
+Tasks run on a thread pool inside the web process. The durable state lives
+in the database (e.g. Employee.image_status), so work lost with the process
+(restart, crash) is picked up again by the process_images command.
+
+CPU-bound steps (Pillow, see rendering.py) would hold the GIL and slow the
+request threads down, the tasks hand them to a pool of worker processes
+with render and wait for the result. The worker processes are spawned, not
+forked, and only run functions of modules importable without Django: the
+database, the cache and the storage stay in the web process.
+
+IMAGE_WORKERS sets the number of threads, 0 runs every task synchronously
+in the calling thread (tests, debugging). IMAGE_PROCESSES sets the number of
+worker processes, 0 renders in the calling thread.
+
+
+'''
+
+DEFAULT_WORKERS = 2
+DEFAULT_PROCESSES = 2
+
+_executor = None
+_processes = None
+_processes_pid = None
+_lock = threading.Lock()
+
+
+def get_worker_count():
+    return getattr(settings, 'IMAGE_WORKERS', DEFAULT_WORKERS)
+
+
+def get_process_count():
+    return getattr(settings, 'IMAGE_PROCESSES', DEFAULT_PROCESSES)
+
+
+def get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=get_worker_count(), thread_name_prefix='image-worker')
+    return _executor
+
+
+def get_process_pool():
+    global _processes, _processes_pid
+    with _lock:
+        # A forked web worker cannot use the pool of its parent
+        if _processes is None or _processes_pid != os.getpid():
+            _processes = ProcessPoolExecutor(max_workers=get_process_count(), mp_context=multiprocessing.get_context('spawn'))
+            _processes_pid = os.getpid()
+    return _processes
+
+
+def _run(function, args):
+    try:
+        function(*args)
+    except Exception:
+        logger.exception('Background task %s%r failed', function.__name__, args)
+    finally:
+        # Database connections are per thread, do not leave them open in idle workers
+        connections.close_all()
+
+
+def submit(function, *args):
+    '''
+    Run function(*args) on the pool, returns the Future (None when run synchronously).
+    '''
+    if get_worker_count() == 0:
+        function(*args)
+        return None
+    return get_executor().submit(_run, function, args)
+
+
+def render(function, *args):
+    '''
+    function(*args) on a worker process, waits for its result (exceptions are
+    raised here). Runs in the calling thread when IMAGE_PROCESSES is 0.
+    '''
+    if get_process_count() == 0:
+        return function(*args)
+    return get_process_pool().submit(function, *args).result()
@@ -2,6 +2,13 @@ from rest_framework import status
 from rest_framework.test import APITestCase
 from .models import Employee, Position, Department, Status
 from rest_framework.exceptions import ValidationError
+from .pagination import KeysetCursorPagination
+from unittest import mock
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from django.core.cache import caches
+from django.contrib.auth.models import User
+import json
 
 from django.core.files.uploadedfile import SimpleUploadedFile
 from pathlib import Path
@@ -200,6 +207,393 @@ class DepartmentAPITests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
 
-            
-        
+class PaginationAPITests(APITestCase):
+
+    def setUp(self):
+        Position.objects.bulk_create([
+            Position(name=f'Position {i % 7}', salary=1000 + i) for i in range(23)
+        ])
+
+    def collect(self, url):
+        '''
+        Follow the next links and return every id in the order received.
+        '''
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertLessEqual(len(response.data['results']), 5)
+            ids.extend(item['id'] for item in response.data['results'])
+            url = response.data['next']
+        return ids
+
+    def test_list_is_cursor_paginated(self):
+        ids = self.collect('/api/positions/?page_size=5')
+        self.assertEqual(ids, list(Position.objects.order_by('id').values_list('id', flat=True)))
+
+    def test_secondary_ordering_is_stable(self):
+        # Many positions share a name, the id tie breaker keeps every row exactly once
+        ids = self.collect('/api/positions/?page_size=5&ordering=name')
+        self.assertEqual(ids, list(Position.objects.order_by('name', 'id').values_list('id', flat=True)))
+
+    def test_page_size_is_capped(self):
+        with mock.patch.object(KeysetCursorPagination, 'max_page_size', 10):
+            response = self.client.get('/api/positions/?page_size=100000')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 10)
+        self.assertIsNotNone(response.data['next'])
+
+
+class BulkAPITests(APITestCase):
+
+    def setUp(self):
+        self.status = Status.objects.create(em_status='normal')
+        self.position = Position.objects.create(name='Developer', salary=1000)
+        self.department = Department.objects.create(name='IT')
+
+    def tearDown(self):
+        '''
+        Clean up any uploaded files after each test.
+        '''
+        for employee in Employee.objects.exclude(image=''):
+            image_path = os.path.join(settings.MEDIA_ROOT, employee.image.name)
+            if os.path.exists(image_path):
+                os.remove(image_path)
+
+    def employee_items(self, count):
+        return [{
+            'name': f'Employee {i}',
+            'address': f'{i} Main St',
+            'manager': False,
+            'status': self.status.id,
+            'position': self.position.id,
+            'department': self.department.id,
+        } for i in range(count)]
+
+    def bulk_create_queries(self, count):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post('/api/employees/bulk/', self.employee_items(count), format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return len(context.captured_queries)
+
+    def test_bulk_create(self):
+        response = self.client.post('/api/positions/bulk/', [
+            {'name': 'Tester', 'salary': 500},
+            {'name': 'Designer', 'salary': 700},
+        ], format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([item['name'] for item in response.data], ['Tester', 'Designer'])
+        self.assertEqual(Position.objects.count(), 3)
+
+    def test_bulk_create_query_count_is_constant(self):
+        '''
+        Foreign keys are resolved with one query per model, not one per item.
+        '''
+        self.assertEqual(self.bulk_create_queries(2), self.bulk_create_queries(40))
+        self.assertEqual(Employee.objects.filter(department=self.department).count(), 42)
+
+    def test_bulk_create_reports_item_errors(self):
+        items = self.employee_items(3)
+        items[1]['status'] = 9999
+        del items[2]['name']
+        response = self.client.post('/api/employees/bulk/', items, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual([error['index'] for error in response.data['errors']], [1, 2])
+        self.assertIn('status', response.data['errors'][0]['errors'])
+        self.assertIn('name', response.data['errors'][1]['errors'])
+        # Nothing is written when an item is invalid
+        self.assertEqual(Employee.objects.count(), 0)
+
+    def test_bulk_create_department_requires_manager(self):
+        employee = Employee.objects.create(name='Not a manager', address='Home', manager=False)
+        response = self.client.post('/api/departments/bulk/', [{'name': 'HR', 'manager': employee.id}], format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['errors'][0]['index'], 0)
+
+    def test_bulk_create_multipart_with_images(self):
+        with open(TEST_IMAGE_PATH, 'rb') as img_file:
+            content = img_file.read()
+        items = self.employee_items(2)
+        items[0]['image'] = 'photo_0'
+        response = self.client.post('/api/employees/bulk/', {
+            'items': json.dumps(items),
+            'photo_0': SimpleUploadedFile('bulk_photo.png', content, content_type='image/png'),
+        }, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        employee = Employee.objects.get(name='Employee 0')
+        self.assertTrue(employee.image)
+        self.assertTrue(os.path.exists(os.path.join(settings.MEDIA_ROOT, employee.image.name)))
+
+    def test_bulk_update(self):
+        self.client.post('/api/employees/bulk/', self.employee_items(3), format='json')
+        employees = list(Employee.objects.order_by('id'))
+        response = self.client.patch('/api/employees/bulk/', [
+            {'id': employees[0].id, 'name': 'Renamed'},
+            {'id': employees[2].id, 'manager': True},
+        ], format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(Employee.objects.get(id=employees[0].id).name, 'Renamed')
+        self.assertTrue(Employee.objects.get(id=employees[2].id).manager)
+        self.assertEqual(Employee.objects.get(id=employees[1].id).name, 'Employee 1')
+
+    def test_bulk_update_unknown_id(self):
+        response = self.client.patch('/api/positions/bulk/', [
+            {'id': self.position.id, 'salary': 2000},
+            {'id': 9999, 'salary': 1},
+        ], format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['errors'][0]['index'], 1)
+        self.position.refresh_from_db()
+        self.assertEqual(self.position.salary, 1000)
+
+    def test_bulk_delete(self):
+        self.client.post('/api/employees/bulk/', self.employee_items(3), format='json')
+        ids = list(Employee.objects.values_list('id', flat=True))
+        response = self.client.delete('/api/employees/bulk/', {'ids': ids[:2]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['deleted'], 2)
+        self.assertEqual(list(Employee.objects.values_list('id', flat=True)), ids[2:])
+
+        response = self.client.delete('/api/employees/bulk/', {'ids': [ids[2], 9999]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Employee.objects.count(), 1)
+
+
+class CacheAPITests(APITestCase):
+
+    def setUp(self):
+        caches['api'].clear()
+        self.status = Status.objects.create(em_status='normal')
+        self.position = Position.objects.create(name='Developer', salary=1000)
+        self.employees = [
+            Employee.objects.create(name=f'Employee {i}', address='Home', status=self.status, position=self.position)
+            for i in range(2)
+        ]
+
+    def get(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response
+
+    def test_detail_is_cached(self):
+        url = f'/api/employees/{self.employees[0].id}/'
+        self.assertEqual(self.get(url)['X-Cache'], 'MISS')
+        with CaptureQueriesContext(connection) as context:
+            response = self.get(url)
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertEqual(len(context.captured_queries), 0)
+        self.assertEqual(response.data['name'], 'Employee 0')
+
+    def test_renderers_are_cached_apart(self):
+        url = f'/api/employees/{self.employees[0].id}/'
+        json_etag = self.get(url)['ETag']
+        response = self.client.get(url, HTTP_ACCEPT='text/html')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        html_etag = response['ETag']
+        self.assertNotEqual(html_etag, json_etag)
+
+        # Each hit answers with the validator of its own representation
+        for accept, etag in [('application/json', json_etag), ('text/html', html_etag)]:
+            with self.subTest(accept):
+                response = self.client.get(url, HTTP_ACCEPT=accept)
+                self.assertEqual((response['X-Cache'], response['ETag']), ('HIT', etag))
+        self.assertEqual(self.client.get(url, HTTP_ACCEPT='text/html', HTTP_IF_NONE_MATCH=json_etag).status_code, status.HTTP_200_OK)
+
+    def test_save_invalidates_only_the_object_and_the_lists(self):
+        first, second = (f'/api/employees/{employee.id}/' for employee in self.employees)
+        for url in (first, second, '/api/employees/'):
+            self.get(url)
+
+        self.client.patch(first, {'name': 'Renamed'}, format='multipart')
+        response = self.get(first)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['name'], 'Renamed')
+        self.assertEqual(self.get(second)['X-Cache'], 'HIT')
+        response = self.get('/api/employees/')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['results'][0]['name'], 'Renamed')
+
+    def test_set_null_cascade_invalidates_dependents(self):
+        url = f'/api/employees/{self.employees[0].id}/'
+        self.assertEqual(self.get(url).data['status'], self.status.id)
+
+        self.client.delete(f'/api/positions/{self.position.id}/')
+        self.status.delete()
+        response = self.get(url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertIsNone(response.data['status'])
+        self.assertIsNone(response.data['position'])
+
+    def test_bulk_update_invalidates(self):
+        url = f'/api/positions/{self.position.id}/'
+        self.get(url)
+        self.client.patch('/api/positions/bulk/', [{'id': self.position.id, 'salary': 2000}], format='json')
+        self.assertEqual(self.get(url).data['salary'], 2000)
+
+    def test_stats(self):
+        url = '/api/positions/'
+        self.get(url)
+        self.get(url)
+        self.assertEqual(self.client.get('/api/cache-stats/').status_code, status.HTTP_403_FORBIDDEN)
+
+        self.client.force_authenticate(User.objects.create_superuser('admin', password='secret-pass-123'))
+        response = self.get('/api/cache-stats/')
+        self.assertEqual(response.data['employeemanagement_apk.position'], {'hits': 1, 'misses': 1, 'hit_rate': 0.5})
+
+
+class ConditionalGetAPITests(APITestCase):
+
+    def setUp(self):
+        caches['api'].clear()
+        self.position = Position.objects.create(name='Developer', salary=1000)
+
+    def test_list_not_modified(self):
+        response = self.client.get('/api/positions/')
+        etag = response['ETag']
+        self.assertTrue(response.has_header('Last-Modified'))
+
+        # Answered from the cache, the serializer does not run
+        with mock.patch('employeemanagement_apk.serializers.PositionSerializer.to_representation') as to_representation:
+            response = self.client.get('/api/positions/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        to_representation.assert_not_called()
+
+        # Without the cache, only the revision is read
+        caches['api'].clear()
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/api/positions/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(len(context.captured_queries), 1)
+
+    def test_list_etag_changes_on_delete(self):
+        other = Position.objects.create(name='Tester', salary=500)
+        etag = self.client.get('/api/positions/')['ETag']
+        other.delete()
+        response = self.client.get('/api/positions/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_list_etag_depends_on_the_query(self):
+        etag = self.client.get('/api/positions/')['ETag']
+        self.assertNotEqual(self.client.get('/api/positions/?ordering=-id')['ETag'], etag)
+
+    def test_detail_not_modified_until_saved(self):
+        url = f'/api/positions/{self.position.id}/'
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.client.patch(url, {'salary': 2000}, format='json')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['salary'], 2000)
+
+    def test_bulk_update_sets_updated_at(self):
+        updated_at = self.position.updated_at
+        self.client.patch('/api/positions/bulk/', [{'id': self.position.id, 'salary': 2000}], format='json')
+        self.position.refresh_from_db()
+        self.assertGreater(self.position.updated_at, updated_at)
+
+
+
+class ExpansionAPITests(APITestCase):
+
+    def setUp(self):
+        caches['api'].clear()
+        self.status = Status.objects.create(em_status='normal')
+        self.position = Position.objects.create(name='Developer', salary=1000)
+        self.boss = Employee.objects.create(name='Boss', address='HQ', manager=True, status=self.status)
+        self.department = Department.objects.create(name='IT', manager=self.boss)
+        for i in range(5):
+            Employee.objects.create(name=f'Employee {i}', address=f'{i} Main St', status=self.status, position=self.position, department=self.department)
+
+    def get(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response, len(context.captured_queries)
+
+    def test_sparse_fieldset(self):
+        response, _ = self.get('/api/employees/?fields=id,name')
+        self.assertEqual(set(response.data['results'][0]), {'id', 'name'})
+
+    def test_expand_without_extra_queries(self):
+        caches['api'].clear()
+        _, plain = self.get('/api/employees/')
+        caches['api'].clear()
+        response, expanded = self.get('/api/employees/?expand=status,position,department.manager&fields=id,department.name,department.manager,status')
+        self.assertEqual(plain, expanded)
+
+        employee = response.data['results'][-1]
+        self.assertEqual(set(employee), {'id', 'department', 'status'})
+        self.assertEqual(employee['status'], {'id': self.status.id, 'em_status': 'normal'})
+        self.assertEqual(set(employee['department']), {'name', 'manager'})
+        self.assertEqual(employee['department']['manager']['name'], 'Boss')
+        # Not expanded, still an id
+        self.assertEqual(employee['department']['manager']['status'], self.status.id)
+
+    def test_expand_depth_is_limited(self):
+        self.boss.department = self.department
+        self.boss.save()
+        response, _ = self.get('/api/employees/?expand=department.manager.department')
+        self.assertEqual(response.data['results'][-1]['department']['manager']['department']['name'], 'IT')
+
+        # Each level is one more join, a long chain would exceed what the database can join
+        for url in ['/api/employees/?expand=department.manager.department.manager', f'/api/employees/{self.boss.id}/?expand=' + '.'.join(['department', 'manager'] * 40)]:
+            with self.subTest(url), CaptureQueriesContext(connection) as context:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertEqual(len(context.captured_queries), 0)
+
+    def test_writes_keep_ids(self):
+        response = self.client.patch(f'/api/employees/{self.boss.id}/?expand=status', {'name': 'Big Boss'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['status'], self.status.id)
+
+    def test_expanded_responses_follow_related_changes(self):
+        url = f'/api/employees/{self.boss.id}/?expand=status'
+        response, _ = self.get(url)
+        etag = response['ETag']
+        self.assertEqual(self.get(url)[0]['X-Cache'], 'HIT')
+
+        self.status.em_status = 'on leave'
+        self.status.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['status']['em_status'], 'on leave')
+
+
+class LookupAPITests(APITestCase):
+
+    def setUp(self):
+        caches['api'].clear()
+        self.status = Status.objects.create(em_status='normal')
+        self.position = Position.objects.create(name='Developer', salary=1000)
+        self.department = Department.objects.create(name='IT')
+
+    def test_statuses_are_registered(self):
+        response = self.client.get('/api/statuses/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'], [{'id': self.status.id, 'em_status': 'normal'}])
+
+    def test_lookups(self):
+        response = self.client.get('/api/lookups/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['statuses'], [{'id': self.status.id, 'em_status': 'normal'}])
+        self.assertEqual([position['name'] for position in response.data['positions']], ['Developer'])
+        self.assertEqual([department['name'] for department in response.data['departments']], ['IT'])
+
+        # Served from memory: only the revisions are read
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/api/lookups/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(len(context.captured_queries), 1)
 
+    def test_lookups_follow_changes(self):
+        self.client.get('/api/lookups/')
+        Position.objects.create(name='Designer', salary=700)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/api/lookups/')
+        self.assertEqual([position['name'] for position in response.data['positions']], ['Developer', 'Designer'])
+        # The revisions and the changed table
+        self.assertEqual(len(context.captured_queries), 2)
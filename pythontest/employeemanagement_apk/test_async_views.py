@@ -0,0 +1,87 @@
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+
+from .instrumentation import registry
+from .models import Employee, Status, Department, Position
+from .test_views import create_employees
+
+
+class AsyncViewTests(TestCase):
+
+    def setUp(self):
+        self.status = Status.objects.create(em_status='normal')
+        self.position = Position.objects.create(name='Developer', salary=10)
+        self.department = Department.objects.create(name='IT')
+        create_employees(5, status=self.status, position=self.position, department=self.department)
+        self.employee = Employee.objects.order_by('pk').first()
+        self.user = User.objects.create_user(username='tester', password='secret-pass-123')
+
+    async def test_employee_list_matches_the_api(self):
+        response = await self.async_client.get('/api/async/employees/?page_size=2&expand=department')
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        sync = (await self.async_client.get('/api/employees/?page_size=2&expand=department')).json()
+        self.assertEqual(data['results'], sync['results'])
+        self.assertIsNone(data['previous'])
+
+        # Following the cursors
+        second = (await self.async_client.get(data['next'])).json()
+        self.assertEqual(len(second['results']), 2)
+        self.assertGreater(second['results'][0]['id'], data['results'][-1]['id'])
+        first = (await self.async_client.get(second['previous'])).json()
+        self.assertEqual(first['results'], data['results'])
+
+        not_modified = await self.async_client.get('/api/async/employees/?page_size=2&expand=department', headers={'if-none-match': response['ETag']})
+        self.assertEqual(not_modified.status_code, 304)
+
+    async def test_employee_detail(self):
+        response = await self.async_client.get(f'/api/async/employees/{self.employee.pk}/?expand=status')
+        self.assertEqual(response.status_code, 200)
+        sync = await self.async_client.get(f'/api/employees/{self.employee.pk}/?expand=status')
+        self.assertEqual(response.json(), sync.json())
+        self.assertEqual(response.json()['status']['em_status'], 'normal')
+
+        not_modified = await self.async_client.get(f'/api/async/employees/{self.employee.pk}/?expand=status', headers={'if-none-match': response['ETag']})
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual((await self.async_client.get('/api/async/employees/999999/')).status_code, 404)
+        self.assertEqual((await self.async_client.post(f'/api/async/employees/{self.employee.pk}/')).status_code, 405)
+
+    async def test_lookups_match_the_api(self):
+        response = await self.async_client.get('/api/async/lookups/')
+        sync = await self.async_client.get('/api/lookups/')
+        self.assertEqual(response.json(), sync.json())
+        self.assertEqual(response['ETag'], sync['ETag'])
+
+    async def test_employee_query(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(f'/async/employee_query?department={self.department.pk}')
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Hi, tester!')
+        self.assertContains(response, 'Employee 4')
+        self.assertEqual((await self.async_client.get('/async/employee_query', headers={'if-none-match': response['ETag']})).status_code, 200)
+
+        not_modified = await self.async_client.get(f'/async/employee_query?department={self.department.pk}', headers={'if-none-match': response['ETag']})
+        self.assertEqual(not_modified.status_code, 304)
+
+        # bulk_create skips the search index, a saved employee is indexed
+        await Employee.objects.acreate(name='Grace Hopper', address='1 Navy Yard', status=self.status)
+        response = await self.async_client.get('/async/employee_query?search=Hopper')
+        self.assertContains(response, 'Grace Hopper')
+        self.assertNotContains(response, 'Employee 0')
+        response = await self.async_client.get(f'/async/employee_query?status={self.status.pk + 100}')
+        self.assertContains(response, 'Select a valid choice')
+
+    @override_settings(LISTING_PAGE_SIZE=2)
+    async def test_employee_query_pages(self):
+        response = await self.async_client.get('/async/employee_query')
+        self.assertEqual(len(response.context['employees']), 2)
+        cursor = response.context['employees'].next_cursor
+        response = await self.async_client.get(f'/async/employee_query?employee_after={cursor}')
+        self.assertEqual([employee.pk for employee in response.context['employees']], [cursor + 1, cursor + 2])
+
+    async def test_async_requests_are_instrumented(self):
+        registry.clear()
+        await self.async_client.get('/api/async/employees/')
+        stats = registry.report()['GET async_employee_list']
+        # The revisions and the page, run by the ORM's database thread
+        self.assertEqual(stats['max_queries'], 2)
@@ -0,0 +1,194 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from rest_framework.test import APITestCase
+
+from . import hierarchy
+from .models import Employee, ReportingPath, Status
+from .seeding import seed_employees, tree_fanout
+
+
+def create_tree(status=None):
+    '''
+    ceo > cto > dev1, dev2 > intern (under dev1); ceo > cfo
+    '''
+    employees = {}
+    for name, manager in [('ceo', None), ('cto', 'ceo'), ('cfo', 'ceo'), ('dev1', 'cto'), ('dev2', 'cto'), ('intern', 'dev1')]:
+        employees[name] = Employee.objects.create(name=name, address='Main St', status=status, reports_to=employees.get(manager))
+    return employees
+
+
+class HierarchyTests(TestCase):
+
+    def setUp(self):
+        self.employees = create_tree(Status.objects.create(em_status='normal'))
+
+    def names(self, employees):
+        return sorted(employee.name for employee in employees)
+
+    def assertPathsCurrent(self):
+        self.assertEqual(hierarchy.path_differences(), (0, 0))
+
+    def test_paths_follow_saves_moves_and_deletes(self):
+        e = self.employees
+        self.assertPathsCurrent()
+        self.assertEqual(self.names(hierarchy.subtree(Employee.objects.all(), e['ceo'].pk)), ['cfo', 'cto', 'dev1', 'dev2', 'intern'])
+        self.assertEqual({x.name: x.depth for x in hierarchy.subtree(Employee.objects.all(), e['cto'].pk)}, {'dev1': 1, 'dev2': 1, 'intern': 2})
+
+        # Moving dev1 moves the intern along
+        e['dev1'].reports_to = e['cfo']
+        e['dev1'].save()
+        self.assertPathsCurrent()
+        self.assertEqual([x.name for x in hierarchy.ancestors(Employee.objects.all(), e['intern'].pk)], ['intern', 'dev1', 'cfo', 'ceo'])
+
+        # Saves that do not change the manager leave the paths alone
+        e['dev1'].name = 'Developer 1'
+        with CaptureQueriesContext(connection) as context:
+            e['dev1'].save()
+        self.assertFalse([query for query in context.captured_queries if 'reportingpath' in query['sql']])
+
+        # A fresh instance (no loaded values) is compared with the paths
+        moved = Employee(pk=e['dev2'].pk, name='dev2', address='Main St', reports_to=None)
+        moved.save()
+        self.assertPathsCurrent()
+        self.assertEqual(hierarchy.span_of_control(e['cto'].pk), {'direct_reports': 0, 'total_reports': 0, 'levels': 0})
+
+        # The reports of a deleted employee are at the top of their own subtree
+        e['cfo'].delete()
+        self.assertIsNone(Employee.objects.get(pk=e['dev1'].pk).reports_to_id)
+        self.assertPathsCurrent()
+        self.assertEqual(hierarchy.span_of_control(e['ceo'].pk), {'direct_reports': 1, 'total_reports': 1, 'levels': 1})
+
+        # Saves of a deferred instance name the column (reports_to_id) in update_fields
+        deferred = Employee.objects.only('name').get(pk=e['dev2'].pk)
+        deferred.reports_to = e['cto']
+        deferred.save()
+        self.assertPathsCurrent()
+        self.assertEqual(hierarchy.span_of_control(e['ceo'].pk), {'direct_reports': 1, 'total_reports': 2, 'levels': 2})
+
+    def test_cycles_are_refused(self):
+        e = self.employees
+        for manager in ('intern', 'cto'):
+            e['cto'].reports_to = e[manager]
+            with self.assertRaises(hierarchy.HierarchyError):
+                e['cto'].save()
+        self.assertEqual(Employee.objects.get(pk=e['cto'].pk).reports_to_id, e['ceo'].pk)
+        self.assertPathsCurrent()
+
+    def test_bulk_created_paths(self):
+        ceo = self.employees['ceo']
+        employees = [Employee(name='lead', address='Main St', reports_to=ceo), Employee(name='member', address='Main St')]
+        Employee.objects.bulk_create(employees)
+        employees[1].reports_to = employees[0]
+        Employee.objects.filter(pk=employees[1].pk).update(reports_to=employees[0])
+        hierarchy.add_employees(employees)
+        self.assertPathsCurrent()
+        self.assertEqual(hierarchy.span_of_control(employees[0].pk), {'direct_reports': 1, 'total_reports': 1, 'levels': 1})
+        self.assertEqual(hierarchy.span_of_control(ceo.pk)['total_reports'], 7)
+
+    def test_rebuild_command(self):
+        e = self.employees
+        # QuerySet.update skips the paths
+        Employee.objects.filter(pk=e['dev2'].pk).update(reports_to=e['cfo'])
+        with self.assertRaisesRegex(CommandError, '1 paths are missing and 1 should not exist'):
+            call_command('rebuild_reporting_paths', '--check', stdout=StringIO())
+        call_command('rebuild_reporting_paths', stdout=StringIO())
+        self.assertPathsCurrent()
+        self.assertEqual(self.names(hierarchy.subtree(Employee.objects.all(), e['cfo'].pk)), ['dev2'])
+
+        Employee.objects.filter(pk=e['ceo'].pk).update(reports_to=e['intern'])
+        with self.assertRaises(CommandError):
+            call_command('rebuild_reporting_paths', stdout=StringIO())
+        self.assertEqual(ReportingPath.objects.filter(descendant=e['intern'], depth__gt=0).count(), 3)
+
+    def test_seeded_tree(self):
+        self.assertEqual(tree_fanout(100000, 10), 4)
+        self.assertEqual(tree_fanout(7, 3), 2)
+        Employee.objects.all().delete()
+        seed_employees(40, image_count=0, batch_size=7, levels=4)
+        self.assertPathsCurrent()
+        top = Employee.objects.get(reports_to=None)
+        # 1 + 3 + 9 employees in the first levels, the last one holds the rest
+        self.assertEqual(hierarchy.span_of_control(top.pk), {'direct_reports': 3, 'total_reports': 39, 'levels': 3})
+        self.assertEqual(Employee.objects.filter(manager=True).count(), 13)
+
+
+class HierarchyAPITests(APITestCase):
+
+    def setUp(self):
+        self.employees = create_tree()
+
+    def test_subtree(self):
+        e = self.employees
+        response = self.client.get(f'/api/employees/{e["ceo"].pk}/subtree/?page_size=2')
+        self.assertEqual(response.status_code, 200)
+        rows = response.data['results']
+        self.assertEqual([(row['name'], row['depth']) for row in rows], [('cto', 1), ('cfo', 1)])
+        rows += self.client.get(response.data['next']).data['results']
+        self.assertEqual([row['name'] for row in rows], ['cto', 'cfo', 'dev1', 'dev2'])
+
+        response = self.client.get(f'/api/employees/{e["cto"].pk}/subtree/?max_depth=1&expand=reports_to&fields=name,reports_to.name')
+        self.assertEqual(response.data['results'], [
+            {'name': 'dev1', 'reports_to': {'name': 'cto'}, 'depth': 1}, {'name': 'dev2', 'reports_to': {'name': 'cto'}, 'depth': 1},
+        ])
+        self.assertEqual(self.client.get(f'/api/employees/{e["intern"].pk}/subtree/').data['results'], [])
+        self.assertEqual(self.client.get(f'/api/employees/{e["cto"].pk}/subtree/?max_depth=0').status_code, 400)
+        self.assertEqual(self.client.get('/api/employees/999999/subtree/').status_code, 404)
+
+    def test_ancestors_and_span_of_control(self):
+        e = self.employees
+        response = self.client.get(f'/api/employees/{e["intern"].pk}/ancestors/?fields=name')
+        self.assertEqual(response.data, [{'name': 'dev1', 'depth': 1}, {'name': 'cto', 'depth': 2}, {'name': 'ceo', 'depth': 3}])
+        self.assertEqual(self.client.get(f'/api/employees/{e["ceo"].pk}/ancestors/').data, [])
+        self.assertEqual(self.client.get('/api/employees/999999/ancestors/').status_code, 404)
+
+        response = self.client.get(f'/api/employees/{e["ceo"].pk}/span-of-control/')
+        self.assertEqual(response.data, {'id': e['ceo'].pk, 'direct_reports': 2, 'total_reports': 5, 'levels': 3})
+        self.assertEqual(self.client.get('/api/employees/999999/span-of-control/').status_code, 404)
+        self.assertEqual(self.client.get('/api/employees/abc/span-of-control/').status_code, 404)
+
+    def test_reporting_line_expansion_is_limited(self):
+        e = self.employees
+        response = self.client.get(f'/api/employees/{e["intern"].pk}/?expand=reports_to.reports_to.reports_to&fields=reports_to')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['reports_to']['reports_to']['reports_to']['name'], 'ceo')
+
+        # Deeper lines are read with the ancestors action, not one self join per level
+        for url in [f'/api/employees/{e["intern"].pk}/', '/api/employees/']:
+            with self.subTest(url):
+                response = self.client.get(url + '?expand=' + '.'.join(['reports_to'] * 80))
+                self.assertEqual(response.status_code, 400)
+
+    def test_hierarchy_reads_are_one_query(self):
+        e = self.employees
+        for path in [f'/api/employees/{e["ceo"].pk}/subtree/', f'/api/employees/{e["intern"].pk}/ancestors/', f'/api/employees/{e["ceo"].pk}/span-of-control/']:
+            with self.subTest(path), CaptureQueriesContext(connection) as context:
+                self.assertEqual(self.client.get(path).status_code, 200)
+            self.assertEqual(len(context.captured_queries), 1)
+
+    def test_moves_through_the_api(self):
+        e = self.employees
+        response = self.client.patch(f'/api/employees/{e["dev2"].pk}/', {'reports_to': e['cfo'].pk})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['reports_to'], e['cfo'].pk)
+        self.assertEqual(self.client.get(f'/api/employees/{e["cfo"].pk}/span-of-control/').data['direct_reports'], 1)
+
+        response = self.client.patch(f'/api/employees/{e["cto"].pk}/', {'reports_to': e['intern'].pk})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('reports_to', response.data)
+
+        # Each move is fine alone, together they are a cycle: nothing is written
+        response = self.client.patch('/api/employees/bulk/', [
+            {'id': e['cto'].pk, 'reports_to': e['cfo'].pk}, {'id': e['cfo'].pk, 'reports_to': e['cto'].pk},
+        ], format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Employee.objects.get(pk=e['cto'].pk).reports_to_id, e['ceo'].pk)
+        self.assertEqual(hierarchy.path_differences(), (0, 0))
+
+        response = self.client.post('/api/employees/bulk/', [{'name': 'new', 'address': 'Main St', 'reports_to': e['intern'].pk}], format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.client.get(f'/api/employees/{e["cto"].pk}/span-of-control/').data['levels'], 3)
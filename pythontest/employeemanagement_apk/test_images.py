@@ -0,0 +1,285 @@
+from django.test import TestCase, override_settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.files.base import ContentFile
+from django.test import RequestFactory
+from rest_framework.test import APITestCase
+from pathlib import Path
+from io import StringIO, BytesIO
+from PIL import Image
+import os
+import shutil
+import tempfile
+
+from .models import Employee, Status, ImageStatus, ImageBlob
+from .images import THUMBNAIL_SIZES
+from . import tasks
+from .views import serve_media
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+TEST_IMAGE_PATH = os.path.join(BASE_DIR, 'test_img', 'img3.jpg')
+
+
+def uploaded_image(name='thumbnail_test.jpg'):
+    with open(TEST_IMAGE_PATH, 'rb') as img_file:
+        return SimpleUploadedFile(name, img_file.read(), content_type='image/jpeg')
+
+
+def jpeg_with_exif(name='exif_test.jpg', size=(120, 80)):
+    '''
+    Helper function to build a JPEG upload carrying EXIF metadata.
+    '''
+    exif = Image.Exif()
+    exif[0x010F] = 'Camera maker'
+    output = BytesIO()
+    Image.new('RGB', size, 'red').save(output, 'JPEG', exif=exif.tobytes())
+    return SimpleUploadedFile(name, output.getvalue(), content_type='image/jpeg')
+
+
+class TemporaryMediaMixin:
+    '''
+    Store the uploads and their thumbnails in a temporary MEDIA_ROOT and
+    process the images synchronously once the transaction commits.
+    '''
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.media_override = override_settings(MEDIA_ROOT=self.media_root, IMAGE_WORKERS=0)
+        self.media_override.enable()
+        super().setUp()
+
+    def tearDown(self):
+        super().tearDown()
+        self.media_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def create_employee(self, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            employee = Employee.objects.create(name=kwargs.pop('name', 'John'), address='Home', **kwargs)
+        employee.refresh_from_db()
+        return employee
+
+    def media_exists(self, url):
+        return os.path.exists(os.path.join(self.media_root, url.replace('/media/', '', 1)))
+
+
+class ThumbnailTests(TemporaryMediaMixin, TestCase):
+
+    def test_thumbnails_created_on_upload(self):
+        employee = self.create_employee(image=uploaded_image())
+        self.assertEqual(employee.image_status, ImageStatus.READY)
+
+        thumbnails = employee.thumbnails
+        self.assertEqual(set(thumbnails), set(THUMBNAIL_SIZES))
+        for urls in thumbnails.values():
+            self.assertTrue(urls['webp'].endswith('.webp'))
+            self.assertTrue(urls['fallback'].endswith('.jpg'))
+            self.assertTrue(self.media_exists(urls['webp']))
+            self.assertTrue(self.media_exists(urls['fallback']))
+
+        self.assertEqual(len(employee.image_hash), 64)
+
+    def test_same_content_shares_thumbnails(self):
+        first = self.create_employee(image=uploaded_image('a.jpg'))
+        second = self.create_employee(name='Jane', image=uploaded_image('b.jpg'))
+        self.assertEqual(first.thumbnails, second.thumbnails)
+
+    def test_command_regenerates_missing_thumbnails(self):
+        employee = self.create_employee(image=uploaded_image())
+        Employee.objects.filter(pk=employee.pk).update(image_thumbnails={})
+        shutil.rmtree(os.path.join(self.media_root, 'images', 'thumbs'))
+
+        out = StringIO()
+        call_command('generate_thumbnails', stdout=out)
+        self.assertIn('Generated thumbnails for 1 employees', out.getvalue())
+        employee.refresh_from_db()
+        self.assertTrue(self.media_exists(employee.thumbnails['small']['webp']))
+
+        # Nothing left to do the second time
+        out = StringIO()
+        call_command('generate_thumbnails', stdout=out)
+        self.assertIn('Generated thumbnails for 0 employees', out.getvalue())
+
+
+class ImageProcessingTests(TemporaryMediaMixin, TestCase):
+
+    def test_image_is_pending_until_the_transaction_commits(self):
+        employee = Employee.objects.create(name='John', address='Home', image=uploaded_image())
+        self.assertEqual(employee.image_status, ImageStatus.PENDING)
+        self.assertEqual(employee.thumbnails, {})
+
+    @override_settings(IMAGE_MAX_DIMENSION=50)
+    def test_metadata_is_stripped_and_large_images_downscaled(self):
+        employee = self.create_employee(image=jpeg_with_exif())
+        self.assertEqual(employee.image_status, ImageStatus.READY)
+        with Image.open(employee.image.path) as image:
+            self.assertEqual(image.size, (50, 33))
+            self.assertFalse(image.getexif())
+        # The upload was replaced by the re-encoded copy
+        self.assertEqual(list(ImageBlob.objects.filter(references=1).values_list('name', flat=True)), [employee.image.name])
+
+    def test_corrupted_upload_fails(self):
+        upload = SimpleUploadedFile('broken.jpg', b'not an image', content_type='image/jpeg')
+        employee = self.create_employee(image=upload)
+        self.assertEqual(employee.image_status, ImageStatus.FAILED)
+        self.assertTrue(employee.image_error)
+        self.assertEqual(employee.thumbnails, {})
+
+    def test_pillow_runs_in_worker_processes(self):
+        with override_settings(IMAGE_PROCESSES=1):
+            self.assertNotEqual(tasks.render(os.getpid), os.getpid())
+            # Their exceptions are raised in the caller, the image is marked failed
+            employee = self.create_employee(image=SimpleUploadedFile('broken.jpg', b'not an image', content_type='image/jpeg'))
+        self.assertEqual(employee.image_status, ImageStatus.FAILED)
+        with override_settings(IMAGE_PROCESSES=0):
+            self.assertEqual(tasks.render(os.getpid), os.getpid())
+
+    def test_process_images_command(self):
+        # Work lost with the web process (no on_commit callback ran)
+        Employee.objects.create(name='John', address='Home', image=uploaded_image())
+        Employee.objects.create(name='Jane', address='Home', image=SimpleUploadedFile('broken.jpg', b'nope'))
+
+        out = StringIO()
+        call_command('process_images', stdout=out)
+        self.assertIn('Processed 1 images (1 failed)', out.getvalue())
+        self.assertEqual(Employee.objects.get(name='John').image_status, ImageStatus.READY)
+
+        out = StringIO()
+        call_command('process_images', '--retry', stdout=out)
+        self.assertIn('Queued 1 images again', out.getvalue())
+        self.assertIn('Processed 0 images (1 failed)', out.getvalue())
+
+
+class ImageStorageTests(TemporaryMediaMixin, TestCase):
+
+    def gc_images(self):
+        out = StringIO()
+        call_command('gc_images', '--grace-period', '0', stdout=out)
+        return out.getvalue()
+
+    def test_uploads_are_content_addressed(self):
+        first = self.create_employee(image=uploaded_image('a.jpg'))
+        second = self.create_employee(name='Jane', image=uploaded_image('b.jpg'))
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertRegex(first.image.name, r'^images/[0-9a-f]{2}/[0-9a-f]{64}\.jpg$')
+        self.assertEqual(first.image.name.split('/')[-1][:64], first.image_hash)
+        self.assertEqual(ImageBlob.objects.get(name=first.image.name).references, 2)
+        self.assertEqual(len(os.listdir(os.path.dirname(first.image.path))), 1)
+
+    def test_replaced_and_deleted_images_are_collected(self):
+        employee = self.create_employee(image=uploaded_image())
+        old_image, old_thumbnail = employee.image.url, employee.thumbnails['small']['webp']
+
+        employee.image = jpeg_with_exif('new.jpg')
+        with self.captureOnCommitCallbacks(execute=True):
+            employee.save()
+        employee.refresh_from_db()
+        self.assertEqual(employee.image_status, ImageStatus.READY)
+        self.assertEqual(ImageBlob.objects.get(name=old_image.replace('/media/', '', 1)).references, 0)
+
+        # Kept during the grace period
+        out = StringIO()
+        call_command('gc_images', stdout=out)
+        self.assertIn('Deleted 0 files', out.getvalue())
+        self.assertTrue(self.media_exists(old_image))
+
+        self.gc_images()
+        self.assertFalse(self.media_exists(old_image))
+        self.assertFalse(self.media_exists(old_thumbnail))
+        self.assertTrue(self.media_exists(employee.image.url))
+
+        image, thumbnail = employee.image.url, employee.thumbnails['small']['webp']
+        employee.delete()
+        self.gc_images()
+        self.assertFalse(self.media_exists(image))
+        self.assertFalse(self.media_exists(thumbnail))
+        self.assertFalse(ImageBlob.objects.exists())
+
+    def test_shared_files_are_kept(self):
+        first = self.create_employee(image=uploaded_image('a.jpg'))
+        second = self.create_employee(name='Jane', image=uploaded_image('b.jpg'))
+        first.delete()
+        self.gc_images()
+        self.assertTrue(self.media_exists(second.image.url))
+        self.assertTrue(self.media_exists(second.thumbnails['small']['webp']))
+
+    def test_recount_and_dedupe_legacy_files(self):
+        storage = Employee._meta.get_field('image').storage
+        with open(TEST_IMAGE_PATH, 'rb') as img_file:
+            content = img_file.read()
+        # Files stored before the content addressed storage, with Django's suffixes
+        for name in ('images/img3.jpg', 'images/img3_AbC123x.jpg'):
+            path = os.path.join(self.media_root, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as legacy:
+                legacy.write(content)
+        Employee.objects.bulk_create([
+            Employee(name='John', address='Home', image='images/img3.jpg'),
+            Employee(name='Jane', address='Home', image='images/img3_AbC123x.jpg'),
+        ])
+
+        out = StringIO()
+        call_command('gc_images', '--recount', '--grace-period', '0', stdout=out)
+        self.assertIn('Fixed 2 reference counts', out.getvalue())
+        self.assertIn('Deleted 0 files', out.getvalue())
+
+        out = StringIO()
+        call_command('dedupe_images', stdout=out)
+        self.assertIn('Moved 2 images', out.getvalue())
+        names = set(Employee.objects.values_list('image', flat=True))
+        self.assertEqual(len(names), 1)
+        self.assertEqual(ImageBlob.objects.get(name=names.pop()).references, 2)
+
+        self.assertIn('Deleted 2 files', self.gc_images())
+        self.assertFalse(storage.exists('images/img3.jpg'))
+
+    def test_content_addressed_files_are_cached(self):
+        storage = Employee._meta.get_field('image').storage
+        name = storage.save('images/photo.jpg', ContentFile(b'content'))
+        response = serve_media(RequestFactory().get(f'/media/{name}'), name)
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+
+        os.makedirs(os.path.join(self.media_root, 'images'), exist_ok=True)
+        with open(os.path.join(self.media_root, 'images', 'legacy.jpg'), 'wb') as legacy:
+            legacy.write(b'content')
+        response = serve_media(RequestFactory().get('/media/images/legacy.jpg'), 'images/legacy.jpg')
+        self.assertNotIn('Cache-Control', response)
+
+
+class ThumbnailAPITests(TemporaryMediaMixin, APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.status = Status.objects.create(em_status='normal')
+
+    def post_employee(self, image):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/employees/', {
+                'name': 'John', 'address': 'Home', 'manager': False, 'status': self.status.id, 'image': image,
+            }, format='multipart')
+        return response
+
+    def test_serializer_exposes_thumbnails(self):
+        response = self.post_employee(uploaded_image())
+        self.assertEqual(response.status_code, 201)
+        # The response is sent before the worker ran
+        self.assertEqual(response.data['image_status'], ImageStatus.PENDING)
+
+        response = self.client.get(f'/api/employees/{response.data["id"]}/')
+        self.assertEqual(response.data['image_status'], ImageStatus.READY)
+        self.assertTrue(response.data['thumbnails']['small']['webp'].startswith('http://testserver/media/images/thumbs/'))
+
+    def test_poll_image_status(self):
+        response = self.post_employee(SimpleUploadedFile('broken.png', b'not an image', content_type='image/png'))
+        self.assertEqual(response.status_code, 201)
+
+        response = self.client.get(f'/api/employees/{response.data["id"]}/image-status/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['image_status'], ImageStatus.FAILED)
+        self.assertEqual(response.data['thumbnails'], {})
+
+    def test_extension_is_still_validated(self):
+        response = self.post_employee(SimpleUploadedFile('notes.txt', b'text', content_type='text/plain'))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('image', response.data)
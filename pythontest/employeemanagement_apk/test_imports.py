@@ -0,0 +1,102 @@
+from django.test import TestCase
+from django.core.management import call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from rest_framework import status
+from rest_framework.test import APITestCase
+from io import StringIO
+import json
+import os
+import tempfile
+
+from .models import Employee, Department, Position, Status
+from .imports import EmployeeImporter
+
+CSV_HEADER = 'name,address,manager,status,position,department,manages_department\n'
+
+
+class ImportEmployeesTests(TestCase):
+
+    def setUp(self):
+        Status.objects.create(em_status='normal')
+        Position.objects.create(name='Developer', salary=1000)
+        self.department = Department.objects.create(name='IT')
+
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'employees.csv')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write_csv(self, rows):
+        with open(self.path, 'w', newline='') as csv_file:
+            csv_file.write(CSV_HEADER + ''.join(f'{row}\n' for row in rows))
+
+    def test_import(self):
+        self.write_csv([
+            'Somchai,Bangkok,yes,normal,Developer,IT,IT',
+            'Malee,Chiang Mai,no,normal,,IT,',
+        ])
+        out = StringIO()
+        call_command('import_employees', self.path, stdout=out)
+
+        self.assertEqual(Employee.objects.count(), 2)
+        employee = Employee.objects.get(name='Somchai')
+        self.assertEqual(employee.position.name, 'Developer')
+        self.department.refresh_from_db()
+        self.assertEqual(self.department.manager, employee)
+
+    def test_invalid_rows_are_skipped(self):
+        '''
+        Unknown lookups, missing fields and non manager department managers are reported, valid rows imported.
+        '''
+        self.write_csv([
+            'Somchai,Bangkok,no,unknown,,,',
+            ',Bangkok,no,,,,',
+            'Malee,Chiang Mai,no,,,,IT',
+            'John,Phuket,no,normal,,,',
+        ])
+        with open(self.path, newline='') as lines:
+            result = EmployeeImporter().run(lines)
+        self.assertEqual(result.created, 1)
+        self.assertEqual([error['line'] for error in result.errors], [2, 3, 4])
+        self.assertIn('status', result.errors[0]['errors'])
+        self.assertIn('manages_department', result.errors[2]['errors'])
+        self.department.refresh_from_db()
+        self.assertIsNone(self.department.manager)
+
+    def test_resume_from_checkpoint(self):
+        self.write_csv([f'Employee {i},Street {i},no,normal,,,' for i in range(10)])
+        checkpoint = os.path.join(self.directory.name, 'checkpoint.json')
+        with open(checkpoint, 'w') as checkpoint_file:
+            json.dump({'rows': 6, 'created': 5, 'skipped': 1}, checkpoint_file)
+
+        call_command('import_employees', self.path, '--checkpoint', checkpoint, '--resume', '--batch-size', '3', stdout=StringIO())
+        self.assertEqual(list(Employee.objects.values_list('name', flat=True)), [f'Employee {i}' for i in range(6, 10)])
+        with open(checkpoint) as checkpoint_file:
+            self.assertEqual(json.load(checkpoint_file), {'rows': 10, 'created': 9, 'skipped': 1})
+
+        # The result counts the rows imported before the checkpoint
+        with open(checkpoint, 'w') as checkpoint_file:
+            json.dump({'rows': 8, 'created': 8, 'skipped': 0}, checkpoint_file)
+        with open(self.path, newline='') as lines:
+            result = EmployeeImporter(checkpoint_path=checkpoint).run(lines, resume=True)
+        self.assertEqual((result.rows, result.created, result.skipped), (10, 10, 0))
+
+
+class ImportAPITests(APITestCase):
+
+    def test_upload_csv(self):
+        Status.objects.create(em_status='normal')
+        content = (CSV_HEADER + 'Somchai,Bangkok,yes,normal,,,\nJohn,Phuket,maybe,,,,\n').encode()
+        response = self.client.post('/api/employees/import/', {
+            'file': SimpleUploadedFile('employees.csv', content, content_type='text/csv'),
+        }, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['created'], 1)
+        self.assertEqual(response.data['errors'][0]['line'], 3)
+
+    def test_upload_requires_columns(self):
+        response = self.client.post('/api/employees/import/', {
+            'file': SimpleUploadedFile('employees.csv', b'first,second\n', content_type='text/csv'),
+        }, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,287 @@
+from collections import Counter, namedtuple
+import os
+import re
+
+from django.contrib.auth.models import User
+from django.core.cache import cache, caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLResolver
+from rest_framework.test import APIClient
+
+from . import lookups, urls
+from .models import Employee, Department, Position, Status
+from .test_images import TemporaryMediaMixin
+
+'''
+
+Query budget of every view and API route.
+
+Each case is requested once with SMALL and once with LARGE rows in every
+table, with cold caches. The number of queries must be the same: a query run
+per row (an N+1, e.g. {{ department.manager }} without select_related) fails
+the test with the queries that were repeated. test_every_route_has_a_case
+makes sure a new URL or router action gets a case too.
+
+
+'''
+
+# Rows per lookup table, employees are EMPLOYEES_PER_ROW times that
+SMALL = 2
+LARGE = 6
+EMPLOYEES_PER_ROW = 3
+
+# build(test) -> request kwargs (path, data, format), called outside the captured queries
+Case = namedtuple('Case', ['name', 'method', 'build', 'anonymous'], defaults=[False])
+
+CSV_CONTENT = (
+    'name,address,manager,status,position,department,manages_department\n'
+    'Somchai,Bangkok,yes,,,,\n'
+    'John,Phuket,no,,,,\n'
+).encode()
+
+
+def page(path, **kwargs):
+    return lambda test: {'path': path, **kwargs}
+
+
+def employee_data(test):
+    return {'name': 'New', 'address': 'Home', 'manager': 'false', 'status': test.status.pk, 'department': test.department.pk}
+
+
+CASES = [
+    # Pages
+    Case('index', 'get', page('/')),
+    Case('about', 'get', page('/about')),
+    Case('database', 'get', page('/database')),
+    Case('employee_query', 'get', page('/employee_query')),
+    Case('employee_query', 'get', lambda test: {'path': f'/employee_query?department={test.department.pk}&search=Emp'}),
+    Case('async_employee_query', 'get', page('/async/employee_query')),
+    Case('async_employee_query', 'get', lambda test: {'path': f'/async/employee_query?department={test.department.pk}&search=Emp'}),
+    Case('export_employees', 'get', page('/export/employees')),
+    Case('export_employees', 'get', page('/export/employees?format=ndjson')),
+    Case('metrics', 'get', page('/metrics')),
+    Case('media', 'get', page('/media/images/budget.png')),
+    Case('login', 'get', page('/login'), anonymous=True),
+    Case('login', 'post', page('/login', data={'username': 'admin', 'password': 'secret-pass-123'}), anonymous=True),
+    Case('register', 'get', page('/register'), anonymous=True),
+    Case('register', 'post', lambda test: {'path': '/register', 'data': {
+        'username': test.unique('user'), 'password1': 'secret-pass-123', 'password2': 'secret-pass-123',
+    }}, anonymous=True),
+    Case('logout', 'get', page('/logout'), anonymous=True),
+
+    # HTML forms
+    Case('create_employee', 'get', page('/create/employee/')),
+    Case('create_employee', 'post', lambda test: {'path': '/create/employee/', 'data': employee_data(test)}),
+    Case('update_employee', 'get', lambda test: {'path': f'/update/employee/{test.new_employee().pk}'}),
+    Case('update_employee', 'post', lambda test: {'path': f'/update/employee/{test.new_employee().pk}', 'data': employee_data(test)}),
+    Case('delete_employee', 'get', lambda test: {'path': f'/delete/employee/{test.new_employee().pk}'}),
+    Case('create_position', 'get', page('/create/position/')),
+    Case('create_position', 'post', lambda test: {'path': '/create/position/', 'data': {'name': test.unique('position'), 'salary': 10}}),
+    Case('update_position', 'get', lambda test: {'path': f'/update/position/{test.position.pk}'}),
+    Case('update_position', 'post', lambda test: {'path': f'/update/position/{test.position.pk}', 'data': {'name': 'Developer', 'salary': 20}}),
+    Case('delete_position', 'get', lambda test: {'path': f'/delete/position/{Position.objects.create(name="Old", salary=1).pk}'}),
+    Case('create_department', 'get', page('/create/department/')),
+    Case('create_department', 'post', lambda test: {'path': '/create/department/', 'data': {'name': test.unique('department')}}),
+    Case('update_department', 'get', lambda test: {'path': f'/update/department/{test.department.pk}'}),
+    Case('update_department', 'post', lambda test: {'path': f'/update/department/{test.department.pk}', 'data': {'name': 'IT', 'manager': test.manager.pk}}),
+    Case('delete_department', 'get', lambda test: {'path': f'/delete/department/{Department.objects.create(name="Old").pk}'}),
+    Case('create_status', 'get', page('/create/status/')),
+    Case('create_status', 'post', lambda test: {'path': '/create/status/', 'data': {'em_status': test.unique('status')}}),
+    Case('update_status', 'get', lambda test: {'path': f'/update/status/{test.status.pk}'}),
+    Case('update_status', 'post', lambda test: {'path': f'/update/status/{test.status.pk}', 'data': {'em_status': 'normal'}}),
+    Case('delete_status', 'get', lambda test: {'path': f'/delete/status/{Status.objects.create(em_status="Old").pk}'}),
+
+    # API
+    Case('api-root', 'get', page('/api/')),
+    Case('cache_stats', 'get', page('/api/cache-stats/')),
+    Case('employee_report', 'get', page('/api/reports/employees/?group_by=department,status')),
+    Case('employee_report', 'get', page('/api/reports/employees/?group_by=department&source=live')),
+    Case('lookup_tables', 'get', page('/api/lookups/')),
+    Case('request_stats', 'get', page('/api/request-stats/')),
+    Case('async_employee_list', 'get', page('/api/async/employees/?expand=status,position,department.manager')),
+    Case('async_employee_detail', 'get', lambda test: {'path': f'/api/async/employees/{test.manager.pk}/?expand=department.manager'}),
+    Case('async_lookup_tables', 'get', page('/api/async/lookups/')),
+    Case('employee-list', 'get', page('/api/employees/')),
+    Case('employee-list', 'get', page('/api/employees/?expand=status,position,department.manager')),
+    Case('employee-list', 'post', lambda test: {'path': '/api/employees/', 'data': employee_data(test), 'format': 'multipart'}),
+    Case('employee-detail', 'get', lambda test: {'path': f'/api/employees/{test.manager.pk}/?expand=department.manager'}),
+    Case('employee-detail', 'put', lambda test: {'path': f'/api/employees/{test.new_employee().pk}/', 'data': employee_data(test), 'format': 'multipart'}),
+    Case('employee-detail', 'patch', lambda test: {'path': f'/api/employees/{test.new_employee().pk}/', 'data': {'name': 'Renamed'}, 'format': 'multipart'}),
+    Case('employee-detail', 'delete', lambda test: {'path': f'/api/employees/{test.new_employee().pk}/'}),
+    Case('employee-image-status', 'get', lambda test: {'path': f'/api/employees/{test.manager.pk}/image-status/'}),
+    Case('employee-subtree', 'get', lambda test: {'path': f'/api/employees/{test.top.pk}/subtree/?expand=reports_to'}),
+    Case('employee-ancestors', 'get', lambda test: {'path': f'/api/employees/{test.last_employee().pk}/ancestors/?expand=department'}),
+    Case('employee-span-of-control', 'get', lambda test: {'path': f'/api/employees/{test.top.pk}/span-of-control/'}),
+    Case('employee-import-csv', 'post', lambda test: {'path': '/api/employees/import/', 'data': {
+        'file': SimpleUploadedFile('employees.csv', CSV_CONTENT, content_type='text/csv'),
+    }, 'format': 'multipart'}),
+    Case('employee-bulk', 'post', lambda test: {'path': '/api/employees/bulk/', 'data': [
+        {'name': 'Bulk 1', 'address': 'Home', 'status': test.status.pk}, {'name': 'Bulk 2', 'address': 'Home', 'department': test.department.pk},
+    ], 'format': 'json'}),
+    Case('employee-bulk', 'patch', lambda test: {'path': '/api/employees/bulk/', 'data': [
+        {'id': test.new_employee().pk, 'name': 'Bulk 1'}, {'id': test.new_employee().pk, 'position': test.position.pk},
+    ], 'format': 'json'}),
+    Case('employee-bulk', 'delete', lambda test: {'path': '/api/employees/bulk/', 'data': [
+        test.new_employee().pk, test.new_employee().pk,
+    ], 'format': 'json'}),
+]
+
+# The same routes for the lookup tables: (basename, model, fields of a new row)
+for basename, route, model, fields in [
+    ('position', 'positions', Position, lambda test: {'name': test.unique('position'), 'salary': 10}),
+    ('department', 'departments', Department, lambda test: {'name': test.unique('department')}),
+    ('status', 'statuses', Status, lambda test: {'em_status': test.unique('status')}),
+]:
+    new_row = (lambda model, fields: lambda test: model.objects.create(**fields(test)))(model, fields)
+    CASES += [
+        Case(f'{basename}-list', 'get', page(f'/api/{route}/')),
+        Case(f'{basename}-list', 'post', lambda test, route=route, fields=fields: {'path': f'/api/{route}/', 'data': fields(test), 'format': 'json'}),
+        Case(f'{basename}-detail', 'get', lambda test, route=route, new_row=new_row: {'path': f'/api/{route}/{new_row(test).pk}/'}),
+        Case(f'{basename}-detail', 'put', lambda test, route=route, fields=fields, new_row=new_row: {
+            'path': f'/api/{route}/{new_row(test).pk}/', 'data': fields(test), 'format': 'json',
+        }),
+        Case(f'{basename}-detail', 'patch', lambda test, route=route, fields=fields, new_row=new_row: {
+            'path': f'/api/{route}/{new_row(test).pk}/', 'data': fields(test), 'format': 'json',
+        }),
+        Case(f'{basename}-detail', 'delete', lambda test, route=route, new_row=new_row: {'path': f'/api/{route}/{new_row(test).pk}/'}),
+        Case(f'{basename}-bulk', 'post', lambda test, route=route, fields=fields: {
+            'path': f'/api/{route}/bulk/', 'data': [fields(test), fields(test)], 'format': 'json',
+        }),
+        Case(f'{basename}-bulk', 'patch', lambda test, route=route, fields=fields, new_row=new_row: {
+            'path': f'/api/{route}/bulk/', 'data': [{'id': new_row(test).pk, **fields(test)}, {'id': new_row(test).pk, **fields(test)}], 'format': 'json',
+        }),
+        Case(f'{basename}-bulk', 'delete', lambda test, route=route, new_row=new_row: {
+            'path': f'/api/{route}/bulk/', 'data': [new_row(test).pk, new_row(test).pk], 'format': 'json',
+        }),
+    ]
+
+
+def routes(patterns):
+    '''
+    {url name: methods of its router actions, or None for a plain view}
+    '''
+    found = {}
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            found.update(routes(pattern.url_patterns))
+        elif pattern.name:
+            actions = getattr(pattern.callback, 'actions', None)
+            # DRF adds head (answered by get) once the view was called
+            found[pattern.name] = set(actions) - {'head'} if actions else None
+    return found
+
+
+def query_shapes(queries):
+    # The SQL without its values, so the same query on another row counts as a repeat
+    shapes = Counter()
+    for query in queries:
+        sql = re.sub(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b", '?', query['sql'])
+        shapes[re.sub(r'\(\?(?:, \?)*\)', '(...)', sql)] += 1
+    return shapes
+
+
+# A fast password hasher for the login and register cases
+@override_settings(LISTING_PAGE_SIZE=100, PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class QueryBudgetTests(TemporaryMediaMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.create_superuser(username='admin', password='secret-pass-123')
+        self.client = APIClient()
+        self.client.force_login(self.admin)
+        self.anonymous = APIClient()
+        self.counter = 0
+        self.rows = 0
+
+        os.makedirs(os.path.join(self.media_root, 'images'))
+        with open(os.path.join(self.media_root, 'images', 'budget.png'), 'wb') as image:
+            image.write(b'not really a picture')
+
+        self.populate(SMALL)
+        self.status, self.position, self.department = Status.objects.first(), Position.objects.first(), Department.objects.first()
+        self.manager = self.department.manager
+        self.top = Employee.objects.get(name='Employee 0 0')
+
+    def unique(self, prefix):
+        self.counter += 1
+        return f'{prefix} {self.counter}'
+
+    def new_employee(self):
+        return Employee.objects.create(name='Target', address='Home', status=self.status, position=self.position, department=self.department)
+
+    def last_employee(self):
+        return Employee.objects.filter(name__startswith='Employee').order_by('pk').last()
+
+    def populate(self, rows):
+        '''
+        Add rows to every table until populate created `rows` of them, with EMPLOYEES_PER_ROW employees per department.
+        The managers of the departments report to the previous one, the other employees to their department's manager.
+        '''
+        previous = Employee.objects.filter(name=f'Employee {self.rows - 1} 0').first()
+        for index in range(self.rows, rows):
+            status = Status.objects.create(em_status=f'Status {index}')
+            position = Position.objects.create(name=f'Position {index}', salary=1000 + index)
+            department = Department.objects.create(name=f'Department {index}')
+            employees = []
+            for number in range(EMPLOYEES_PER_ROW):
+                employees.append(Employee.objects.create(
+                    name=f'Employee {index} {number}', address='Main St', manager=number == 0,
+                    status=status, position=position, department=department, reports_to=employees[0] if employees else previous,
+                ))
+            previous = employees[0]
+            department.manager = employees[0]
+            department.save()
+        self.rows = max(self.rows, rows)
+
+    def run_case(self, case):
+        client = self.anonymous if case.anonymous else self.client
+        request = case.build(self)
+        path = request.pop('path')
+        # Cold caches: the fragment cache, the API response cache and the lookup tables
+        cache.clear()
+        caches['api'].clear()
+        lookups.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            with CaptureQueriesContext(connection) as context:
+                response = getattr(client, case.method)(path, **request)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+        self.assertLess(response.status_code, 400, f'{case.method.upper()} {path}: {getattr(response, "data", response.status_code)}')
+        if case.anonymous and case.name == 'login' and case.method == 'post':
+            self.anonymous.logout()
+        return context.captured_queries
+
+    def run_cases(self, cases):
+        return [self.run_case(case) for case in cases]
+
+    def test_every_route_has_a_case(self):
+        covered = {}
+        for case in CASES:
+            covered.setdefault(case.name, set()).add(case.method)
+        for name, methods in routes(urls.urlpatterns).items():
+            with self.subTest(name):
+                self.assertIn(name, covered, f'Add a QueryBudgetTests case for the "{name}" URL.')
+                if methods:
+                    self.assertEqual(methods - covered[name], set(), f'Add QueryBudgetTests cases for these methods of "{name}".')
+
+    def test_queries_do_not_grow_with_rows(self):
+        # Media files are only routed with DEBUG
+        cases = [case for case in CASES if case.name in routes(urls.urlpatterns)]
+        # The first round creates what only the first request creates (e.g. summary groups)
+        self.run_cases(cases)
+        small = self.run_cases(cases)
+        self.populate(LARGE)
+        large = self.run_cases(cases)
+
+        for case, small_queries, large_queries in zip(cases, small, large):
+            with self.subTest(f'{case.method.upper()} {case.name}'):
+                if len(small_queries) != len(large_queries):
+                    repeated = query_shapes(large_queries) - query_shapes(small_queries)
+                    self.fail(
+                        f'{case.method.upper()} {case.name} ran {len(small_queries)} queries with {SMALL} rows per table '
+                        f'and {len(large_queries)} with {LARGE}. Queries repeated per row:\n'
+                        + '\n'.join(f'{count}x {sql}' for sql, count in repeated.most_common())
+                    )
@@ -0,0 +1,79 @@
+from django.core.management import call_command
+from django.test import TransactionTestCase, override_settings
+from rest_framework.test import APIClient
+
+from . import replicas
+from .models import Employee, Status, ReplicaHeartbeat
+from .replicas import PIN_COOKIE, reading_from_replica
+
+
+# Image processing inline: a pool thread reading the test database would lock its tables
+@override_settings(DATABASE_REPLICAS=['replica'], API_CACHE='api', IMAGE_WORKERS=0)
+class ReplicaTests(TransactionTestCase):
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        replicas.clear_checks()
+        self.status = Status.objects.create(em_status='normal')
+        self.employee = Employee.objects.create(name='Ada Lovelace', address='1 Main St', status=self.status)
+        call_command('refresh_replicas', verbosity=0)
+
+    def names(self, response):
+        return [row['name'] for row in response.json()['results']]
+
+    def test_lists_are_read_from_the_replica(self):
+        Employee.objects.create(name='Alan Turing', address='2 Main St', status=self.status)
+        client = APIClient()
+
+        response = client.get('/api/employees/')
+        self.assertEqual(self.names(response), ['Ada Lovelace'])
+        # Not cached: the replica may be behind the cache token
+        self.assertEqual(client.get('/api/employees/')['X-Cache'], 'MISS')
+        self.assertEqual(self.names(client.get('/api/async/employees/')), ['Ada Lovelace'])
+        # Other reads use the primary
+        self.assertEqual(client.get(f'/api/employees/{Employee.objects.last().pk}/').status_code, 200)
+
+        call_command('refresh_replicas', database=['replica'], verbosity=0)
+        self.assertEqual(self.names(client.get('/api/employees/')), ['Ada Lovelace', 'Alan Turing'])
+
+    def test_reports_are_read_from_the_replica(self):
+        Employee.objects.create(name='Alan Turing', address='2 Main St', status=self.status)
+        client = APIClient()
+        self.assertEqual(client.get('/api/reports/employees/').json()['total']['headcount'], 1)
+
+        call_command('refresh_replicas', database=['replica'], verbosity=0)
+        self.assertEqual(client.get('/api/reports/employees/').json()['total']['headcount'], 2)
+
+    def test_clients_read_their_writes(self):
+        writer, reader = APIClient(), APIClient()
+        response = writer.patch(f'/api/employees/{self.employee.pk}/', {'name': 'Ada King'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(PIN_COOKIE, response.cookies)
+
+        response = reader.get('/api/employees/')
+        self.assertEqual(self.names(response), ['Ada Lovelace'])
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+        self.assertEqual(self.names(writer.get('/api/employees/')), ['Ada King'])
+        # The page read from the primary is cached, everyone gets it now
+        self.assertEqual(self.names(reader.get('/api/employees/')), ['Ada King'])
+
+    @override_settings(REPLICA_MAX_LAG_SECONDS=0)
+    def test_stale_replicas_are_skipped(self):
+        Employee.objects.create(name='Alan Turing', address='2 Main St', status=self.status)
+        self.assertEqual(self.names(APIClient().get('/api/employees/')), ['Ada Lovelace', 'Alan Turing'])
+
+    def test_replica_without_heartbeat_is_skipped(self):
+        ReplicaHeartbeat.objects.using('replica').all().delete()
+        replicas.clear_checks()
+        with reading_from_replica():
+            self.assertIsNone(replicas.current_replica())
+
+    def test_objects_read_from_the_replica_are_saved_to_the_primary(self):
+        with reading_from_replica():
+            employee = Employee.objects.select_related('status').get(pk=self.employee.pk)
+            self.assertEqual(employee._state.db, 'replica')
+            employee.name = 'Ada King'
+            employee.save()
+            # Reads after a write see it
+            self.assertEqual(Employee.objects.get(pk=employee.pk).name, 'Ada King')
+        self.assertEqual(Employee.objects.using('replica').get(pk=employee.pk).name, 'Ada Lovelace')
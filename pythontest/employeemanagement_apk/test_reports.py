@@ -0,0 +1,231 @@
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+from rest_framework.test import APITestCase
+from io import StringIO
+
+from .models import Employee, EmployeeSummary, Department, Position, Status, ImageBlob
+from .reports import employee_report, summary_differences, department_stats_differences
+from .search import search_employees
+from .seeding import seed_employees
+from .test_images import TemporaryMediaMixin
+
+
+class EmployeeReportTests(APITestCase):
+
+    def setUp(self):
+        self.normal = Status.objects.create(em_status='normal')
+        self.resigned = Status.objects.create(em_status='resigned')
+        self.developer = Position.objects.create(name='Developer', salary=1000)
+        self.designer = Position.objects.create(name='Designer', salary=700)
+        self.it = Department.objects.create(name='IT')
+        self.hr = Department.objects.create(name='HR')
+
+        self.somchai = Employee.objects.create(name='Somchai', address='1 Silom Rd', status=self.normal, position=self.developer, department=self.it)
+        self.jane = Employee.objects.create(name='Jane', address='2 Main St', status=self.normal, position=self.designer, department=self.it)
+        self.john = Employee.objects.create(name='John', address='3 Main St', status=self.resigned, position=self.developer, department=self.hr)
+
+    def report(self, **params):
+        response = self.client.get('/api/reports/employees/', params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def assertSummaryIsCurrent(self):
+        self.assertEqual(summary_differences(), {})
+        for group_by in [[], ['department'], ['status', 'position'], ['department', 'status', 'position']]:
+            self.assertEqual(employee_report(group_by)['results'], employee_report(group_by, source='live')['results'])
+
+    def test_group_by_department(self):
+        data = self.report(group_by='department')
+        self.assertEqual(data['results'], [
+            {'department': {'id': self.it.id, 'name': 'IT'}, 'headcount': 2, 'payroll': 1700},
+            {'department': {'id': self.hr.id, 'name': 'HR'}, 'headcount': 1, 'payroll': 1000},
+        ])
+        self.assertEqual(data['total'], {'headcount': 3, 'payroll': 2700})
+
+    def test_multi_dimensional_group_by(self):
+        data = self.report(group_by='status,department')
+        self.assertEqual([(row['status']['name'], row['department']['name'], row['headcount']) for row in data['results']], [
+            ('normal', 'IT', 2), ('resigned', 'HR', 1),
+        ])
+
+    def test_unknown_group_by(self):
+        response = self.client.get('/api/reports/employees/', {'group_by': 'salary'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get('/api/reports/employees/', {'source': 'guess'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_summary_follows_changes(self):
+        self.jane.department = self.hr
+        self.jane.save()
+        self.jane.status = self.resigned
+        self.jane.save()
+        self.assertSummaryIsCurrent()
+
+        self.client.patch('/api/employees/bulk/', [{'id': self.somchai.id, 'position': self.designer.id}], format='json')
+        self.client.post('/api/employees/bulk/', [{'name': 'New', 'address': 'Home', 'manager': False, 'status': self.normal.id}], format='json')
+        self.assertSummaryIsCurrent()
+
+        self.john.delete()
+        self.assertSummaryIsCurrent()
+
+    def test_instances_without_loaded_groups(self):
+        Employee.objects.bulk_create([Employee(name=f'Employee {i}', address='Home', status=self.normal, department=self.it) for i in range(20)])
+        call_command('rebuild_employee_summary', stdout=StringIO())
+
+        # The previous group is read for the one row, the summary is not rebuilt
+        jane = Employee.objects.only('name').get(pk=self.jane.pk)
+        jane.status = self.resigned
+        with CaptureQueriesContext(connection) as context:
+            jane.save()
+        self.assertFalse([query for query in context.captured_queries if 'GROUP BY' in query['sql']])
+        self.assertSummaryIsCurrent()
+
+        john = Employee(pk=self.john.pk, name='John', address='3 Main St', status=self.normal, department=self.it)
+        john.save()
+        self.assertSummaryIsCurrent()
+        Employee(pk=self.somchai.pk).delete()
+        self.assertSummaryIsCurrent()
+
+    def test_deleted_lookups_and_salary_changes(self):
+        # SET_NULL merges groups, payroll follows the salary without touching the summary
+        self.it.delete()
+        self.normal.delete()
+        self.developer.salary = 2000
+        self.developer.save()
+        self.assertSummaryIsCurrent()
+        self.assertEqual(self.report()['total'], {'headcount': 3, 'payroll': 4700})
+
+        Employee.objects.filter(department__isnull=True).first().delete()
+        self.assertSummaryIsCurrent()
+
+    def test_report_reads_the_groups_not_the_employees(self):
+        Employee.objects.bulk_create([Employee(name=f'Employee {i}', address='Home', status=self.normal, department=self.it) for i in range(50)])
+        call_command('rebuild_employee_summary', stdout=StringIO())
+        self.assertEqual(EmployeeSummary.objects.count(), 4)
+
+        with CaptureQueriesContext(connection) as context:
+            data = self.report(group_by='department')
+        self.assertEqual(data['total']['headcount'], 53)
+        self.assertEqual(len(context.captured_queries), 2)
+
+    def test_check_command(self):
+        call_command('rebuild_employee_summary', '--check', stdout=StringIO())
+
+        EmployeeSummary.objects.update(headcount=5)
+        with self.assertRaises(CommandError):
+            call_command('rebuild_employee_summary', '--check', stdout=StringIO())
+
+        call_command('rebuild_employee_summary', stdout=StringIO())
+        self.assertSummaryIsCurrent()
+
+
+class DepartmentStatsTests(APITestCase):
+
+    def setUp(self):
+        self.developer = Position.objects.create(name='Developer', salary=1000)
+        self.designer = Position.objects.create(name='Designer', salary=700)
+        self.it = Department.objects.create(name='IT')
+        self.hr = Department.objects.create(name='HR')
+
+        self.somchai = Employee.objects.create(name='Somchai', address='1 Silom Rd', position=self.developer, department=self.it)
+        self.jane = Employee.objects.create(name='Jane', address='2 Main St', position=self.designer, department=self.it)
+
+    def stats(self, department):
+        department.refresh_from_db()
+        return department.employee_count, department.total_salary
+
+    def assertStatsAreCurrent(self):
+        self.assertEqual(department_stats_differences(), {})
+
+    def test_counts_follow_employees(self):
+        self.assertEqual(self.stats(self.it), (2, 1700))
+
+        self.jane.department = self.hr
+        self.jane.save()
+        self.assertEqual(self.stats(self.it), (1, 1000))
+        self.assertEqual(self.stats(self.hr), (1, 700))
+
+        self.jane.position = self.developer
+        self.jane.save()
+        self.assertEqual(self.stats(self.hr), (1, 1000))
+
+        self.somchai.delete()
+        self.assertEqual(self.stats(self.it), (0, 0))
+        self.assertStatsAreCurrent()
+
+    def test_counts_follow_salaries_and_deleted_positions(self):
+        self.client.patch('/api/positions/bulk/', [{'id': self.designer.id, 'salary': 800}], format='json')
+        self.assertEqual(self.stats(self.it), (2, 1800))
+
+        self.developer.salary = 1500
+        self.developer.save()
+        self.assertEqual(self.stats(self.it), (2, 2300))
+
+        self.developer.delete()
+        self.assertEqual(self.stats(self.it), (2, 800))
+        self.assertStatsAreCurrent()
+
+    def test_saves_without_loaded_groups_touch_their_departments_only(self):
+        other = Department.objects.create(name='Sales')
+        jane = Employee(pk=self.jane.pk, name='Jane', address='2 Main St', position=self.designer, department=self.hr)
+        with CaptureQueriesContext(connection) as context:
+            jane.save()
+        updates = [query['sql'] for query in context.captured_queries if query['sql'].startswith('UPDATE "employeemanagement_apk_department"')]
+        self.assertEqual(len(updates), 2)
+        self.assertEqual(self.stats(self.it), (1, 1000))
+        self.assertEqual(self.stats(self.hr), (1, 700))
+        self.assertEqual(self.stats(other), (0, 0))
+
+        somchai = Employee.objects.only('name').get(pk=self.somchai.pk)
+        somchai.department = self.hr
+        somchai.save()
+        self.assertEqual(self.stats(self.hr), (2, 1700))
+        self.assertStatsAreCurrent()
+
+    def test_saving_a_department_keeps_the_counts(self):
+        department = Department.objects.get(pk=self.it.pk)
+        Employee.objects.create(name='John', address='3 Main St', position=self.developer, department=self.it)
+        department.name = 'Engineering'
+        department.save()
+        self.assertEqual(self.stats(self.it), (3, 2700))
+
+        response = self.client.get(f'/api/departments/{self.it.pk}/')
+        self.assertEqual((response.data['employee_count'], response.data['total_salary']), (3, 2700))
+
+    def test_rebuild_command(self):
+        call_command('rebuild_department_stats', '--check', stdout=StringIO())
+
+        Department.objects.update(employee_count=9)
+        with self.assertRaises(CommandError):
+            call_command('rebuild_department_stats', '--check', stdout=StringIO())
+
+        call_command('rebuild_department_stats', stdout=StringIO())
+        self.assertStatsAreCurrent()
+
+
+class SeedingTests(TemporaryMediaMixin, TestCase):
+
+    def test_seeded_employees_keep_the_derived_data_current(self):
+        self.assertEqual(seed_employees(300, image_count=2, batch_size=120), 300)
+
+        self.assertEqual(Employee.objects.count(), 300)
+        self.assertEqual(summary_differences(), {})
+        self.assertEqual(department_stats_differences(), {})
+        # The pictures are shared and counted once per employee
+        pictures = Employee.objects.exclude(image='').values('image').distinct().count()
+        self.assertEqual(pictures, 2)
+        self.assertEqual(sum(ImageBlob.objects.values_list('references', flat=True)), Employee.objects.exclude(image='').count())
+        self.assertFalse(Department.objects.filter(manager=None, employee__manager=True).exists())
+        name = Employee.objects.first().name
+        self.assertIn(name, [employee.name for employee in search_employees(Employee.objects.all(), name)])
+
+    def test_same_seed_same_rows(self):
+        seed_employees(20, seed=7, image_count=0)
+        first = list(Employee.objects.order_by('pk').values_list('name', 'status__em_status', 'department__name'))
+        Employee.objects.all().delete()
+        seed_employees(20, seed=7, image_count=0)
+        self.assertEqual(list(Employee.objects.order_by('pk').values_list('name', 'status__em_status', 'department__name')), first)
@@ -0,0 +1,76 @@
+from django.test import TestCase, override_settings
+from django.core.management import call_command
+from io import StringIO
+
+from .models import Employee, Department, Status
+from .search import search_employees
+
+
+class EmployeeSearchTests(TestCase):
+
+    def setUp(self):
+        self.status = Status.objects.create(em_status='normal')
+        self.it = Department.objects.create(name='IT')
+        self.hr = Department.objects.create(name='HR')
+
+        self.somchai = Employee.objects.create(name='Somchai Srisuk', address='12 Silom Rd', status=self.status, department=self.it)
+        self.silom = Employee.objects.create(name='Jane Smith', address='99 Somchai Village', status=self.status, department=self.hr)
+        self.john = Employee.objects.create(name='John Doe', address='1 Main St', status=self.status, department=self.it)
+
+    def search(self, term, queryset=None):
+        queryset = queryset if queryset is not None else Employee.objects.all()
+        return [employee.name for employee in search_employees(queryset, term)]
+
+    def test_prefix_match(self):
+        '''
+        Partial words match as prefixes, like a search-as-you-type box.
+        '''
+        self.assertEqual(self.search('Joh'), ['John Doe'])
+        self.assertEqual(self.search('sri som'), ['Somchai Srisuk'])
+
+    def test_search_address(self):
+        self.assertEqual(self.search('main'), ['John Doe'])
+
+    def test_name_matches_rank_first(self):
+        '''
+        A match on the name ranks above a match on the address.
+        '''
+        self.assertEqual(self.search('somchai'), ['Somchai Srisuk', 'Jane Smith'])
+
+    @override_settings(SEARCH_RANK_CANDIDATES=1)
+    def test_broad_search_lists_name_matches_first(self):
+        '''
+        Searches matching more rows than can be ranked still return name matches first.
+        '''
+        self.assertEqual(self.search('som'), ['Somchai Srisuk', 'Jane Smith'])
+        self.assertEqual(self.search('som', Employee.objects.filter(department=self.hr)), ['Jane Smith'])
+
+    def test_search_with_filters(self):
+        self.assertEqual(self.search('somchai', Employee.objects.filter(department=self.hr)), ['Jane Smith'])
+
+    def test_index_follows_updates_and_deletes(self):
+        self.john.name = 'Johnny Walker'
+        self.john.save()
+        self.assertEqual(self.search('walker'), ['Johnny Walker'])
+
+        self.john.delete()
+        self.assertEqual(self.search('walker'), [])
+
+    def test_operators_are_not_parsed(self):
+        '''
+        FTS5 syntax typed by the user is treated as plain words.
+        '''
+        self.assertEqual(self.search('"John" OR NEAR('), [])
+        self.assertEqual(self.search('***'), [])
+
+    def test_rebuild_index(self):
+        Employee.objects.bulk_create([Employee(name='Bulk Person', address='Nowhere')])
+        self.assertEqual(self.search('bulk'), [])
+
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(self.search('bulk'), ['Bulk Person'])
+
+    def test_employee_query_view(self):
+        response = self.client.get('/employee_query', {'search': 'somc', 'department': self.hr.id})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([employee.name for employee in response.context['employees']], ['Jane Smith'])
@@ -0,0 +1,49 @@
+from io import StringIO
+import json
+import os
+import tempfile
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.test import SimpleTestCase, override_settings
+
+from .sqlite import connect, get_pragmas, read_pragmas
+
+PROFILES = {
+    'default': {},
+    'tuned': {'journal_mode': 'WAL', 'synchronous': 'NORMAL', 'busy_timeout': 1234, 'temp_store': 'MEMORY'},
+}
+
+
+@override_settings(SQLITE_PROFILES=PROFILES, SQLITE_PROFILE='tuned')
+class SQLiteProfileTests(SimpleTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'test.sqlite3')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_profile_is_applied_on_connect(self):
+        connection = connect(self.path, get_pragmas())
+        try:
+            values = read_pragmas(connection.cursor(), ['journal_mode', 'synchronous', 'busy_timeout', 'temp_store'])
+        finally:
+            connection.close()
+        # synchronous NORMAL is 1, temp_store MEMORY is 2
+        self.assertEqual(values, {'journal_mode': 'wal', 'synchronous': 1, 'busy_timeout': 1234, 'temp_store': 2})
+
+    def test_profiles(self):
+        self.assertEqual(get_pragmas('default'), {})
+        with override_settings(SQLITE_PROFILE=None):
+            self.assertEqual(get_pragmas(), {})
+        with self.assertRaises(ImproperlyConfigured):
+            get_pragmas('fast')
+
+    def test_benchmark_command(self):
+        output = StringIO()
+        call_command('benchmark_sqlite', '--workers', '1', '2', '--seconds', '0.2', '--rows', '200', '--json', stdout=output)
+        results = json.loads(output.getvalue())
+        self.assertEqual([(row['setup'], row['workers']) for row in results], [('defaults', 1), ('tuned', 1), ('defaults', 2), ('tuned', 2)])
+        self.assertTrue(all(row['reads_per_second'] > 0 for row in results))
@@ -0,0 +1,279 @@
+from django.test import TestCase
+from django.contrib.auth.models import User
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from django.core.cache import cache
+from django.test import override_settings
+from django.core.management import call_command
+from io import StringIO
+import csv
+import json
+
+from .management.commands.explain_employee_filters import full_scans
+
+from .models import Employee, Department, Position, Status
+from .forms import EmployeeFilterForm
+from .instrumentation import registry
+
+# Session + user lookups for login_required, the revisions for the ETag,
+# then one query per table.
+DATABASE_QUERY_BUDGET = 7
+
+
+def create_employees(count, status=None, position=None, department=None):
+    '''
+    Helper function to create `count` employees sharing the same related objects.
+    '''
+    Employee.objects.bulk_create([
+        Employee(name=f'Employee {i}', address=f'{i} Main St', manager=(i % 5 == 0),
+                 status=status, position=position, department=department)
+        for i in range(count)
+    ])
+
+
+class DatabaseViewTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='tester', password='secret-pass-123')
+        self.client.login(username='tester', password='secret-pass-123')
+
+        self.status = Status.objects.create(em_status='normal')
+        self.position = Position.objects.create(name='Developer', salary=1000)
+        self.manager = Employee.objects.create(name='Boss', address='HQ', manager=True, status=self.status)
+        self.department = Department.objects.create(name='IT', manager=self.manager)
+
+    def count_queries(self, url='/database'):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def test_query_budget_does_not_grow_with_rows(self):
+        '''
+        The number of queries must stay the same when the tables grow.
+        '''
+        create_employees(3, self.status, self.position, self.department)
+        # Without the cached table fragments, every table is read
+        cache.clear()
+        small = self.count_queries()
+
+        create_employees(60, self.status, self.position, self.department)
+        for i in range(10):
+            Department.objects.create(name=f'Department {i}', manager=self.manager)
+        cache.clear()
+        large = self.count_queries()
+
+        self.assertEqual(small, large)
+        self.assertLessEqual(large, DATABASE_QUERY_BUDGET)
+
+    @override_settings(LISTING_PAGE_SIZE=10)
+    def test_keyset_pages(self):
+        '''
+        Following the next cursor walks through every employee exactly once.
+        '''
+        create_employees(24, self.status, self.position, self.department)
+
+        seen = []
+        url = '/database'
+        while True:
+            response = self.client.get(url)
+            page = response.context['all_employee']
+            self.assertLessEqual(len(page), 10)
+            seen.extend(employee.id for employee in page)
+            if not page.has_next:
+                break
+            url = f'/database?{page.next_query}'
+
+        self.assertEqual(seen, list(Employee.objects.order_by('id').values_list('id', flat=True)))
+
+    @override_settings(LISTING_PAGE_SIZE=10)
+    def test_previous_page(self):
+        '''
+        The previous cursor returns the page before the current one.
+        '''
+        create_employees(24, self.status, self.position, self.department)
+        ids = list(Employee.objects.order_by('id').values_list('id', flat=True))
+
+        response = self.client.get(f'/database?employee_after={ids[19]}')
+        page = response.context['all_employee']
+        self.assertEqual([employee.id for employee in page], ids[20:])
+
+        response = self.client.get(f'/database?{page.previous_query}')
+        page = response.context['all_employee']
+        self.assertEqual([employee.id for employee in page], ids[10:20])
+
+
+    def test_not_modified_until_a_table_changes(self):
+        response = self.client.get('/database')
+        etag = response['ETag']
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/database', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        # Session, user and revisions, no table is read
+        self.assertEqual(len(context.captured_queries), 3)
+
+        Status.objects.create(em_status='resigned')
+        response = self.client.get('/database', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_tables_are_cached_fragments(self):
+        '''
+        Rendering the page again only reads the tables whose models changed.
+        '''
+        self.client.get('/database')
+        # Session, user and revisions, the tables come from the fragment cache
+        self.assertEqual(self.count_queries(), 3)
+
+        Status.objects.create(em_status='resigned')
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/database')
+        self.assertContains(response, 'resigned')
+        tables = {query['sql'].split(' FROM ')[1].split()[0].strip('"') for query in context.captured_queries if ' FROM ' in query['sql']}
+        # Status is shown in the employee and status tables
+        self.assertIn('employeemanagement_apk_status', tables)
+        self.assertIn('employeemanagement_apk_employee', tables)
+        self.assertNotIn('employeemanagement_apk_position', tables)
+        self.assertNotIn('employeemanagement_apk_department', tables)
+
+
+class FilterIndexTests(TestCase):
+
+    def test_every_filter_combination_uses_an_index(self):
+        '''
+        explain_employee_filters raises CommandError when a combination falls back to a full scan.
+        '''
+        out = StringIO()
+        call_command('explain_employee_filters', stdout=out)
+        self.assertNotIn('FULL SCAN', out.getvalue())
+
+    def test_full_scan_detection(self):
+        plan = '7 0 0 SCAN employeemanagement_apk_employee\n11 0 0 SEARCH employeemanagement_apk_status USING INTEGER PRIMARY KEY (rowid=?)'
+        self.assertEqual(len(full_scans(plan)), 1)
+        self.assertEqual(full_scans('6 0 0 SCAN employeemanagement_apk_employee USING INDEX employee_manager'), [])
+        self.assertEqual(len(full_scans('6 0 0 SCAN employeemanagement_apk_employee USING COVERING INDEX employee_department_status')), 1)
+
+
+class ExportTests(TestCase):
+
+    def setUp(self):
+        User.objects.create_user(username='tester', password='secret-pass-123')
+        self.client.login(username='tester', password='secret-pass-123')
+
+        self.status = Status.objects.create(em_status='normal')
+        self.position = Position.objects.create(name='Developer', salary=1000)
+        self.manager = Employee.objects.create(name='Boss', address='HQ', manager=True, status=self.status)
+        self.department = Department.objects.create(name='IT', manager=self.manager)
+        create_employees(5, self.status, self.position, self.department)
+
+    def test_export_csv(self):
+        response = self.client.get('/export/employees?format=csv')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        rows = list(csv.DictReader(b''.join(response.streaming_content).decode().splitlines()))
+        self.assertEqual(len(rows), 6)
+        self.assertEqual(rows[1]['department'], 'IT')
+        self.assertEqual(rows[1]['department_manager'], 'Boss')
+        self.assertEqual(rows[1]['salary'], '1000')
+
+    def test_export_ndjson_with_filters(self):
+        response = self.client.get(f'/export/employees?format=ndjson&department={self.department.id}')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(rows[0]['status'], 'normal')
+
+    @override_settings(SEARCH_RESULT_LIMIT=2)
+    def test_export_search(self):
+        for i in range(3):
+            Employee.objects.create(name=f'Zed Searchable {i}', address='Elm St', status=self.status)
+        response = self.client.get('/export/employees?format=ndjson&search=searchable')
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        # Not cut to the listing's result limit
+        self.assertEqual([row['name'] for row in rows], ['Zed Searchable 0', 'Zed Searchable 1', 'Zed Searchable 2'])
+
+    def test_unknown_format(self):
+        response = self.client.get('/export/employees?format=<script>alert(1)</script>')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response['Content-Type'], 'text/plain')
+        self.assertNotIn(b'<script>', response.content)
+        self.assertIn(b'csv, ndjson', response.content)
+
+    def test_export_command(self):
+        out = StringIO()
+        call_command('export_employees', '--format', 'ndjson', '--chunk-size', '2', stdout=out)
+        self.assertEqual(len(out.getvalue().splitlines()), 6)
+
+
+class LookupFormTests(TestCase):
+
+    def setUp(self):
+        User.objects.create_user(username='tester', password='secret-pass-123')
+        self.client.login(username='tester', password='secret-pass-123')
+        self.status = Status.objects.create(em_status='normal')
+        self.position = Position.objects.create(name='Developer', salary=1000)
+        self.department = Department.objects.create(name='IT')
+
+    def test_choices_come_from_the_lookup_cache(self):
+        self.client.get('/create/employee/')
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/create/employee/')
+        self.assertContains(response, 'Developer')
+        # Session, user and the revisions of the three lookup tables
+        self.assertEqual(len(context.captured_queries), 3)
+
+        Status.objects.create(em_status='resigned')
+        self.assertContains(self.client.get('/create/employee/'), 'resigned')
+
+    def test_invalid_choice(self):
+        form = EmployeeFilterForm({'status': 9999, 'position': self.position.id})
+        self.assertFalse(form.is_valid())
+        self.assertIn('status', form.errors)
+        form = EmployeeFilterForm({'status': self.status.id, 'position': self.position.id})
+        self.assertTrue(form.is_valid())
+        self.assertEqual(form.cleaned_data['position'], self.position)
+
+
+class InstrumentationTests(TestCase):
+
+    def setUp(self):
+        User.objects.create_user(username='tester', password='secret-pass-123')
+        self.client.login(username='tester', password='secret-pass-123')
+        Status.objects.create(em_status='normal')
+        create_employees(3)
+        registry.clear()
+
+    def test_requests_are_measured_per_view(self):
+        response = self.client.get('/database')
+        self.assertIn('tpl;dur=', response['Server-Timing'])
+        self.client.get('/export/employees?format=csv').getvalue()
+
+        report = registry.report()
+        database = report['GET database']
+        self.assertEqual(database['requests'], 1)
+        self.assertGreaterEqual(database['max_queries'], 3)
+        self.assertGreater(database['avg_template_ms'], 0)
+        self.assertEqual(database['avg_response_bytes'], len(response.content))
+        # Streamed responses are measured until their last chunk
+        self.assertGreater(report['GET export_employees']['avg_response_bytes'], 0)
+
+    def test_prometheus_endpoint(self):
+        self.client.get('/database')
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        text = response.content.decode()
+        self.assertIn('http_requests_total{view="database",method="GET",status="200"} 1', text)
+        self.assertIn('http_request_duration_seconds_count{view="database",method="GET"} 1', text)
+        self.assertIn('# TYPE http_request_db_queries_total counter', text)
+
+        self.client.logout()
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.0.0.1').status_code, 403)
+
+    @override_settings(SLOW_REQUEST_QUERIES=1)
+    def test_slow_requests_are_logged(self):
+        with self.assertLogs('employeemanagement_apk.requests', 'WARNING') as logs:
+            self.client.get('/database')
+        line = json.loads(logs.records[0].getMessage())
+        self.assertEqual((line['event'], line['view'], line['status']), ('slow_request', 'database', 200))
+        self.assertGreaterEqual(line['queries'], 3)
@@ -0,0 +1,124 @@
+import threading
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TransactionTestCase, override_settings
+from rest_framework.test import APIClient
+
+from . import writes
+from .imports import EmployeeImporter
+from .models import Employee, Status
+from .writes import WriteQueue
+
+
+def create_status(name, started=None):
+    if started is not None:
+        started.wait(5)
+    return Status.objects.create(em_status=name).pk
+
+
+class WriteQueueTests(TransactionTestCase):
+
+    def setUp(self):
+        self.queue = WriteQueue()
+
+    def tearDown(self):
+        self.queue.stop()
+
+    def test_writes_are_committed_together(self):
+        started = threading.Event()
+        # The first write blocks the writer until the others are queued
+        futures = [self.queue.submit(create_status, 'status 0', started)]
+        futures += [self.queue.submit(create_status, f'status {index}') for index in range(1, 5)]
+        started.set()
+
+        pks = [future.result(5) for future in futures]
+        self.assertEqual(set(Status.objects.values_list('pk', flat=True)), set(pks))
+        self.assertEqual(self.queue.writes, 5)
+        self.assertLessEqual(self.queue.batches, 2)
+
+    def test_failing_write_does_not_undo_the_batch(self):
+        def fail():
+            Status.objects.create(em_status='rolled back')
+            raise ValueError('invalid')
+
+        started = threading.Event()
+        first = self.queue.submit(create_status, 'first', started)
+        failing = self.queue.submit(fail)
+        last = self.queue.submit(create_status, 'last')
+        started.set()
+
+        first.result(5)
+        last.result(5)
+        with self.assertRaises(ValueError):
+            failing.result(5)
+        self.assertEqual(sorted(Status.objects.values_list('em_status', flat=True)), ['first', 'last'])
+
+
+@override_settings(WRITE_COALESCING=True, IMAGE_WORKERS=0)
+class WriteCoalescingTests(TransactionTestCase):
+
+    def tearDown(self):
+        writes.stop()
+
+    def test_views_write_through_the_writer(self):
+        client = APIClient()
+        client.force_login(User.objects.create_superuser(username='admin', password='secret-pass-123'))
+        before = writes.get_stats()['writes']
+
+        response = client.post('/api/statuses/', {'em_status': 'normal'}, format='json')
+        self.assertEqual(response.status_code, 201)
+        response = client.patch(f'/api/statuses/{response.data["id"]}/', {'em_status': 'resigned'}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(writes.get_stats()['writes'], before + 2)
+        self.assertEqual(list(Status.objects.values_list('em_status', flat=True)), ['resigned'])
+
+    def test_import_batches_go_through_the_writer(self):
+        Status.objects.create(em_status='normal')
+        lines = ['name,address,status\n'] + [f'Employee {i},Street {i},normal\n' for i in range(5)]
+        before = writes.get_stats()['writes']
+        result = EmployeeImporter(batch_size=2).run(lines)
+        self.assertEqual(result.created, 5)
+        # One write per batch of 2
+        self.assertEqual(writes.get_stats()['writes'], before + 3)
+
+        response = APIClient().post('/api/employees/import/', {
+            'file': SimpleUploadedFile('employees.csv', ''.join(lines).encode(), content_type='text/csv'),
+        }, format='multipart')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(writes.get_stats()['writes'], before + 4)
+        self.assertEqual(Employee.objects.count(), 10)
+
+    def test_writes_in_a_transaction_run_inline(self):
+        before = writes.get_stats()['writes']
+        with transaction.atomic():
+            # The writer thread would not see this transaction's rows
+            pk = writes.run(create_status, 'inline')
+            self.assertTrue(Status.objects.filter(pk=pk).exists())
+        self.assertEqual(writes.get_stats()['writes'], before)
+
+    @override_settings(WRITE_TIMEOUT=0.2)
+    def test_timed_out_writes(self):
+        release = threading.Event()
+
+        def slow_write():
+            release.wait(5)
+            return create_status('slow')
+
+        # Already running when the caller gives up: it still commits
+        with self.assertRaises(writes.WriteTimeout) as context:
+            writes.run(slow_write)
+        self.assertIsNone(context.exception.written)
+
+        # Still queued behind it: cancelled, the client is told to retry
+        client = APIClient()
+        client.force_login(User.objects.create_superuser(username='admin', password='secret-pass-123'))
+        response = client.post('/api/statuses/', {'em_status': 'queued'}, format='json')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+
+        release.set()
+        writes.stop()
+        self.assertEqual(list(Status.objects.values_list('em_status', flat=True)), ['slow'])
@@ -1,15 +1,16 @@
 from django.urls import path
-from employeemanagement_apk import views
+from employeemanagement_apk import views, async_views
 
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from employeemanagement_apk.views import EmployeeViewSet, PositionViewSet, DepartmentViewSet
+from employeemanagement_apk.views import EmployeeViewSet, PositionViewSet, DepartmentViewSet, StatusViewSet
 
 # Create a router and register our viewsets with it
 router = DefaultRouter()
 router.register(r'employees', EmployeeViewSet)
 router.register(r'positions', PositionViewSet)
 router.register(r'departments', DepartmentViewSet)
+router.register(r'statuses', StatusViewSet)
 
 urlpatterns = [
     # Default URLs
@@ -42,14 +43,32 @@ urlpatterns = [
     
     # Employee Query URLs
     path('employee_query', views.employee_query, name='employee_query'),
+    path('async/employee_query', async_views.employee_query, name='async_employee_query'),
     
+    # Export URLs
+    path('export/employees', views.export_employees, name='export_employees'),
+    
+    # Instrumentation (see instrumentation.py)
+    path('metrics', views.metrics, name='metrics'),
+
     # REST API URLs
+    path('api/cache-stats/', views.cache_stats, name='cache_stats'),
+    path('api/reports/employees/', views.employee_report, name='employee_report'),
+    path('api/lookups/', views.lookup_tables, name='lookup_tables'),
+    path('api/request-stats/', views.request_stats, name='request_stats'),
+    # Async views for ASGI servers (see async_views.py)
+    path('api/async/employees/', async_views.employee_list, name='async_employee_list'),
+    path('api/async/employees/<int:pk>/', async_views.employee_detail, name='async_employee_detail'),
+    path('api/async/lookups/', async_views.lookup_tables, name='async_lookup_tables'),
     path('api/', include(router.urls)),
 ]
 
 from django.conf import settings
-from django.conf.urls.static import static
+from django.urls import re_path
+import re
 
 # Add Media URL for development
 if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
+    urlpatterns += [
+        re_path(r'^%s(?P<path>.*)$' % re.escape(settings.MEDIA_URL.lstrip('/')), views.serve_media, name='media'),
+    ]
\ No newline at end of file
@@ -10,11 +10,19 @@ from django.contrib.auth.forms import UserCreationForm , AuthenticationForm
 from django.contrib.auth.decorators import login_required
 
 from employeemanagement_apk.forms import RigisterFormCustom
+from employeemanagement_apk.listing import paginate_listing, KeysetPage
+from employeemanagement_apk.conditional import listing_condition, request_revisions, revision_key, ConditionalGetMixin
+from employeemanagement_apk.replicas import replica_reads, reading_from_replica
+from django.views.decorators.http import condition
 
 
 # Import the models
 from employeemanagement_apk.models import Employee, Status, Department, Position
 
+# ETag / Last-Modified of the pages listing these models, 304 while none of them changed
+LISTING_MODELS = (Employee, Status, Department, Position)
+listing_etag, listing_last_modified = listing_condition(*LISTING_MODELS)
+
 # Create your views here.
 def index(request):
     return render(request, 'index.html')
@@ -22,13 +30,23 @@ def index(request):
 def about(request):
     return render(request, 'about.html')
 
+# The listings are read from a replica (see replicas.py), their ETags too
 @login_required(login_url='index')
+@replica_reads
+@condition(etag_func=listing_etag, last_modified_func=listing_last_modified)
 def database(request):
-    all_employee = Employee.objects.all()
-    all_status = Status.objects.all()
-    all_department = Department.objects.all()
-    all_position = Position.objects.all()
-    return render(request, 'database.html', {'all_employee': all_employee, 'all_status': all_status, 'all_department': all_department, 'all_position': all_position})
+    # Each table is keyset paginated on its own and the related objects used by
+    # the template are joined in, so a page costs one query per table.
+    all_employee = paginate_listing(request, Employee.objects.select_related('status', 'position', 'department'), 'employee')
+    all_status = paginate_listing(request, Status.objects.all(), 'status')
+    all_department = paginate_listing(request, Department.objects.select_related('manager'), 'department')
+    all_position = paginate_listing(request, Position.objects.all(), 'position')
+    # The tables are cached template fragments keyed on these, a cached table skips its query
+    revisions = {model._meta.model_name: revision_key(*revision) for model, revision in request_revisions(request, LISTING_MODELS).items()}
+    return render(request, 'database.html', {
+        'all_employee': all_employee, 'all_status': all_status, 'all_department': all_department, 'all_position': all_position,
+        'revisions': revisions, 'fragment_timeout': getattr(settings, 'TEMPLATE_FRAGMENT_TIMEOUT', 300),
+    })
 
 '''
 
@@ -90,13 +108,15 @@ Form Handling Functions
 
 '''
 from employeemanagement_apk.forms import DepartmentForm, PositionForm, StatusForm, EmployeeForm
+from employeemanagement_apk import writes
 
 def handle_form(request, form_class, instance=None, success_message='', redirect_url='database'):
     redirect_obj = None  # Initialize redirect_obj
     form = form_class(request.POST or None, request.FILES or None, instance=instance)
 
     if request.method == 'POST' and form.is_valid():
-        form.save()
+        # Run by the writer thread with WRITE_COALESCING (see writes.py)
+        writes.run(form.save)
         messages.success(request, success_message)
         redirect_obj = redirect(redirect_url)
 
@@ -108,15 +128,16 @@ def create_employee(request):
     if request.method == 'POST':
         form = EmployeeForm(request.POST, request.FILES)
         if form.is_valid():
-            form.save()
+            writes.run(form.save)
             messages.success(request, 'Employee created successfully.')
             return redirect('database')
     else:
         form = EmployeeForm()
-        
-    statuses = Status.objects.all()
-    positions = Position.objects.all()
-    departments = Department.objects.all()
+
+    # Rows of the lookup table cache the form has loaded
+    statuses = form.fields['status'].get_rows()
+    positions = form.fields['position'].get_rows()
+    departments = form.fields['department'].get_rows()
 
     return render(request, 'model/employee_create.html', {
         'form': form,
@@ -129,14 +150,13 @@ def create_employee(request):
 def update_employee(request, employee_id):
     employee = get_object_or_404(Employee, pk=employee_id)
     form, redirect_obj = handle_form(request, EmployeeForm, instance=employee, success_message='Employee updated successfully.')
-    print(f'Redirect Object: {redirect_obj}')
     if redirect_obj:
         return redirect_obj
     else:
-        # Pass the necessary context variables  
-        statuses = Status.objects.all()  # Fetch all statuses
-        positions = Position.objects.all()  # Fetch all positions
-        departments = Department.objects.all()  # Fetch all departments
+        # Pass the necessary context variables (from the lookup table cache the form has loaded)
+        statuses = form.fields['status'].get_rows()
+        positions = form.fields['position'].get_rows()
+        departments = form.fields['department'].get_rows()
 
         return render(request, 'model/employee_update.html', {
             'form': form,
@@ -148,7 +168,7 @@ def update_employee(request, employee_id):
 @login_required(login_url='index')
 def delete_employee(request, employee_id):
     employee = get_object_or_404(Employee, pk=employee_id)
-    employee.delete()
+    writes.run(employee.delete)
     messages.success(request, 'Employee deleted successfully.')
     return redirect('database')
 
@@ -173,7 +193,7 @@ def update_department(request, department_id):
 @login_required(login_url='index')
 def delete_department(request, department_id):
     department = Department.objects.get(pk=department_id)
-    department.delete()
+    writes.run(department.delete)
     messages.success(request, 'Department deleted successfully.')
     return redirect('database')
 
@@ -198,7 +218,7 @@ def update_position(request, position_id):
 @login_required(login_url='index')
 def delete_position(request, position_id):
     position = Position.objects.get(pk=position_id)
-    position.delete()
+    writes.run(position.delete)
     messages.success(request, 'Position deleted successfully.')
     return redirect('database')
 
@@ -223,7 +243,7 @@ def update_status(request, status_id):
 @login_required(login_url='index')
 def delete_status(request, status_id):
     status = Status.objects.get(pk=status_id)
-    status.delete()
+    writes.run(status.delete)
     messages.success(request, 'Status deleted successfully.')
     return redirect('database')
 
@@ -234,11 +254,10 @@ Employee Query Functions
 '''
 # Employee Query URLs
 from .forms import EmployeeFilterForm
+from employeemanagement_apk.search import search_employees, filter_matches
 
-def employee_query(request):
-    form = EmployeeFilterForm(request.GET or None)
-    employees = Employee.objects.all()
-
+def filter_employees(form, employees):
+    # Apply the position, department and status filters of a valid EmployeeFilterForm
     if form.is_valid():
         if form.cleaned_data['position']:
             employees = employees.filter(position=form.cleaned_data['position'])
@@ -246,8 +265,20 @@ def employee_query(request):
             employees = employees.filter(department=form.cleaned_data['department'])
         if form.cleaned_data['status']:
             employees = employees.filter(status=form.cleaned_data['status'])
-        if form.cleaned_data['search']:
-            employees = employees.filter(name__icontains=form.cleaned_data['search'])
+    return employees
+
+@replica_reads
+@condition(etag_func=listing_etag, last_modified_func=listing_last_modified)
+def employee_query(request):
+    form = EmployeeFilterForm(request.GET or None)
+    employees = filter_employees(form, Employee.objects.select_related('status', 'position', 'department'))
+    search_term = form.cleaned_data['search'] if form.is_valid() else ''
+
+    if search_term:
+        # Ranked results from the search index, best matches first
+        employees = KeysetPage(list(search_employees(employees, search_term)))
+    else:
+        employees = paginate_listing(request, employees, 'employee')
 
     context = {
         'form': form,
@@ -257,6 +288,49 @@ def employee_query(request):
 
 '''
 
+Export Functions
+
+'''
+from django.http import StreamingHttpResponse
+from employeemanagement_apk.exports import stream_export, EXPORT_FORMATS
+
+@login_required(login_url='index')
+def export_employees(request):
+    # Stream the employees (optionally filtered and searched like employee_query) as CSV or NDJSON
+    export_format = request.GET.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        # The requested format is not echoed back
+        return HttpResponse(f'Unknown export format, expected one of {", ".join(EXPORT_FORMATS)}.', status=400, content_type='text/plain')
+
+    form = EmployeeFilterForm(request.GET or None)
+    employees = filter_employees(form, Employee.objects.all())
+    search_term = form.cleaned_data['search'] if form.is_valid() else ''
+    if search_term:
+        # Every match, not only the SEARCH_RESULT_LIMIT best ones employee_query lists, in id order
+        employees = filter_matches(employees, search_term)
+    response = StreamingHttpResponse(stream_export(export_format, employees), content_type=EXPORT_FORMATS[export_format])
+    response['Content-Disposition'] = f'attachment; filename="employees.{export_format}"'
+    return response
+
+'''
+
+Media Functions
+
+'''
+from django.conf import settings
+from django.views.static import serve
+from employeemanagement_apk.storage import is_content_addressed, IMMUTABLE_CACHE_CONTROL
+
+def serve_media(request, path):
+    # Development server for MEDIA_ROOT. Content addressed files never change,
+    # browsers may keep them for a year (configure the same for the production web server).
+    response = serve(request, path, document_root=settings.MEDIA_ROOT)
+    if is_content_addressed(path):
+        response['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    return response
+
+'''
+
 REST API Functions
 
 '''
@@ -264,18 +338,52 @@ from rest_framework import viewsets
 from rest_framework.response import Response
 from rest_framework.decorators import action
 from employeemanagement_apk.serializers import EmployeeSerializer, PositionSerializer, DepartmentSerializer, StatusSerializer
-from rest_framework.decorators import api_view
+from rest_framework.decorators import api_view, permission_classes
 from rest_framework import status
 
 from rest_framework.parsers import MultiPartParser, FormParser
-
-class BaseViewSet(viewsets.ModelViewSet):
+from rest_framework.filters import OrderingFilter
+from employeemanagement_apk.pagination import KeysetCursorPagination, SubtreeCursorPagination
+from employeemanagement_apk.bulk import BulkModelMixin
+from employeemanagement_apk.imports import EmployeeImporter, CSVImportError
+from employeemanagement_apk.caching import CachedResponseMixin, get_stats
+from employeemanagement_apk.signals import CACHED_MODELS
+from rest_framework.permissions import IsAdminUser
+from employeemanagement_apk import reports, hierarchy
+from employeemanagement_apk.expansion import expand_queryset, expanded_models
+from employeemanagement_apk import lookups
+from employeemanagement_apk.conditional import make_etag
+from django.utils.cache import get_conditional_response
+from django.core.exceptions import ValidationError
+from django.http import Http404
+import io
+
+class BaseViewSet(CachedResponseMixin, ConditionalGetMixin, BulkModelMixin, viewsets.ModelViewSet):
+    # List endpoints are cursor paginated, ?ordering= picks one of ordering_fields
+    pagination_class = KeysetCursorPagination
+    filter_backends = [OrderingFilter]
+    ordering_fields = ['id']
+    ordering = ['id']
+
+    def get_queryset(self):
+        # Relations inlined with ?expand= are joined, not queried per row
+        return expand_queryset(super().get_queryset(), self.get_serializer_class(), self.request)
+
+    def get_related_models(self):
+        return expanded_models(self.get_serializer_class(), self.queryset.model, self.request)
+
+    # Writes are run by the writer thread with WRITE_COALESCING (see writes.py)
+    def perform_create(self, serializer):
+        writes.run(serializer.save)
+
+    def perform_destroy(self, instance):
+        writes.run(instance.delete)
 
     def update(self, request, *args, **kwargs):
         instance = self.get_object()
         serializer = self.get_serializer(instance, data=request.data, partial=True)
         if serializer.is_valid():
-            serializer.save()
+            writes.run(serializer.save)
             return Response(serializer.data)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -283,17 +391,157 @@ class EmployeeViewSet(BaseViewSet):
     queryset = Employee.objects.all()
     serializer_class = EmployeeSerializer
     parser_classes = [MultiPartParser, FormParser]
+    ordering_fields = ['id', 'name']
+
+    def list(self, request, *args, **kwargs):
+        # Pages are read from a replica (see replicas.py)
+        with reading_from_replica():
+            return super().list(request, *args, **kwargs)
+
+    @action(detail=False, methods=['post'], url_path='import')
+    def import_csv(self, request):
+        # Import the CSV uploaded as "file", same columns as the import_employees command
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({'detail': 'Upload the CSV file as "file".'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            result = EmployeeImporter().run(io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline=''))
+        except (CSVImportError, UnicodeDecodeError) as error:
+            return Response({'detail': str(error)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(result.as_dict(), status=status.HTTP_201_CREATED if result.created else status.HTTP_200_OK)
+
+    @action(detail=True, methods=['get'], url_path='image-status')
+    def image_status(self, request, pk=None):
+        # Cheap endpoint to poll while the uploaded image is processed in the background
+        employee = self.get_object()
+        return Response({
+            'image_status': employee.image_status,
+            'image_error': employee.image_error,
+            'thumbnails': self.get_serializer().get_thumbnails(employee),
+        })
+
+    def bulk_update(self, request, *args, **kwargs):
+        # A batch may move employees under each other, such a cycle is only found when the moves are applied
+        try:
+            return super().bulk_update(request, *args, **kwargs)
+        except hierarchy.HierarchyError as error:
+            return self.bulk_error_response(str(error))
+
+    # Reporting hierarchy (see hierarchy.py), one query on the closure table at any depth, read from a replica
+    def get_hierarchy_pk(self, pk):
+        try:
+            return Employee._meta.pk.to_python(pk)
+        except ValidationError:
+            raise Http404
+
+    def with_depths(self, employees):
+        data = self.get_serializer(employees, many=True).data
+        for row, employee in zip(data, employees):
+            row['depth'] = employee.depth
+        return data
+
+    @action(detail=True, methods=['get'])
+    def subtree(self, request, pk=None):
+        # Everyone reporting to the employee, directly or not, cursor paginated in id order; ?max_depth=1 for the direct reports
+        pk = self.get_hierarchy_pk(pk)
+        max_depth = request.query_params.get('max_depth')
+        if max_depth is not None:
+            if not max_depth.isdigit() or int(max_depth) < 1:
+                return Response({'detail': 'max_depth must be a positive integer.'}, status=status.HTTP_400_BAD_REQUEST)
+            max_depth = int(max_depth)
+        paginator = SubtreeCursorPagination()
+        with reading_from_replica():
+            page = paginator.paginate_queryset(hierarchy.subtree(self.get_queryset(), pk, max_depth), request, view=self)
+            # An empty first page may be an unknown employee
+            if not page and paginator.cursor_query_param not in request.query_params and not Employee.objects.filter(pk=pk).exists():
+                raise Http404
+            return paginator.get_paginated_response(self.with_depths(page))
+
+    @action(detail=True, methods=['get'])
+    def ancestors(self, request, pk=None):
+        # The reporting line of the employee up to the top, the direct manager (depth 1) first
+        pk = self.get_hierarchy_pk(pk)
+        with reading_from_replica():
+            line = list(hierarchy.ancestors(self.get_queryset(), pk))
+        # The employee itself comes first, at depth 0
+        if not line:
+            raise Http404
+        return Response(self.with_depths(line[1:]))
+
+    @action(detail=True, methods=['get'], url_path='span-of-control')
+    def span_of_control(self, request, pk=None):
+        # Direct reports, total reports at any depth and levels below the employee
+        pk = self.get_hierarchy_pk(pk)
+        with reading_from_replica():
+            span = hierarchy.span_of_control(pk)
+        if span is None:
+            raise Http404
+        return Response({'id': pk, **span})
 
 class PositionViewSet(BaseViewSet):
     queryset = Position.objects.all()
     serializer_class = PositionSerializer
+    ordering_fields = ['id', 'name', 'salary']
 
 class DepartmentViewSet(BaseViewSet):
     queryset = Department.objects.all()
     serializer_class = DepartmentSerializer
+    ordering_fields = ['id', 'name']
     
 class StatusViewSet(BaseViewSet):
     queryset = Status.objects.all()
     serializer_class = StatusSerializer
+    ordering_fields = ['id', 'em_status']
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def cache_stats(request):
+    # Hit / miss counters of the API response cache per model
+    return Response(get_stats(CACHED_MODELS))
+
+@api_view(['GET'])
+@replica_reads
+def employee_report(request):
+    # Headcount and payroll, ?group_by=department,status,position (any combination), ?source=live skips the summary table
+    try:
+        group_by = reports.parse_group_by(request.query_params.get('group_by'))
+        report = reports.employee_report(group_by, source=request.query_params.get('source', 'summary'))
+    except reports.ReportError as error:
+        return Response({'detail': str(error)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(report)
+
+@api_view(['GET'])
+def lookup_tables(request):
+    # Status, position and department choices in one response, served from the lookup table cache
+    tables = lookups.get_tables([Status, Position, Department])
+    etag = make_etag('lookups', *(version for version, _, _ in tables.values()), request.accepted_renderer.format)
+    not_modified = get_conditional_response(request._request, etag=etag)
+    if not_modified is not None:
+        return not_modified
+    response = Response({
+        'statuses': StatusSerializer(tables[Status][1], many=True).data,
+        'positions': PositionSerializer(tables[Position][1], many=True).data,
+        'departments': DepartmentSerializer(tables[Department][1], many=True).data,
+    })
+    response['ETag'] = etag
+    return response
 
-    
\ No newline at end of file
+'''
+
+Metrics Functions
+
+'''
+from employeemanagement_apk import instrumentation
+
+def metrics(request):
+    # Prometheus scrape endpoint, for the hosts in METRICS_ALLOWED_IPS and staff users
+    allowed = request.META.get('REMOTE_ADDR') in getattr(settings, 'METRICS_ALLOWED_IPS', ['127.0.0.1', '::1'])
+    if not (allowed or request.user.is_staff):
+        return HttpResponse(status=403)
+    return HttpResponse(instrumentation.registry.prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def request_stats(request):
+    # Per view totals of the instrumentation middleware (this process)
+    return Response(instrumentation.registry.report())
@@ -0,0 +1,225 @@
+import atexit
+import math
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError
+
+from django.conf import settings
+from django.db import connections, transaction, DEFAULT_DB_ALIAS
+from django.http import HttpResponse
+
+'''
+
+Write coalescing (WRITE_COALESCING in the settings, off by default).
+
+SQLite has a single writer: workers writing at the same time wait for each
+other's lock and, after the busy timeout, fail with "database is locked".
+With coalescing on, the writes of the views (form saves, deletes, the API
+create / update / destroy and bulk endpoints, the batches of the CSV import)
+are handed to one writer thread per process:
+
+    writes.run(form.save)
+
+The writer takes every write waiting in its queue (up to WRITE_BATCH_SIZE,
+optionally waiting WRITE_BATCH_WAIT_MS for more), runs each in a savepoint
+of one transaction and commits them together, so many small writes cost one
+commit (one fsync). The caller waits for its own result or exception, which
+it gets once the batch is committed. A failing write only rolls back its
+savepoint; a failing commit fails every write of the batch.
+
+A caller that waited WRITE_TIMEOUT seconds gets WriteTimeout. If the writer
+had not started the write yet it is cancelled and never runs (written is
+False); if it had, it may still commit after the caller gave up (written is
+None). WriteTimeoutMiddleware answers both with a 503 and a Retry-After
+header, a client retrying a non-idempotent request (e.g. a bulk POST) after
+an unknown outcome should check what was written first.
+
+Writes from inside a transaction (atomic blocks, tests) run in the calling
+thread, the writer thread would not see their uncommitted rows. The queries
+of the writer thread are not counted by the instrumentation middleware.
+
+The benchmark_writes command compares both modes.
+
+
+'''
+
+DEFAULT_BATCH_SIZE = 100
+DEFAULT_BATCH_WAIT_MS = 0
+DEFAULT_TIMEOUT = 30
+
+
+def is_enabled():
+    return getattr(settings, 'WRITE_COALESCING', False)
+
+
+def get_batch_size():
+    return getattr(settings, 'WRITE_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+
+
+def get_batch_wait():
+    return getattr(settings, 'WRITE_BATCH_WAIT_MS', DEFAULT_BATCH_WAIT_MS) / 1000
+
+
+def get_timeout():
+    return getattr(settings, 'WRITE_TIMEOUT', DEFAULT_TIMEOUT)
+
+
+class WriteTimeout(Exception):
+
+    def __init__(self, written):
+        # False: cancelled before it started, None: started, may still be committed
+        self.written = written
+        if written is False:
+            message = 'The write was not started in time and was cancelled, it can be retried.'
+        else:
+            message = 'The write did not finish in time, it may still be committed.'
+        super().__init__(message)
+
+
+class WriteQueue:
+
+    def __init__(self, using=DEFAULT_DB_ALIAS):
+        self.using = using
+        self.lock = threading.Lock()
+        self.jobs = queue.Queue()
+        self.thread = None
+        self.pid = None
+        self.batches = 0
+        self.writes = 0
+
+    def submit(self, function, *args, **kwargs):
+        '''
+        Future of function(*args, **kwargs) run by the writer thread.
+        '''
+        self.start()
+        future = Future()
+        self.jobs.put((future, function, args, kwargs))
+        return future
+
+    def start(self):
+        with self.lock:
+            # A forked worker process does not have the parent's thread
+            if self.pid != os.getpid():
+                self.jobs = queue.Queue()
+                self.thread = None
+                self.pid = os.getpid()
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.work, name='write-coalescing', daemon=True)
+                self.thread.start()
+
+    def stop(self, timeout=None):
+        # Runs the writes already queued, then ends the thread
+        with self.lock:
+            thread = self.thread if self.pid == os.getpid() else None
+            self.thread = None
+        if thread is not None and thread.is_alive():
+            self.jobs.put(None)
+            thread.join(timeout)
+
+    def take_batch(self):
+        job = self.jobs.get()
+        if job is None:
+            return None
+        batch = [job]
+        wait = get_batch_wait()
+        deadline = time.monotonic() + wait
+        while len(batch) < get_batch_size():
+            try:
+                job = self.jobs.get(timeout=max(0, deadline - time.monotonic())) if wait else self.jobs.get_nowait()
+            except queue.Empty:
+                break
+            if job is None:
+                # Stop once this batch is written
+                self.jobs.put(None)
+                break
+            batch.append(job)
+        return batch
+
+    def work(self):
+        try:
+            while True:
+                batch = self.take_batch()
+                if batch is None:
+                    break
+                self.run_batch(batch)
+        finally:
+            connections.close_all()
+
+    def run_batch(self, batch):
+        connections[self.using].close_if_unusable_or_obsolete()
+        results = []
+        try:
+            with transaction.atomic(using=self.using):
+                for future, function, args, kwargs in batch:
+                    # False when the caller cancelled it (timed out), it cannot be cancelled from now on
+                    if not future.set_running_or_notify_cancel():
+                        continue
+                    try:
+                        with transaction.atomic(using=self.using):
+                            results.append((future, function(*args, **kwargs), None))
+                    except Exception as error:
+                        results.append((future, None, error))
+        except Exception as error:
+            # The commit failed, nothing of the batch was written
+            for future, _, _ in results:
+                future.set_exception(error)
+            return
+
+        self.batches += 1
+        self.writes += len(results)
+        for future, result, error in results:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+
+_queue = WriteQueue()
+atexit.register(_queue.stop)
+
+
+def run(function, *args, **kwargs):
+    '''
+    function(*args, **kwargs), in the writer thread when WRITE_COALESCING is on.
+    '''
+    if not is_enabled() or connections[_queue.using].in_atomic_block or threading.current_thread() is _queue.thread:
+        return function(*args, **kwargs)
+    future = _queue.submit(function, *args, **kwargs)
+    try:
+        return future.result(timeout=get_timeout())
+    except TimeoutError:
+        if future.cancel():
+            raise WriteTimeout(written=False)
+        if future.done():
+            # Finished in the meantime
+            return future.result()
+        raise WriteTimeout(written=None)
+
+
+def stop():
+    _queue.stop()
+
+
+def get_stats():
+    return {'batches': _queue.batches, 'writes': _queue.writes}
+
+
+class WriteTimeoutMiddleware:
+    '''
+    503 Service Unavailable with Retry-After for the requests whose write timed out (WriteTimeout).
+    '''
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_exception(self, request, exception):
+        if not isinstance(exception, WriteTimeout):
+            return None
+        response = HttpResponse(str(exception), status=503, content_type='text/plain')
+        response['Retry-After'] = str(max(1, math.ceil(get_timeout())))
+        return response
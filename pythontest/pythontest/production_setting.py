@@ -37,6 +37,12 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so it measures everything below (see employeemanagement_apk/instrumentation.py)
+    'employeemanagement_apk.instrumentation.InstrumentationMiddleware',
+    # Pins clients that wrote to the primary database (see employeemanagement_apk/replicas.py)
+    'employeemanagement_apk.replicas.ReplicaMiddleware',
+    # 503 + Retry-After when a write handed to the writer thread times out (see employeemanagement_apk/writes.py)
+    'employeemanagement_apk.writes.WriteTimeoutMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -50,9 +56,9 @@ ROOT_URLCONF = 'pythontest.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates timing the renders for the instrumentation middleware
+        'BACKEND': 'employeemanagement_apk.instrumentation.InstrumentedTemplates',
         'DIRS': [],
-        'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
                 'django.template.context_processors.debug',
@@ -60,6 +66,13 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
             ],
+            # Templates are compiled once per process and kept in memory
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
         },
     },
 ]
@@ -112,6 +125,102 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'  # or os.path.join(BASE_DIR, 'media')
 
+# REST framework
+# List endpoints use cursor pagination, clients can ask for up to 500 rows with ?page_size=
+REST_FRAMEWORK = {
+    'DEFAULT_PAGINATION_CLASS': 'employeemanagement_apk.pagination.KeysetCursorPagination',
+    'PAGE_SIZE': 50,
+}
+# Relations ?expand= may follow in a row (e.g. department.manager is 2)
+API_EXPAND_MAX_DEPTH = 3
+
+# Page size of the keyset paginated HTML listings (e.g. /database)
+LISTING_PAGE_SIZE = 25
+
+# Background image processing (employeemanagement_apk/tasks.py), 0 runs it synchronously.
+# The Pillow work runs on IMAGE_PROCESSES worker processes, 0 runs it in the worker thread.
+IMAGE_WORKERS = 2
+IMAGE_PROCESSES = 2
+IMAGE_MAX_DIMENSION = 2048
+# Unused image files are deleted by gc_images once unused for this many seconds
+IMAGE_GC_GRACE_PERIOD = 60 * 60
+
+# Cache backends for the REST API response cache (employeemanagement_apk/caching.py),
+# the 'api' cache below picks one. The file and database caches are shared by
+# every process, the database one needs `python manage.py createcachetable`.
+API_CACHE_BACKENDS = {
+    'locmem': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'api',
+        'TIMEOUT': 300,
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+    'file': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache' / 'api',
+        'TIMEOUT': 300,
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+    'db': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'api_cache',
+        'TIMEOUT': 300,
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
+API_CACHE = 'api'  # None disables the API response cache
+
+# Requests slower than this or running more queries are logged (employeemanagement_apk.requests logger)
+SLOW_REQUEST_MS = 500
+SLOW_REQUEST_QUERIES = 50
+# Hosts allowed to scrape /metrics without a staff login
+METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']
+
+# SQLite tuning (employeemanagement_apk/sqlite.py): the PRAGMAs of the profile
+# picked by SQLITE_PROFILE are run on every new connection, None runs none.
+SQLITE_PROFILES = {
+    # SQLite's own defaults: rollback journal, synchronous=FULL, 2 MB page cache
+    'default': {},
+    'tuned': {
+        # Readers never block the writer and the writer never blocks readers
+        'journal_mode': 'WAL',
+        # Safe with WAL: a power loss can only lose the last transactions, not corrupt the file
+        'synchronous': 'NORMAL',
+        # Milliseconds to wait for the write lock before "database is locked"
+        'busy_timeout': 5000,
+        # Page cache per connection, negative values are KiB
+        'cache_size': -64000,
+        # Read the file through a memory map of up to this many bytes
+        'mmap_size': 256 * 1024 * 1024,
+        # Temporary tables and indexes (sorts, DISTINCT) stay in memory
+        'temp_store': 'MEMORY',
+    },
+}
+
+# Write coalescing (employeemanagement_apk/writes.py): the writes of the views are
+# handed to one writer thread per process, which commits up to WRITE_BATCH_SIZE of
+# them in one transaction. It waits WRITE_BATCH_WAIT_MS for more writes after the
+# first, a request gives up waiting for its write after WRITE_TIMEOUT seconds.
+WRITE_COALESCING = False
+WRITE_BATCH_SIZE = 100
+WRITE_BATCH_WAIT_MS = 0
+WRITE_TIMEOUT = 30
+
+# Read replicas (employeemanagement_apk/replicas.py): aliases of DATABASES holding copies
+# of 'default'. The listing and report views read from a replica whose heartbeat is at
+# most REPLICA_MAX_LAG_SECONDS old (checked every REPLICA_CHECK_SECONDS), a client that
+# wrote reads from 'default' for REPLICA_PIN_SECONDS. SQLite replicas are refreshed with
+# the refresh_replicas command, e.g. DATABASE_REPLICAS = ['replica'].
+DATABASE_REPLICAS = []
+DATABASE_ROUTERS = ['employeemanagement_apk.replicas.ReplicaRouter']
+REPLICA_PIN_SECONDS = 5
+REPLICA_MAX_LAG_SECONDS = 30
+REPLICA_CHECK_SECONDS = 1
+
+# Seconds the tables of the database page stay in the template fragment cache
+# ('default' cache), they are keyed on the model revisions so a change is seen at once
+TEMPLATE_FRAGMENT_TIMEOUT = 5 * 60
+
 
 '''
 
@@ -126,6 +235,12 @@ Different settings for production
 # Debug settings for production
 DEBUG = False
 
+# Shared by the worker processes
+CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'api': API_CACHE_BACKENDS['file'],
+}
+
 # Security settings for production
 SECURE_SSL_REDIRECT = True
 SESSION_COOKIE_SECURE = True
@@ -133,9 +248,28 @@ CSRF_COOKIE_SECURE = True
 
 ALLOWED_HOSTS = []
 
+SQLITE_PROFILE = 'tuned'
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / "db.sqlite3",
-    }
+        # Each worker keeps its connection (and its page cache) between requests,
+        # checked before it is reused
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            # Writers take the lock at BEGIN and wait for it (busy_timeout); a deferred
+            # transaction upgrading its read lock fails at once with "database is locked"
+            'transaction_mode': 'IMMEDIATE',
+        },
+    },
+    # A copy of 'default' for the listing reads, refreshed with the refresh_replicas
+    # command, used once listed in DATABASE_REPLICAS
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / "db.replica.sqlite3",
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+    },
 }
\ No newline at end of file